@@ -0,0 +1,114 @@
+""" Бенчмарк накладных расходов @strict на вызов.
+    Сравнивает функцию без декоратора, прежнюю реализацию (разбор аннотаций на каждом вызове)
+    и текущую, а также время "импорта" модуля при обертке каждой функции сразу и лениво через strict(module).
+    Запуск из папки solution: python benchmark.py
+"""
+
+import argparse
+import time
+import timeit
+import types
+
+from solution import strict
+
+
+def strict_legacy(func):
+    """ Реализация @strict до построения плана проверки - для сравнения """
+
+    def wrapper(*args, **kwargs):
+        annotations = func.__annotations__
+        arg_names = func.__code__.co_varnames[:func.__code__.co_argcount]
+        for index, arg_name in enumerate(arg_names):
+            if arg_name in annotations:
+
+                expected_type = annotations[arg_name]
+
+                if index < len(args):
+                    value = args[index]
+                else:
+                    value = kwargs.get(arg_name)
+
+                if not isinstance(value, expected_type):
+                    raise TypeError(f'Переданный параметр "{arg_name}" не соответствует аннотации')
+            else:
+                raise TypeError(f'У переданного параметра "{arg_name}" нет типа')
+        return func(*args, **kwargs)
+    return wrapper
+
+
+def sum_three(a: int, b: int, c: float) -> float:
+    return a + b + c
+
+
+VARIANTS = {
+    'без декоратора': sum_three,
+    'strict_legacy': strict_legacy(sum_three),
+    'strict': strict(sum_three),
+}
+
+
+def benchmark(number: int = 200000, repeat: int = 5) -> dict:
+    """ Лучшее время одного вызова (в наносекундах) для каждого варианта """
+
+    results = {}
+    for name, func in VARIANTS.items():
+        best = min(timeit.repeat(lambda: func(1, 2, 3.0), number=number, repeat=repeat))
+        results[name] = best / number * 1e9
+    return results
+
+
+def make_module_source(functions: int) -> str:
+    """ Исходный код модуля с functions аннотированными функциями """
+
+    return '\n'.join(f'def func_{index}(a: int, b: list[str], c: dict[str, float] | None) -> int:\n    return a\n'
+                     for index in range(functions))
+
+
+def load_module(source: str, decorate: str):
+    """ Выполняет исходный код как новый модуль. decorate: none, eager (strict на каждой функции) или lazy """
+
+    module = types.ModuleType('bench_service')
+    exec(source, vars(module))
+    if decorate == 'eager':
+        for name, attribute in list(vars(module).items()):
+            if name.startswith('func_'):
+                setattr(module, name, strict(attribute))
+    elif decorate == 'lazy':
+        strict(module)
+    return module
+
+
+def startup_benchmark(functions: int = 500, repeat: int = 5) -> dict:
+    """ Лучшее время загрузки модуля (в миллисекундах) без strict, с обычной и с ленивой оберткой """
+
+    source = make_module_source(functions)
+    results = {}
+    for decorate in ('none', 'eager', 'lazy'):
+        best = float('inf')
+        for _ in range(repeat):
+            started = time.perf_counter()
+            load_module(source, decorate)
+            best = min(best, time.perf_counter() - started)
+        results[decorate] = best * 1000
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Бенчмарк накладных расходов @strict')
+    parser.add_argument('--number', type=int, default=200000)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--functions', type=int, default=500, help='количество функций в модуле для замера импорта')
+    args = parser.parse_args()
+
+    results = benchmark(args.number, args.repeat)
+    baseline = results['без декоратора']
+    for name, nanoseconds in results.items():
+        print(f'{name:>16}: {nanoseconds:8.1f} нс на вызов (x{nanoseconds / baseline:.2f})')
+
+    print(f'Загрузка модуля из {args.functions} функций:')
+    for decorate, milliseconds in startup_benchmark(args.functions, args.repeat).items():
+        print(f'{decorate:>16}: {milliseconds:8.2f} мс')
+
+
+if __name__ == '__main__':
+    main()
@@ -1,21 +1,574 @@
-def strict(func):
+import functools
+import inspect
+import itertools
+import logging
+import os
+import struct
+import time
+import types
+import typing
+
+from collections import Counter, abc
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+logger = logging.getLogger(__name__)
+
+# Режимы проверки: full - каждый вызов, sampled - выборочно, off - без обертки
+STRICT_MODES = ('full', 'sampled', 'off')
+# Переменные окружения: общий режим, режимы отдельных функций ("модуль.функция=режим,..."),
+# проверка 1 из N вызовов и не чаще, чем раз в заданное количество секунд
+STRICT_MODE_ENV = 'STRICT_MODE'
+STRICT_MODE_OVERRIDES_ENV = 'STRICT_MODE_OVERRIDES'
+STRICT_SAMPLE_RATE_ENV = 'STRICT_SAMPLE_RATE'
+STRICT_SAMPLE_INTERVAL_ENV = 'STRICT_SAMPLE_INTERVAL'
+# Включает сбор статистики (см. StrictStats), если значение не пустое и не 0
+STRICT_INSTRUMENT_ENV = 'STRICT_INSTRUMENT'
+DEFAULT_SAMPLE_RATE = 100
+
+# Количество нарушений, найденных в режиме sampled, по полному имени функции
+VIOLATIONS = Counter()
+
+# Сколько элементов контейнера проверяется и на какую глубину вложенности проверяются элементы,
+# чтобы проверка большого списка не делала вызов O(n)
+CONTAINER_CHECK_LIMIT = 100
+CONTAINER_CHECK_DEPTH = 2
+
+# Общий кэш скомпилированных проверок: (аннотация, лимит, глубина) -> функция проверки значения
+_VALIDATOR_CACHE = {}
+
+# Вид элемента (как dtype.kind в numpy) для кодов struct/array.array; размер берется из struct.calcsize
+_STRUCT_KINDS = {**dict.fromkeys('bhilqn', 'i'), **dict.fromkeys('BHILQNP', 'u'), **dict.fromkeys('efd', 'f'),
+                 '?': 'b', 'c': 'S'}
+
+
+def _format_key(fmt: str) -> tuple:
+    """ (вид, размер элемента) для кода struct ('q', '<d') или имени dtype ('int64'), чтобы 'q', 'l' и int64
+        одного размера считались одним форматом. Без numpy имена dtype и прочие форматы сравниваются как строки
+    """
+
+    kind = _STRUCT_KINDS.get(fmt.lstrip('@=<>!'))
+    if kind is not None:
+        return kind, struct.calcsize(fmt)
+    if np is not None:
+        try:
+            dtype = np.dtype(fmt)
+        except (TypeError, ValueError):
+            pass
+        else:
+            return dtype.kind, dtype.itemsize
+    return fmt, None
+
+
+class BufferSpec:
+    """ Описание ожидаемого буфера (array.array, memoryview, массив numpy и любой объект с буферным протоколом):
+        format - код типа элемента ('d', 'i', ...) или имя dtype ('float64'), ndim - число измерений,
+        shape - размеры (None в позиции - любой размер), readonly и contiguous - флаги буфера.
+        Проверяются только метаданные, данные не копируются и не перебираются, поэтому проверка O(1).
+        Используется как аннотация BufferSpec('d', ndim=1) или Annotated[memoryview, BufferSpec('d')]
+    """
+
+    __slots__ = ('format', 'ndim', 'shape', 'readonly', 'contiguous', '_format_key')
+    _fields = ('format', 'ndim', 'shape', 'readonly', 'contiguous')
+
+    def __init__(self, format: str = None, ndim: int = None, shape: tuple = None,
+                 readonly: bool = None, contiguous: bool = None):
+        self.format = format
+        self.ndim = ndim if ndim is not None or shape is None else len(shape)
+        self.shape = tuple(shape) if shape is not None else None
+        self.readonly = readonly
+        self.contiguous = contiguous
+        self._format_key = _format_key(format) if format is not None else None
+
+    def __repr__(self) -> str:
+        fields = ', '.join(f'{field}={getattr(self, field)!r}' for field in self._fields
+                           if getattr(self, field) is not None)
+        return f'BufferSpec({fields})'
+
+    def _metadata(self, value) -> tuple or None:
+        """ (формат, ndim, shape, readonly, contiguous) значения или None, если это не буфер """
+
+        dtype = getattr(value, 'dtype', None)
+        if dtype is not None and hasattr(value, 'ndim'):
+            # массив numpy и похожие на него: метаданные доступны без буферного протокола
+            # флагов может не быть (утиные массивы) - тогда readonly и contiguous неизвестны
+            flags = getattr(value, 'flags', None)
+            writeable = getattr(flags, 'writeable', None)
+            readonly = None if writeable is None else not writeable
+            return (dtype.kind, dtype.itemsize), value.ndim, value.shape, readonly, getattr(flags, 'c_contiguous', None)
+
+        try:
+            view = memoryview(value)
+        except TypeError:
+            return None
+        with view:
+            return _format_key(view.format), view.ndim, view.shape, view.readonly, view.c_contiguous
+
+    def __call__(self, value) -> bool:
+        metadata = self._metadata(value)
+        if metadata is None:
+            return False
+        format_key, ndim, shape, readonly, contiguous = metadata
+
+        if self._format_key is not None and self._format_key != format_key:
+            return False
+        if self.ndim is not None and self.ndim != ndim:
+            return False
+        if self.shape is not None and any(expected is not None and expected != actual
+                                          for expected, actual in zip(self.shape, shape)):
+            return False
+        if self.readonly is not None and self.readonly != readonly:
+            return False
+        return self.contiguous is None or self.contiguous == contiguous
+
+
+def _compile_validator(annotation, limit: int, depth: int):
+    """ Компилирует аннотацию в функцию value -> bool """
+
+    if annotation is typing.Any:
+        return lambda value: True
+    if annotation is None or annotation is type(None):
+        return lambda value: value is None
+
+    if isinstance(annotation, BufferSpec):
+        return annotation
+
+    origin = typing.get_origin(annotation)
+    args = typing.get_args(annotation)
+
+    if origin is typing.Annotated:
+        validators = tuple(get_validator(arg, limit, depth) for arg in (args[0],) + tuple(
+            metadata for metadata in args[1:] if isinstance(metadata, BufferSpec)))
+        return lambda value: all(validator(value) for validator in validators)
+
+    if origin is typing.Union or origin is types.UnionType:
+        validators = tuple(get_validator(arg, limit, depth) for arg in args)
+        return lambda value: any(validator(value) for validator in validators)
+
+    if origin is typing.Literal:
+        # True == 1, поэтому сравнивается и тип значения
+        return lambda value: any(type(value) is type(arg) and value == arg for arg in args)
+
+    if origin is None:
+        # обычный класс; для прочих аннотаций isinstance сам бросит TypeError при вызове, как и раньше
+        return lambda value: isinstance(value, annotation)
+
+    if not args or depth <= 0:
+        return lambda value: isinstance(value, origin)
+
+    if len(args) == 2 and getattr(typing.get_origin(args[1]), '__name__', None) == 'dtype':
+        # numpy.typing.NDArray[X] = ndarray[..., dtype[X]] - сравнивается тип элемента, а не элементы;
+        # X может быть абстрактным (np.floating, np.integer)
+        dtype_args = typing.get_args(args[1])
+        scalar_type = dtype_args[0] if dtype_args else typing.Any
+        if scalar_type is typing.Any:
+            return lambda value: isinstance(value, origin)
+        return lambda value: isinstance(value, origin) and issubclass(value.dtype.type, scalar_type)
+
+    if origin is tuple:
+        if len(args) == 2 and args[1] is Ellipsis:
+            item_validator = get_validator(args[0], limit, depth - 1)
+            return lambda value: (isinstance(value, tuple)
+                                  and all(item_validator(item) for item in itertools.islice(value, limit)))
+        if args == ((),):
+            return lambda value: value == ()
+        item_validators = tuple(get_validator(arg, limit, depth - 1) for arg in args)
+        return lambda value: (isinstance(value, tuple) and len(value) == len(item_validators)
+                              and all(validator(item) for validator, item in zip(item_validators, value)))
+
+    if issubclass(origin, abc.Mapping) and len(args) == 2:
+        key_validator = get_validator(args[0], limit, depth - 1)
+        value_validator = get_validator(args[1], limit, depth - 1)
+        return lambda value: (isinstance(value, origin)
+                              and all(key_validator(key) and value_validator(item)
+                                      for key, item in itertools.islice(value.items(), limit)))
+
+    if issubclass(origin, abc.Iterable) and not issubclass(origin, abc.Iterator) and len(args) == 1:
+        item_validator = get_validator(args[0], limit, depth - 1)
+        return lambda value: (isinstance(value, origin)
+                              and all(item_validator(item) for item in itertools.islice(value, limit)))
+
+    return lambda value: isinstance(value, origin)
+
+
+def get_validator(annotation, limit: int = CONTAINER_CHECK_LIMIT, depth: int = CONTAINER_CHECK_DEPTH):
+    """ Возвращает функцию проверки значения для аннотации. Проверка компилируется один раз
+        и переиспользуется всеми декорированными функциями через общий кэш.
+        У контейнеров проверяются не больше limit первых элементов и не глубже depth уровней вложенности
+    """
+
+    key = (annotation, limit, depth)
+    try:
+        return _VALIDATOR_CACHE[key]
+    except KeyError:
+        validator = _VALIDATOR_CACHE[key] = _compile_validator(annotation, limit, depth)
+        return validator
+    except TypeError:
+        # нехешируемая аннотация (например, Literal со списком) - без кэша
+        return _compile_validator(annotation, limit, depth)
+
+
+def _get_annotations(func) -> dict:
+    """ Аннотации функции; строковые аннотации вычисляются, если это возможно """
+
+    try:
+        return typing.get_type_hints(func, include_extras=True)
+    except Exception:
+        return func.__annotations__
+
+
+def _build_check_plan(func, limit: int, depth: int, skip_first: bool = False) -> tuple:
+    """ Строит план проверки один раз при декорировании: кортеж (позиция, имя, аннотация, проверка)
+        для каждого позиционного параметра и имя первого параметра без аннотации (или None).
+        Для обычных классов проверка - None, вместо нее используется isinstance.
+        skip_first - не проверять первый параметр (self/cls у методов)
+    """
+
+    annotations = _get_annotations(func)
+    arg_names = func.__code__.co_varnames[:func.__code__.co_argcount]
+    plan = []
+    for index, arg_name in enumerate(arg_names):
+        if skip_first and index == 0:
+            continue
+        if arg_name not in annotations:
+            return tuple(plan), arg_name
+        annotation = annotations[arg_name]
+        is_class = isinstance(annotation, type) and typing.get_origin(annotation) is None
+        validator = None if is_class else get_validator(annotation, limit, depth)
+        plan.append((index, arg_name, annotation, validator))
+    return tuple(plan), None
+
+
+def _make_generic_wrapper(func, plan: tuple, missing_annotation: str or None):
+    """ Обертка для любых сигнатур: проходит по готовому плану """
+
     def wrapper(*args, **kwargs):
-        annotations = func.__annotations__
-        arg_names = func.__code__.co_varnames[:func.__code__.co_argcount]
-        for index, arg_name in enumerate(arg_names):
-            if arg_name in annotations:
+        if missing_annotation is not None:
+            raise TypeError(f'У переданного параметра "{missing_annotation}" нет типа')
 
-                expected_type = annotations[arg_name]
+        args_count = len(args)
+        for index, arg_name, expected_type, validator in plan:
+            # Проверка позиционный или именованный параметр
+            value = args[index] if index < args_count else kwargs.get(arg_name)
+            if not (isinstance(value, expected_type) if validator is None else validator(value)):
+                raise TypeError(f'Переданный параметр "{arg_name}" не соответствует аннотации')
+        return func(*args, **kwargs)
+    return wrapper
 
-                # Проверка позиционный или именованный параметр
-                if index < len(args):
-                    value = args[index]
-                else:
-                    value = kwargs.get(arg_name)
 
-                if not isinstance(value, expected_type):
-                    raise TypeError(f'Переданный параметр "{arg_name}" не соответствует аннотации')
-            else:
-                raise TypeError(f'У переданного параметра "{arg_name}" нет типа')
+def _find_violation(plan: tuple, missing_annotation: str or None, args: tuple, kwargs: dict) -> str or None:
+    """ Проверяет аргументы по плану и возвращает описание первого нарушения (или None) """
+
+    if missing_annotation is not None:
+        return f'У переданного параметра "{missing_annotation}" нет типа'
+
+    args_count = len(args)
+    for index, arg_name, expected_type, validator in plan:
+        value = args[index] if index < args_count else kwargs.get(arg_name)
+        if not (isinstance(value, expected_type) if validator is None else validator(value)):
+            return f'Переданный параметр "{arg_name}" не соответствует аннотации'
+    return None
+
+
+def _make_sampler(sample_rate: int or None, sample_interval: float or None):
+    """ Функция без аргументов, которая возвращает True для 1 из sample_rate вызовов
+        или не чаще раза в sample_interval секунд
+    """
+
+    calls_left = sample_rate or 0
+    next_check = 0.0
+
+    def should_check() -> bool:
+        nonlocal calls_left, next_check
+        if sample_interval is not None:
+            now = time.monotonic()
+            if now < next_check:
+                return False
+            next_check = now + sample_interval
+            return True
+
+        calls_left -= 1
+        if calls_left > 0:
+            return False
+        calls_left = sample_rate
+        return True
+    return should_check
+
+
+def _report_violation(function_name: str, violation: str) -> None:
+    """ Учитывает нарушение в режиме sampled """
+
+    VIOLATIONS[function_name] += 1
+    logger.warning('strict: %s: %s', function_name, violation)
+
+
+def _make_sampled_wrapper(func, plan: tuple, missing_annotation: str or None, should_check):
+    """ Обертка, проверяющая только вызовы, отобранные should_check.
+        Нарушения не бросают исключение, а считаются в VIOLATIONS и пишутся в лог
+    """
+
+    function_name = f'{func.__module__}.{func.__qualname__}'
+
+    def wrapper(*args, **kwargs):
+        if should_check():
+            violation = _find_violation(plan, missing_annotation, args, kwargs)
+            if violation is not None:
+                _report_violation(function_name, violation)
         return func(*args, **kwargs)
     return wrapper
+
+
+class StrictStats:
+    """ Статистика вызовов функции, обернутой strict(instrument=True) """
+
+    __slots__ = ('name', 'calls', 'checks', 'failures', 'validation_seconds', 'execution_seconds')
+
+    def __init__(self, name: str):
+        self.name = name
+        self.reset()
+
+    def reset(self) -> None:
+        """ Обнуляет счетчики и время, имя функции сохраняется """
+
+        self.calls = 0
+        self.checks = 0
+        self.failures = 0
+        self.validation_seconds = 0.0
+        self.execution_seconds = 0.0
+
+    def as_dict(self) -> dict:
+        return {field: getattr(self, field) for field in self.__slots__}
+
+
+# Статистика всех инструментированных функций процесса по полному имени функции
+STATS_REGISTRY = {}
+
+
+def _make_instrumented_wrapper(func, plan: tuple, missing_annotation: str or None, should_check, stats: StrictStats):
+    """ Обертка со сбором статистики. should_check - None в режиме full (проверяется каждый вызов,
+        нарушение бросает TypeError) или функция выборки в режиме sampled
+    """
+
+    perf_counter = time.perf_counter
+
+    def wrapper(*args, **kwargs):
+        stats.calls += 1
+        if should_check is None or should_check():
+            started = perf_counter()
+            violation = _find_violation(plan, missing_annotation, args, kwargs)
+            stats.validation_seconds += perf_counter() - started
+            stats.checks += 1
+            if violation is not None:
+                stats.failures += 1
+                if should_check is None:
+                    raise TypeError(violation)
+                _report_violation(stats.name, violation)
+
+        started = perf_counter()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            stats.execution_seconds += perf_counter() - started
+    return wrapper
+
+
+def strict_report(sort_by: str = 'validation_seconds') -> str:
+    """ Текстовый отчет по STATS_REGISTRY, отсортированный по убыванию поля sort_by """
+
+    columns = ('calls', 'checks', 'failures', 'validation_seconds', 'execution_seconds')
+    lines = [' '.join([f'{"function":<50}'] + [f'{column:>18}' for column in columns])]
+    for stats in sorted(STATS_REGISTRY.values(), key=lambda item: getattr(item, sort_by), reverse=True):
+        values = [f'{getattr(stats, column):>18.6f}' if column.endswith('seconds') else f'{getattr(stats, column):>18}'
+                  for column in columns]
+        lines.append(' '.join([f'{stats.name:<50}'] + values))
+    return '\n'.join(lines)
+
+
+def reset_stats() -> None:
+    """ Обнуляет статистику всех инструментированных функций """
+
+    for stats in STATS_REGISTRY.values():
+        stats.reset()
+
+
+def _resolve_mode(func, mode: str or None) -> str:
+    """ Режим для функции: переопределение из STRICT_MODE_OVERRIDES, затем аргумент декоратора,
+        затем общий STRICT_MODE, по умолчанию - full
+    """
+
+    function_name = f'{func.__module__}.{func.__qualname__}'
+    for override in os.environ.get(STRICT_MODE_OVERRIDES_ENV, '').split(','):
+        name, _, override_mode = override.partition('=')
+        if name.strip() == function_name and override_mode.strip():
+            mode = override_mode.strip()
+            break
+    else:
+        mode = mode or os.environ.get(STRICT_MODE_ENV) or 'full'
+
+    if mode not in STRICT_MODES:
+        raise ValueError(f'Неизвестный режим strict "{mode}", ожидается один из {STRICT_MODES}')
+    return mode
+
+
+def _make_specialized_wrapper(func, plan: tuple):
+    """ Генерирует обертку с той же сигнатурой, что и у функции, и развернутыми проверками.
+        Связывание аргументов с параметрами при этом делает сам интерпретатор.
+        Возвращает None, если сигнатура не простая (*args, **kwargs, только именованные параметры,
+        значения по умолчанию) - для нее используется общая обертка
+    """
+
+    code = func.__code__
+    if (code.co_flags & (inspect.CO_VARARGS | inspect.CO_VARKEYWORDS) or code.co_kwonlyargcount
+            or func.__defaults__ or func.__kwdefaults__):
+        return None
+
+    arg_names = code.co_varnames[:code.co_argcount]
+    parameters = list(arg_names)
+    if code.co_posonlyargcount:
+        parameters.insert(code.co_posonlyargcount, '/')
+
+    namespace = {'__strict_func': func, '__strict_isinstance': isinstance, '__strict_TypeError': TypeError}
+    lines = [f'def wrapper({", ".join(parameters)}):']
+    for index, arg_name, expected_type, validator in plan:
+        if validator is None:
+            namespace[f'__strict_type_{index}'] = expected_type
+            lines.append(f'    if not __strict_isinstance({arg_name}, __strict_type_{index}):')
+        else:
+            namespace[f'__strict_check_{index}'] = validator
+            lines.append(f'    if not __strict_check_{index}({arg_name}):')
+        lines.append(f'        raise __strict_TypeError(\'Переданный параметр "{arg_name}" не соответствует аннотации\')')
+    lines.append(f'    return __strict_func({", ".join(arg_names)})')
+
+    exec('\n'.join(lines), namespace)
+    return namespace['wrapper']
+
+
+def _strict_function(func, options: dict, skip_first: bool = False):
+    """ Оборачивает одну функцию в соответствии с режимом и параметрами декоратора """
+
+    mode = _resolve_mode(func, options['mode'])
+    if mode == 'off':
+        return func
+
+    plan, missing_annotation = _build_check_plan(func, options['container_limit'], options['container_depth'],
+                                                 skip_first)
+
+    should_check = None
+    if mode == 'sampled':
+        sample_rate = options['sample_rate']
+        sample_interval = options['sample_interval']
+        if sample_rate is None and sample_interval is None:
+            if os.environ.get(STRICT_SAMPLE_INTERVAL_ENV):
+                sample_interval = float(os.environ[STRICT_SAMPLE_INTERVAL_ENV])
+            else:
+                sample_rate = int(os.environ.get(STRICT_SAMPLE_RATE_ENV, DEFAULT_SAMPLE_RATE))
+        should_check = _make_sampler(sample_rate, sample_interval)
+
+    instrument = options['instrument']
+    if instrument is None:
+        instrument = os.environ.get(STRICT_INSTRUMENT_ENV, '') not in ('', '0')
+    if instrument:
+        function_name = f'{func.__module__}.{func.__qualname__}'
+        stats = STATS_REGISTRY.setdefault(function_name, StrictStats(function_name))
+        wrapper = functools.wraps(func)(_make_instrumented_wrapper(func, plan, missing_annotation,
+                                                                   should_check, stats))
+        wrapper.strict_stats = stats
+        return wrapper
+
+    if should_check is not None:
+        return functools.wraps(func)(_make_sampled_wrapper(func, plan, missing_annotation, should_check))
+
+    wrapper = None
+    if missing_annotation is None:
+        wrapper = _make_specialized_wrapper(func, plan)
+    if wrapper is None:
+        wrapper = _make_generic_wrapper(func, plan, missing_annotation)
+    return functools.wraps(func)(wrapper)
+
+
+def _make_lazy_wrapper(func, owner, name: str, kind: str, options: dict):
+    """ Заглушка, которая строит настоящую обертку при первом вызове и подменяет себя ею в owner.
+        kind - function, method, staticmethod или classmethod
+    """
+
+    real_wrapper = None
+
+    def lazy_wrapper(*args, **kwargs):
+        nonlocal real_wrapper
+        if real_wrapper is None:
+            real_wrapper = _strict_function(func, options, skip_first=kind in ('method', 'classmethod'))
+            if kind == 'staticmethod':
+                setattr(owner, name, staticmethod(real_wrapper))
+            elif kind == 'classmethod':
+                setattr(owner, name, classmethod(real_wrapper))
+            else:
+                setattr(owner, name, real_wrapper)
+        return real_wrapper(*args, **kwargs)
+    return functools.wraps(func)(lazy_wrapper)
+
+
+def _strict_class(cls, options: dict):
+    """ Лениво оборачивает методы, staticmethod и classmethod класса.
+        Специальные методы, кроме __init__, не оборачиваются
+    """
+
+    for name, attribute in list(vars(cls).items()):
+        if name.startswith('__') and name.endswith('__') and name != '__init__':
+            continue
+        if isinstance(attribute, staticmethod):
+            lazy_wrapper = _make_lazy_wrapper(attribute.__func__, cls, name, 'staticmethod', options)
+            setattr(cls, name, staticmethod(lazy_wrapper))
+        elif isinstance(attribute, classmethod):
+            lazy_wrapper = _make_lazy_wrapper(attribute.__func__, cls, name, 'classmethod', options)
+            setattr(cls, name, classmethod(lazy_wrapper))
+        elif inspect.isfunction(attribute):
+            setattr(cls, name, _make_lazy_wrapper(attribute, cls, name, 'method', options))
+    return cls
+
+
+def _strict_module(module, options: dict):
+    """ Лениво оборачивает функции и методы классов, определенных в самом модуле (не импортированных) """
+
+    for name, attribute in list(vars(module).items()):
+        if getattr(attribute, '__module__', None) != module.__name__:
+            continue
+        if inspect.isclass(attribute):
+            _strict_class(attribute, options)
+        elif inspect.isfunction(attribute):
+            setattr(module, name, _make_lazy_wrapper(attribute, module, name, 'function', options))
+    return module
+
+
+def strict(func=None, *, container_limit: int = CONTAINER_CHECK_LIMIT, container_depth: int = CONTAINER_CHECK_DEPTH,
+           mode: str = None, sample_rate: int = None, sample_interval: float = None, instrument: bool = None):
+    """ Проверяет типы аргументов по аннотациям и бросает TypeError при несоответствии.
+        Кроме классов поддерживаются Optional/Union (в том числе X | None), Literal, Any
+        и параметризованные контейнеры (list[str], dict[str, float], tuple[int, ...] и т.п.).
+        Буферы (array.array, memoryview, numpy) проверяются по метаданным через BufferSpec и NDArray[X].
+        Можно использовать как @strict или @strict(container_limit=..., container_depth=..., mode=...)
+
+        Режим (full, sampled, off) определяется при декорировании, см. _resolve_mode.
+        В режиме off возвращается сама функция без обертки. В режиме sampled проверяется
+        1 из sample_rate вызовов (STRICT_SAMPLE_RATE, по умолчанию DEFAULT_SAMPLE_RATE)
+        или не чаще раза в sample_interval секунд (STRICT_SAMPLE_INTERVAL), нарушения только считаются и логируются
+
+        instrument=True (или STRICT_INSTRUMENT=1) включает сбор статистики: wrapper.strict_stats,
+        общий реестр STATS_REGISTRY и отчет strict_report(). Без него обертка не меняется и ничего не замеряет
+
+        Если передан класс или модуль, их функции и методы (self/cls не проверяются) оборачиваются лениво:
+        план проверки строится и режим определяется при первом вызове каждой функции,
+        чтобы не замедлять импорт
+    """
+
+    options = {'container_limit': container_limit, 'container_depth': container_depth,
+               'mode': mode, 'sample_rate': sample_rate, 'sample_interval': sample_interval, 'instrument': instrument}
+    if func is None:
+        return functools.partial(strict, **options)
+    if inspect.isclass(func):
+        return _strict_class(func, options)
+    if inspect.ismodule(func):
+        return _strict_module(func, options)
+    return _strict_function(func, options)
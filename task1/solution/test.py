@@ -1,6 +1,20 @@
+import os
+import types
 import unittest
 
-from solution import strict
+from array import array
+from typing import Annotated, Literal, Optional
+from unittest.mock import patch
+
+import solution
+
+try:
+    import numpy as np
+    from numpy.typing import NDArray
+except ImportError:
+    np = None
+
+from solution import BufferSpec, STATS_REGISTRY, VIOLATIONS, get_validator, reset_stats, strict, strict_report
 
 
 class TestStrictDecorator(unittest.TestCase):
@@ -38,3 +52,423 @@ class TestStrictDecorator(unittest.TestCase):
         with self.assertRaises(TypeError):
             func('1', 2.3, '4')
 
+    def test_keyword_arguments(self):
+        """ Параметры, переданные по имени, тоже проверяются """
+
+        @strict
+        def func(a: int, b: float, c: str) -> tuple:
+            return a, b, c
+
+        self.assertEqual(func(1, c='4', b=2.3), (1, 2.3, '4'))
+        with self.assertRaises(TypeError):
+            func(1, c=4, b=2.3)
+        with self.assertRaises(TypeError):
+            func(1, 2.3)
+
+    def test_generic_signature(self):
+        """ Функция с *args проверяется по общему плану """
+
+        @strict
+        def func(a: int, b: str, *args) -> tuple:
+            return a, b, args
+
+        self.assertEqual(func(1, '2', 3), (1, '2', (3,)))
+        with self.assertRaises(TypeError):
+            func(1, 2, 3)
+
+    def test_wraps_function(self):
+        """ Обертка сохраняет имя и документацию функции """
+
+        @strict
+        def func(a: int) -> int:
+            """ Документация """
+            return a
+
+        self.assertEqual(func.__name__, 'func')
+        self.assertEqual(func.__doc__, ' Документация ')
+
+
+class TestRichAnnotations(unittest.TestCase):
+    def test_optional_and_union(self):
+        """ Optional[X] и X | None """
+
+        @strict
+        def func(a: Optional[int], b: int | str | None) -> tuple:
+            return a, b
+
+        self.assertEqual(func(None, 'b'), (None, 'b'))
+        self.assertEqual(func(1, None), (1, None))
+        with self.assertRaises(TypeError):
+            func(1.5, None)
+        with self.assertRaises(TypeError):
+            func(1, 2.5)
+
+    def test_containers(self):
+        """ list[str], dict[str, float], tuple[int, ...] и tuple[int, str] """
+
+        @strict
+        def func(a: list[str], b: dict[str, float], c: tuple[int, ...], d: tuple[int, str]) -> None:
+            pass
+
+        func(['a'], {'b': 1.5}, (1, 2, 3), (1, 'd'))
+        with self.assertRaises(TypeError):
+            func(['a', 1], {'b': 1.5}, (1, 2, 3), (1, 'd'))
+        with self.assertRaises(TypeError):
+            func(['a'], {'b': 1}, (1, 2, 3), (1, 'd'))
+        with self.assertRaises(TypeError):
+            func(['a'], {'b': 1.5}, (1, '2'), (1, 'd'))
+        with self.assertRaises(TypeError):
+            func(['a'], {'b': 1.5}, (1, 2, 3), (1, 'd', 3))
+        with self.assertRaises(TypeError):
+            func(('a',), {'b': 1.5}, (1, 2, 3), (1, 'd'))
+
+    def test_literal(self):
+        """ Literal сравнивает и значение, и тип """
+
+        @strict
+        def func(mode: Literal['fast', 1]) -> str:
+            return mode
+
+        self.assertEqual(func('fast'), 'fast')
+        self.assertEqual(func(1), 1)
+        with self.assertRaises(TypeError):
+            func('slow')
+        with self.assertRaises(TypeError):
+            func(True)
+
+    def test_container_limit(self):
+        """ Проверяются только первые container_limit элементов """
+
+        @strict(container_limit=2)
+        def func(a: list[int]) -> list:
+            return a
+
+        self.assertEqual(func([1, 2, 'не проверяется']), [1, 2, 'не проверяется'])
+        with self.assertRaises(TypeError):
+            func([1, '2'])
+
+    def test_validator_cache(self):
+        """ Проверка для одной и той же аннотации компилируется один раз """
+
+        self.assertIs(get_validator(dict[str, list[int]]), get_validator(dict[str, list[int]]))
+
+
+class TestStrictModes(unittest.TestCase):
+    def test_off_returns_function(self):
+        """ В режиме off возвращается сама функция """
+
+        def func(a: int) -> int:
+            return a
+
+        self.assertIs(strict(mode='off')(func), func)
+        with patch.dict(os.environ, {'STRICT_MODE': 'off'}):
+            self.assertIs(strict(func), func)
+
+    def test_sampled_counts_violations(self):
+        """ В режиме sampled проверяется 1 из N вызовов, нарушения считаются и логируются """
+
+        @strict(mode='sampled', sample_rate=2)
+        def func(a: int) -> int:
+            return a
+
+        name = f'{func.__module__}.{func.__qualname__}'
+        with self.assertLogs('solution', level='WARNING'):
+            for _ in range(4):
+                self.assertEqual(func('1'), '1')
+        self.assertEqual(VIOLATIONS[name], 2)
+
+    def test_sampled_interval(self):
+        """ Проверка не чаще раза в sample_interval секунд """
+
+        @strict(mode='sampled', sample_interval=3600)
+        def func(a: int) -> int:
+            return a
+
+        name = f'{func.__module__}.{func.__qualname__}'
+        with self.assertLogs('solution', level='WARNING'):
+            for _ in range(3):
+                func('1')
+        self.assertEqual(VIOLATIONS[name], 1)
+
+    def test_override_from_env(self):
+        """ Переопределение режима отдельной функции через переменную окружения """
+
+        def func(a: int) -> int:
+            return a
+
+        name = f'{func.__module__}.{func.__qualname__}'
+        with patch.dict(os.environ, {'STRICT_MODE': 'off', 'STRICT_MODE_OVERRIDES': f'other.func=off,{name}=full'}):
+            checked = strict(func)
+
+        with self.assertRaises(TypeError):
+            checked('1')
+
+    def test_unknown_mode(self):
+        """ Неизвестный режим """
+
+        with self.assertRaises(ValueError):
+            strict(mode='partial')(lambda a: a)
+
+
+class TestStrictClassAndModule(unittest.TestCase):
+    def test_class(self):
+        """ Методы, staticmethod и classmethod класса проверяются, self/cls - нет """
+
+        @strict
+        class Calculator:
+            def __init__(self, base: int):
+                self.base = base
+
+            def add(self, value: int) -> int:
+                return self.base + value
+
+            @staticmethod
+            def double(value: int) -> int:
+                return value * 2
+
+            @classmethod
+            def create(cls, base: int) -> 'Calculator':
+                return cls(base)
+
+        calculator = Calculator.create(1)
+        self.assertEqual(calculator.add(2), 3)
+        self.assertEqual(Calculator.double(2), 4)
+        self.assertEqual(calculator.double(3), 6)
+        with self.assertRaises(TypeError):
+            Calculator('1')
+        with self.assertRaises(TypeError):
+            calculator.add(2.5)
+        with self.assertRaises(TypeError):
+            Calculator.double('2')
+        with self.assertRaises(TypeError):
+            Calculator.create(None)
+
+    def test_lazy_wrapping(self):
+        """ План проверки строится при первом вызове, после чего заглушка заменяется оберткой """
+
+        module = types.ModuleType('service')
+        exec('def func(a: int) -> int:\n    return a\n', vars(module))
+
+        with patch('solution._build_check_plan', wraps=solution._build_check_plan) as build_check_plan:
+            strict(module)
+            lazy_wrapper = module.func
+            build_check_plan.assert_not_called()
+
+            self.assertEqual(module.func(1), 1)
+            build_check_plan.assert_called_once()
+
+        self.assertIsNot(module.func, lazy_wrapper)
+        with self.assertRaises(TypeError):
+            module.func('1')
+        with self.assertRaises(TypeError):
+            lazy_wrapper('1')
+
+    def test_module_skips_imported(self):
+        """ Импортированные в модуль функции не оборачиваются """
+
+        module = types.ModuleType('service')
+        module.imported = os.path.join
+        strict(module)
+
+        self.assertIs(module.imported, os.path.join)
+
+
+class TestStrictInstrumentation(unittest.TestCase):
+    def test_stats(self):
+        """ Счетчики вызовов, проверок и ошибок, время проверки и выполнения """
+
+        @strict(instrument=True)
+        def func(a: int) -> int:
+            return a
+
+        func(1)
+        func(2)
+        with self.assertRaises(TypeError):
+            func('3')
+
+        stats = func.strict_stats
+        self.assertIs(STATS_REGISTRY[stats.name], stats)
+        self.assertEqual((stats.calls, stats.checks, stats.failures), (3, 3, 1))
+        self.assertGreater(stats.validation_seconds, 0)
+        self.assertGreater(stats.execution_seconds, 0)
+
+        name = stats.name
+        reset_stats()
+        self.assertEqual(stats.as_dict()['calls'], 0)
+        self.assertEqual((stats.name, stats.failures, stats.validation_seconds), (name, 0, 0.0))
+        self.assertIs(STATS_REGISTRY[name], stats)
+
+    def test_sampled_stats(self):
+        """ В режиме sampled считаются только отобранные проверки, ошибки не бросаются """
+
+        @strict(instrument=True, mode='sampled', sample_rate=2)
+        def func(a: int) -> int:
+            return a
+
+        with self.assertLogs('solution', level='WARNING'):
+            for _ in range(4):
+                func('1')
+
+        stats = func.strict_stats
+        self.assertEqual((stats.calls, stats.checks, stats.failures), (4, 2, 2))
+
+    def test_report_sorted(self):
+        """ Отчет отсортирован по убыванию выбранного поля """
+
+        @strict(instrument=True)
+        def rarely_called(a: int) -> int:
+            return a
+
+        @strict(instrument=True)
+        def often_called(a: int) -> int:
+            return a
+
+        rarely_called(1)
+        for value in range(5):
+            often_called(value)
+
+        report = strict_report(sort_by='calls')
+        self.assertLess(report.index(often_called.strict_stats.name), report.index(rarely_called.strict_stats.name))
+
+    def test_disabled_by_default(self):
+        """ Без instrument статистика не собирается """
+
+        @strict
+        def func(a: int) -> int:
+            return a
+
+        self.assertFalse(hasattr(func, 'strict_stats'))
+
+
+class NotIterableArray(array):
+    """ array, элементы которого нельзя перебирать - проверка не должна их трогать """
+
+    def __iter__(self):
+        raise AssertionError('Элементы буфера не должны перебираться')
+
+    def __getitem__(self, index):
+        raise AssertionError('Элементы буфера не должны перебираться')
+
+
+class DuckArray:
+    """ Похожий на массив numpy объект: есть dtype, ndim и shape, но флаги неполные """
+
+    def __init__(self, shape: tuple, flags=None):
+        self.dtype = types.SimpleNamespace(kind='f', itemsize=8)
+        self.ndim = len(shape)
+        self.shape = shape
+        if flags is not None:
+            self.flags = flags
+
+
+class TestBufferAnnotations(unittest.TestCase):
+    def test_array_typecode(self):
+        """ Код типа array.array проверяется без перебора элементов """
+
+        @strict
+        def func(values: Annotated[array, BufferSpec('d', ndim=1)]) -> int:
+            return len(values)
+
+        self.assertEqual(func(NotIterableArray('d', [1.0] * 1000)), 1000)
+        with self.assertRaises(TypeError):
+            func(array('i', [1, 2]))
+        with self.assertRaises(TypeError):
+            func(memoryview(array('d', [1.0])))
+
+    def test_memoryview_shape(self):
+        """ Формат, размерность и форма memoryview """
+
+        @strict
+        def func(matrix: BufferSpec('i', shape=(None, 3), readonly=False)) -> tuple:
+            return matrix.shape
+
+        matrix = memoryview(array('i', range(6))).cast('B').cast('i', (2, 3))
+        self.assertEqual(func(matrix), (2, 3))
+        with self.assertRaises(TypeError):
+            func(matrix.cast('B').cast('i', (3, 2)))
+        with self.assertRaises(TypeError):
+            func(memoryview(bytes(24)).cast('i', (2, 3)))
+        with self.assertRaises(TypeError):
+            func([[1, 2, 3]])
+
+    @unittest.skipIf(np is None, 'numpy не установлен')
+    def test_numpy(self):
+        """ dtype и ndim массивов numpy, в том числе через NDArray[X] """
+
+        @strict
+        def func(values: Annotated[np.ndarray, BufferSpec('float64', ndim=2)], weights: NDArray[np.int64]) -> int:
+            return values.ndim
+
+        self.assertEqual(func(np.zeros((2, 3)), np.zeros(3, dtype=np.int64)), 2)
+        with self.assertRaises(TypeError):
+            func(np.zeros(3), np.zeros(3, dtype=np.int64))
+        with self.assertRaises(TypeError):
+            func(np.zeros((2, 3), dtype=np.float32), np.zeros(3, dtype=np.int64))
+        with self.assertRaises(TypeError):
+            func(np.zeros((2, 3)), np.zeros(3))
+
+    def test_equivalent_formats(self):
+        """ Коды одного вида и размера ('q' и 'l' на 64-битной платформе) считаются одним форматом """
+
+        @strict
+        def func(values: BufferSpec('q')) -> int:
+            return len(values)
+
+        self.assertEqual(func(array('q', [1, 2])), 2)
+        if array('l').itemsize == 8:
+            self.assertEqual(func(array('l', [1, 2, 3])), 3)
+        with self.assertRaises(TypeError):
+            func(array('Q', [1, 2]))
+        with self.assertRaises(TypeError):
+            func(array('d', [1.0]))
+
+    @unittest.skipIf(np is None, 'numpy не установлен')
+    def test_numpy_formats(self):
+        """ Код struct принимает массив numpy того же dtype, а имя dtype - array.array и memoryview """
+
+        @strict
+        def by_code(values: BufferSpec('q')) -> int:
+            return len(values)
+
+        @strict
+        def by_name(values: BufferSpec('int64')) -> int:
+            return len(values)
+
+        self.assertEqual(by_code(np.zeros(3, dtype=np.int64)), 3)
+        self.assertEqual(by_name(array('q', [1, 2])), 2)
+        self.assertEqual(by_name(memoryview(array('q', [1]))), 1)
+        with self.assertRaises(TypeError):
+            by_code(np.zeros(3, dtype=np.int32))
+        with self.assertRaises(TypeError):
+            by_name(array('d', [1.0]))
+
+    def test_duck_array_flags(self):
+        """ Без flags или flags.writeable флаги буфера считаются неизвестными, а не ломают проверку """
+
+        @strict
+        def func(values: BufferSpec('d', ndim=1)) -> int:
+            return values.ndim
+
+        @strict
+        def writable(values: BufferSpec('d', readonly=False)) -> int:
+            return values.ndim
+
+        self.assertEqual(func(DuckArray((3,))), 1)
+        self.assertEqual(func(DuckArray((3,), flags=types.SimpleNamespace())), 1)
+        with self.assertRaises(TypeError):
+            writable(DuckArray((3,)))
+        with self.assertRaises(TypeError):
+            func(DuckArray((2, 3)))
+
+    @unittest.skipIf(np is None, 'numpy не установлен')
+    def test_numpy_abstract_scalar(self):
+        """ NDArray с абстрактным типом элемента принимает все его подтипы """
+
+        @strict
+        def func(values: NDArray[np.floating]) -> int:
+            return len(values)
+
+        self.assertEqual(func(np.zeros(3)), 3)
+        self.assertEqual(func(np.zeros(2, dtype=np.float32)), 2)
+        with self.assertRaises(TypeError):
+            func(np.zeros(3, dtype=np.int64))
@@ -0,0 +1,330 @@
+""" Бенчмарки обхода категории.
+    parse - разбор одной страницы: полный разбор html.parser с get_animals_from_page
+    против режима fast (только блок #mw-pages, один проход по h3 и li) с html.parser и lxml.
+    crawl - обход целиком через локальный сервер replay.ReplayServer (записанный архив или сгенерированный)
+    для нескольких режимов: страниц в секунду, процессорное время на страницу и пиковая память.
+    Запуск из папки solution:
+        python benchmark.py parse [--fixtures папка_с_сохраненными_страницами]
+        python benchmark.py crawl [--archive fixtures.zip] [--latency 0.05] [--error-rate 0.02] [--rate-limit 50]
+    Без --fixtures/--archive используются сгенерированные страницы в разметке MediaWiki
+"""
+
+import argparse
+import contextlib
+import glob
+import io
+import json
+import multiprocessing
+import os
+import queue
+import random
+import resource
+import tempfile
+import time
+
+import solution
+
+from replay import ReplayServer, get_request_path, read_fixture_archive, write_fixture_archive
+from solution import (get_animals_from_page, get_animals_from_page_fast, get_api_params, get_category_url,
+                      parse_all_animals, parse_all_animals_pipelined, parse_page, Fetcher, RateLimiter)
+
+LETTERS = 'АБВГДЕЖЗИКЛМНОПРСТУФХЦЧШЩЭЮЯ'
+
+
+def make_titles(rng: random.Random, count: int, letters: str = LETTERS) -> list:
+    """ count разных отсортированных названий, начинающихся с букв из letters """
+
+    titles = set()
+    while len(titles) < count:
+        titles.add(f'{rng.choice(letters)}{"".join(rng.choices("абвгдеклмнопрст", k=rng.randint(4, 14)))}')
+    return sorted(titles)
+
+
+def make_fixture_page(rng: random.Random, entries: int = 200) -> bytes:
+    """ Страница категории со случайными entries записями по шести буквам """
+
+    titles = make_titles(rng, entries, ''.join(rng.sample(LETTERS, 6)))
+    return render_fixture_page(titles, '/w/index.php?title=Категория:Животные_по_алфавиту&pagefrom=' + titles[-1])
+
+
+def render_fixture_page(titles: list, next_href: str = None) -> bytes:
+    """ Страница категории, похожая на настоящую: шапка со скриптами, боковое меню со ссылками,
+        блок подкатегорий, записи titles по буквам, ссылки на следующую страницу, printfooter и подвал
+    """
+
+    letters = sorted({title[0] for title in titles})
+    groups = []
+    for title in titles:
+        if not groups or groups[-1][0] != title[0]:
+            groups.append((title[0], []))
+        groups[-1][1].append(f'<li><a href="/wiki/{title}" title="{title}">{title}</a></li>')
+
+    head = ''.join(f'<script>var config{index} = {{"wgPageName": "Категория", "value": {index}}};</script>'
+                   f'<link rel="stylesheet" href="/w/load.php?modules=skin{index}">' for index in range(40))
+    sidebar = ''.join(f'<li id="n-item{index}"><a href="/wiki/Служебная:{index}">Пункт меню {index}</a></li>'
+                      for index in range(300))
+    subcategories = ''.join(f'<div class="mw-category-group"><h3>{letter}</h3><ul>'
+                            f'<li><a href="/wiki/Категория:{letter}ерт">{letter}ерт</a></li></ul></div>'
+                            for letter in letters)
+    next_link = ''
+    if next_href:
+        next_link = (f'<a href="{next_href.replace("&", "&amp;")}#mw-pages" '
+                     f'title="Категория:Животные по алфавиту">Следующая страница</a>')
+    footer = ''.join(f'<li><a href="/wiki/Правила:{index}">Правило {index}</a></li>' for index in range(100))
+
+    return ('<!DOCTYPE html><html><head><title>Категория</title>' + head + '</head><body>'
+            '<div id="mw-navigation"><ul>' + sidebar + '</ul></div>'
+            '<div id="mw-content-text"><div id="mw-subcategories"><div class="mw-category">'
+            + subcategories + '</div></div>'
+            '<div id="mw-pages"><h2>Страницы в категории «Животные по алфавиту»</h2>'
+            f'<p>Показано {len(titles)} страниц из 48 000, находящихся в данной категории.</p>' + next_link
+            + '<div class="mw-category">'
+            + ''.join(f'<div class="mw-category-group"><h3>{letter}</h3><ul>{"".join(items)}</ul></div>'
+                      for letter, items in groups)
+            + '</div>' + next_link + '</div>'
+            '<div class="printfooter">Источник — https://ru.wikipedia.org/wiki/Категория</div></div>'
+            '<div id="footer"><ul>' + footer + '</ul></div></body></html>').encode('utf-8')
+
+
+def load_fixture_pages(directory: str) -> list:
+    """ Сохраненные страницы категории (*.html) из папки """
+
+    pages = []
+    for path in sorted(glob.glob(os.path.join(directory, '*.html'))):
+        with open(path, 'rb') as page_file:
+            pages.append(page_file.read())
+    return pages
+
+
+def count_full(content: bytes) -> dict:
+    return get_animals_from_page(parse_page(content))
+
+
+def count_fast(content: bytes) -> dict:
+    return get_animals_from_page_fast(parse_page(content, 'fast'))
+
+
+def get_variants() -> dict:
+    """ Варианты разбора: название -> (парсер для режима fast, функция подсчета) """
+
+    variants = {'full html.parser': (None, count_full), 'fast html.parser': ('html.parser', count_fast)}
+    if solution.lxml is not None:
+        variants['fast lxml'] = ('lxml', count_fast)
+    return variants
+
+
+def benchmark(pages: list, repeat: int = 3) -> dict:
+    """ Лучшее из repeat среднее время разбора одной страницы (в миллисекундах) для каждого варианта.
+        Заодно проверяет, что все варианты считают одинаково
+    """
+
+    expected = [count_full(page) for page in pages]
+    default_parser = solution.FAST_HTML_PARSER
+    results = {}
+    try:
+        for name, (parser, count) in get_variants().items():
+            if parser is not None:
+                solution.FAST_HTML_PARSER = parser
+            if [count(page) for page in pages] != expected:
+                raise SystemExit(f'Вариант "{name}" считает не так, как полный разбор')
+
+            best = float('inf')
+            for _ in range(repeat):
+                started = time.perf_counter()
+                for page in pages:
+                    count(page)
+                best = min(best, time.perf_counter() - started)
+            results[name] = best / len(pages) * 1000
+    finally:
+        solution.FAST_HTML_PARSER = default_parser
+    return results
+
+
+def generate_fixture_archive(path: str, pages: int = 50, entries: int = 200, api_limit: int = 500,
+                             seed: int = 0) -> None:
+    """ Архив для replay.ReplayServer с категорией из pages HTML страниц по entries записей
+        и теми же записями в ответах API по api_limit штук
+    """
+
+    rng = random.Random(seed)
+    titles = make_titles(rng, pages * entries)
+    category_title = solution.CATEGORY_TITLE
+    responses = {}
+
+    page_path = get_request_path(get_category_url(category_title, solution.BASE_URL))
+    for start in range(0, len(titles), entries):
+        next_href = None
+        if start + entries < len(titles):
+            next_href = f'/w/index.php?title={category_title}&pagefrom={titles[start + entries]}'
+        responses[page_path] = ('text/html; charset=utf-8', render_fixture_page(titles[start:start + entries],
+                                                                                next_href))
+        if next_href:
+            page_path = get_request_path(solution.BASE_URL + next_href)
+
+    for start in range(0, len(titles), api_limit):
+        data = {'query': {'categorymembers': [{'ns': 0, 'title': title, 'sortkeyprefix': ''}
+                                              for title in titles[start:start + api_limit]]}}
+        if start + api_limit < len(titles):
+            data['continue'] = {'cmcontinue': str(start + api_limit), 'continue': '-||'}
+        params = get_api_params(category_title, str(start) if start else None)
+        responses[get_request_path(f'{solution.BASE_URL}/w/api.php', params)] = (
+            'application/json; charset=utf-8', json.dumps(data, ensure_ascii=False).encode('utf-8'))
+
+    write_fixture_archive(path, responses, category_title)
+
+
+CRAWL_MODES = {
+    'html': lambda base_url, fetcher: parse_all_animals('html', base_url=base_url, fetcher=fetcher),
+    'api': lambda base_url, fetcher: parse_all_animals('api', base_url=base_url, fetcher=fetcher),
+    'pipelined': lambda base_url, fetcher: parse_all_animals_pipelined(base_url=base_url, fetcher=fetcher),
+}
+
+
+def run_crawl(mode: str, base_url: str, request_rate: float, results) -> None:
+    """ Обход в отдельном процессе, чтобы пиковая память и процессорное время относились только к нему.
+        Ошибка обхода передается в results как {'error': ...}
+    """
+
+    fetcher = Fetcher(RateLimiter(rate=request_rate, burst=max(1, int(request_rate)), max_rate=request_rate),
+                      backoff=0.05, max_backoff=1.0)
+    started_times = os.times()
+    started = time.perf_counter()
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            animals_by_letter = CRAWL_MODES[mode](base_url, fetcher)
+    except Exception as e:
+        results.put({'error': f'{type(e).__name__}: {e}'})
+        return
+    wall = time.perf_counter() - started
+    times = os.times()
+
+    results.put({
+        'animals_by_letter': animals_by_letter,
+        'seconds': wall,
+        'cpu_seconds': sum(times[:4]) - sum(started_times[:4]),
+        'peak_memory_kb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        'children_peak_memory_kb': resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss,
+    })
+
+
+def wait_crawl_result(process, results, timeout: float) -> dict:
+    """ Результат run_crawl; если процесс завершился без результата или не уложился в timeout секунд,
+        возвращает {'error': ...} и не ждет дальше
+    """
+
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            return results.get(timeout=0.5)
+        except queue.Empty:
+            pass
+        if not process.is_alive():
+            # результат мог прийти одновременно с завершением процесса
+            try:
+                return results.get(timeout=0.5)
+            except queue.Empty:
+                return {'error': f'процесс обхода завершился с кодом {process.exitcode} без результата'}
+        if time.monotonic() > deadline:
+            process.terminate()
+            return {'error': f'обход не завершился за {timeout:g} с'}
+
+
+def crawl_benchmark(archive: str, modes=tuple(CRAWL_MODES), latency: float = 0.0, error_rate: float = 0.0,
+                    rate_limit: float = None, request_rate: float = 1000.0, timeout: float = 600.0) -> dict:
+    """ Обход каждым режимом через локальный сервер с записанными страницами.
+        Проверяет, что все режимы посчитали одинаково. Режим, обход которым упал или не уложился
+        в timeout секунд, получает в результатах {'error': ...}
+    """
+
+    _, responses = read_fixture_archive(archive)
+    context = multiprocessing.get_context('spawn')
+    results = {}
+    expected = None
+    for mode in modes:
+        server = ReplayServer(responses, latency=latency, error_rate=error_rate, rate_limit=rate_limit)
+        base_url = server.start()
+        crawl_results = context.Queue()
+        process = context.Process(target=run_crawl, args=(mode, base_url, request_rate, crawl_results))
+        process.start()
+        result = wait_crawl_result(process, crawl_results, timeout)
+        process.join()
+        server.stop()
+
+        if 'error' in result:
+            results[mode] = result
+            continue
+        if process.exitcode != 0:
+            results[mode] = {'error': f'процесс обхода завершился с кодом {process.exitcode}'}
+            continue
+
+        animals_by_letter = result.pop('animals_by_letter')
+        if expected is None:
+            expected = animals_by_letter
+        elif animals_by_letter != expected:
+            raise SystemExit(f'Режим "{mode}" посчитал не так, как предыдущие')
+
+        result['pages'] = server.served
+        result['pages_per_second'] = server.served / result['seconds']
+        result['cpu_ms_per_page'] = result['cpu_seconds'] / server.served * 1000
+        results[mode] = result
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Бенчмарки обхода категории')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    parse = commands.add_parser('parse', help='разбор одной страницы')
+    parse.add_argument('--fixtures', help='папка с сохраненными страницами категории (*.html)')
+    parse.add_argument('--pages', type=int, default=20, help='количество сгенерированных страниц без --fixtures')
+    parse.add_argument('--repeat', type=int, default=3)
+    parse.add_argument('--seed', type=int, default=0)
+
+    crawl = commands.add_parser('crawl', help='обход целиком через локальный сервер')
+    crawl.add_argument('--archive', help='архив replay.py record; без него генерируется категория')
+    crawl.add_argument('--pages', type=int, default=50, help='количество HTML страниц генерируемой категории')
+    crawl.add_argument('--modes', nargs='+', choices=list(CRAWL_MODES), default=list(CRAWL_MODES))
+    crawl.add_argument('--latency', type=float, default=0.0, help='задержка ответа сервера, секунды')
+    crawl.add_argument('--error-rate', type=float, default=0.0, help='доля ответов 500')
+    crawl.add_argument('--rate-limit', type=float, help='запросов в секунду, сверх - ответ 429')
+    crawl.add_argument('--request-rate', type=float, default=1000.0, help='темп запросов клиента')
+    crawl.add_argument('--timeout', type=float, default=600.0, help='предельное время обхода одним режимом, секунды')
+    args = parser.parse_args()
+
+    if args.command == 'crawl':
+        with tempfile.TemporaryDirectory() as directory:
+            archive = args.archive
+            if archive is None:
+                archive = os.path.join(directory, 'fixtures.zip')
+                generate_fixture_archive(archive, args.pages)
+            results = crawl_benchmark(archive, args.modes, args.latency, args.error_rate, args.rate_limit,
+                                      args.request_rate, args.timeout)
+        for mode, result in results.items():
+            if 'error' in result:
+                print(f'{mode:>10}: ошибка - {result["error"]}')
+                continue
+            print(f'{mode:>10}: {result["pages"]:5d} страниц, {result["pages_per_second"]:7.1f} стр/с, '
+                  f'{result["cpu_ms_per_page"]:6.2f} мс CPU/стр, память {result["peak_memory_kb"] // 1024} МБ '
+                  f'(дочерние процессы {result["children_peak_memory_kb"] // 1024} МБ)')
+        failed = [mode for mode, result in results.items() if 'error' in result]
+        if failed:
+            raise SystemExit(f'Обход не удался в режимах: {", ".join(failed)}')
+        return
+
+    if args.fixtures:
+        pages = load_fixture_pages(args.fixtures)
+    else:
+        rng = random.Random(args.seed)
+        pages = [make_fixture_page(rng) for _ in range(args.pages)]
+    if not pages:
+        raise SystemExit('Нет страниц для замера')
+
+    results = benchmark(pages, args.repeat)
+    baseline = results['full html.parser']
+    print(f'Страниц: {len(pages)}, средний размер {sum(map(len, pages)) // len(pages) // 1024} КБ')
+    for name, milliseconds in results.items():
+        print(f'{name:>18}: {milliseconds:7.2f} мс на страницу (x{baseline / milliseconds:.1f})')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,209 @@
+""" Запись страниц категории в сжатый архив и локальный сервер, который отдает их вместо Википедии
+    с настраиваемой задержкой, ошибками и ограничением частоты запросов.
+    Запись:  python replay.py record --output fixtures.zip [--source html api]
+    Сервер:  python replay.py serve fixtures.zip --port 8080 --latency 0.2 --error-rate 0.05 --rate-limit 10
+    После этого base_url для функций solution - http://127.0.0.1:8080
+"""
+
+import argparse
+import json
+import random
+import threading
+import time
+import zipfile
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+
+from solution import BASE_URL, CATEGORY_TITLE, SOURCES, Fetcher
+
+INDEX_NAME = 'index.json'
+
+
+def get_request_path(url: str, params: dict = None) -> str:
+    """ Путь с параметрами в том виде, в котором его отправит requests (ключ ответа в архиве) """
+
+    return requests.Request('GET', url, params=params).prepare().path_url
+
+
+class RecordingFetcher(Fetcher):
+    """ Fetcher, который запоминает все успешные ответы для записи в архив """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.responses = {}
+        self._lock = threading.Lock()
+
+    def get(self, url: str, params: dict = None) -> requests.Response:
+        response = super().get(url, params)
+        with self._lock:
+            self.responses[response.request.path_url] = (response.headers.get('Content-Type', ''), response.content)
+        return response
+
+
+def write_fixture_archive(path: str, responses: dict, category_title: str = CATEGORY_TITLE) -> None:
+    """ Сохраняет ответы {путь запроса: (Content-Type, тело)} в zip архив со сжатием """
+
+    index = {'category_title': category_title, 'responses': {}}
+    with zipfile.ZipFile(path, 'w', compression=zipfile.ZIP_DEFLATED) as archive:
+        for number, (request_path, (content_type, body)) in enumerate(sorted(responses.items())):
+            name = f'responses/{number:06d}'
+            archive.writestr(name, body)
+            index['responses'][request_path] = {'name': name, 'content_type': content_type}
+        archive.writestr(INDEX_NAME, json.dumps(index, ensure_ascii=False, indent=1))
+
+
+def read_fixture_archive(path: str) -> tuple:
+    """ (название категории, {путь запроса: (Content-Type, тело)}) из архива """
+
+    with zipfile.ZipFile(path) as archive:
+        index = json.loads(archive.read(INDEX_NAME))
+        responses = {request_path: (entry['content_type'], archive.read(entry['name']))
+                     for request_path, entry in index['responses'].items()}
+    return index['category_title'], responses
+
+
+def record_fixtures(path: str, sources=('html', 'api'), category_title: str = CATEGORY_TITLE,
+                    base_url: str = BASE_URL, fetcher: RecordingFetcher = None) -> int:
+    """ Обходит категорию выбранными источниками и записывает все полученные страницы в архив.
+        Возвращает количество записанных ответов
+    """
+
+    fetcher = fetcher or RecordingFetcher()
+    for source in sources:
+        for _ in SOURCES[source](category_title, base_url, fetcher):
+            pass
+    write_fixture_archive(path, fetcher.responses, category_title)
+    return len(fetcher.responses)
+
+
+class ReplayServer(ThreadingHTTPServer):
+    """ HTTP сервер, отдающий записанные ответы по пути запроса.
+        latency - задержка каждого ответа (секунды), error_rate - доля ответов 500,
+        rate_limit - не больше запросов в секунду, сверх него ответ 429 с Retry-After.
+        served - количество отданных страниц (ответов 200)
+    """
+
+    daemon_threads = True
+
+    def __init__(self, responses: dict, address=('127.0.0.1', 0), latency: float = 0.0, error_rate: float = 0.0,
+                 rate_limit: float = None, seed: int = 0):
+        super().__init__(address, ReplayHandler)
+        self.responses = responses
+        self.latency = latency
+        self.error_rate = error_rate
+        self.rate_limit = rate_limit
+        self.served = 0
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._window_start = time.monotonic()
+        self._window_requests = 0
+
+    @classmethod
+    def from_archive(cls, path: str, **kwargs) -> 'ReplayServer':
+        _, responses = read_fixture_archive(path)
+        return cls(responses, **kwargs)
+
+    @property
+    def base_url(self) -> str:
+        return f'http://{self.server_address[0]}:{self.server_address[1]}'
+
+    def start(self) -> str:
+        """ Запускает сервер в фоновом потоке и возвращает его base_url """
+
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self.base_url
+
+    def stop(self) -> None:
+        self.shutdown()
+        self.server_close()
+
+    def choose_status(self) -> int:
+        """ Статус очередного ответа с учетом ограничения частоты и доли ошибок """
+
+        with self._lock:
+            if self.rate_limit is not None:
+                now = time.monotonic()
+                if now - self._window_start >= 1:
+                    self._window_start = now
+                    self._window_requests = 0
+                self._window_requests += 1
+                if self._window_requests > self.rate_limit:
+                    return 429
+            if self.error_rate and self._random.random() < self.error_rate:
+                return 500
+            return 200
+
+
+class ReplayHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    # заголовки и тело уходят отдельными записями - без этого keep-alive ждет задержанного ACK
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        server = self.server
+        if server.latency:
+            time.sleep(server.latency)
+
+        response = server.responses.get(self.path)
+        if response is None:
+            self.send_body(404, 'text/plain; charset=utf-8', f'Нет записанного ответа для {self.path}'.encode('utf-8'))
+            return
+
+        status = server.choose_status()
+        if status == 429:
+            self.send_body(429, 'text/plain; charset=utf-8', b'', {'Retry-After': '1'})
+        elif status == 500:
+            self.send_body(500, 'text/plain; charset=utf-8', b'')
+        else:
+            with server._lock:
+                server.served += 1
+            self.send_body(200, *response)
+
+    def send_body(self, status: int, content_type: str, body: bytes, headers: dict = None) -> None:
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Запись и воспроизведение страниц категории')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    record = commands.add_parser('record', help='записать страницы категории в архив')
+    record.add_argument('--output', default='fixtures.zip')
+    record.add_argument('--source', nargs='+', choices=sorted(SOURCES), default=['html', 'api'])
+    record.add_argument('--category', default=CATEGORY_TITLE)
+    record.add_argument('--base-url', default=BASE_URL)
+
+    serve = commands.add_parser('serve', help='отдавать записанные страницы')
+    serve.add_argument('archive')
+    serve.add_argument('--port', type=int, default=8080)
+    serve.add_argument('--latency', type=float, default=0.0)
+    serve.add_argument('--error-rate', type=float, default=0.0)
+    serve.add_argument('--rate-limit', type=float)
+    args = parser.parse_args()
+
+    if args.command == 'record':
+        count = record_fixtures(args.output, args.source, args.category, args.base_url)
+        print(f'Записано ответов: {count} в файл {args.output}')
+    else:
+        server = ReplayServer.from_archive(args.archive, address=('127.0.0.1', args.port), latency=args.latency,
+                                          error_rate=args.error_rate, rate_limit=args.rate_limit)
+        print(f'Сервер запущен: {server.base_url}')
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            server.server_close()
+
+
+if __name__ == '__main__':
+    main()
@@ -1,12 +1,68 @@
+import argparse
+import contextlib
 import csv
+import hashlib
+import html
+import json
+import os
+import queue
+import random
+import re
 import requests
+import sys
+import threading
 import time
+import unicodedata
 
-from bs4 import BeautifulSoup
+from bs4 import BeautifulSoup, SoupStrainer
 from bs4.element import Tag
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from email.utils import parsedate_to_datetime
+from requests.adapters import HTTPAdapter
+from urllib.parse import quote_plus, unquote, urlsplit
+
+try:
+    import lxml
+except ImportError:
+    lxml = None
 
 BASE_URL = 'https://ru.wikipedia.org'
-START_URL = BASE_URL + '/wiki/Категория:Животные_по_алфавиту'
+CATEGORY_TITLE = 'Категория:Животные_по_алфавиту'
+START_URL = BASE_URL + '/wiki/' + CATEGORY_TITLE
+RESULTS_FILENAME = 'beasts.csv'
+USER_AGENT = 'test_solution-animals-counter/1.0 (python-requests)'
+
+# Темп запросов: начальный, минимальный и максимальный (запросов в секунду), запас токенов
+REQUEST_RATE = 4.0
+MIN_REQUEST_RATE = 0.5
+MAX_REQUEST_RATE = 20.0
+REQUEST_BURST = 4
+# Повторы при ошибках: количество, начальная и максимальная пауза экспоненциальной задержки (секунды)
+MAX_RETRIES = 5
+RETRY_BACKOFF = 0.5
+MAX_RETRY_BACKOFF = 30.0
+# Разбор страниц в режиме fast: только блок #mw-pages, через lxml, если он установлен
+FAST_HTML_PARSER = 'lxml' if lxml is not None else 'html.parser'
+MW_PAGES_STRAINER = SoupStrainer('div', id='mw-pages')
+# Ссылка на следующую страницу в сыром HTML - чтобы начать ее загрузку, не дожидаясь разбора
+NEXT_PAGE_RE = re.compile(r'<a href="([^"]+)"[^>]*>Следующая страница</a>'.encode('utf-8'))
+# Размер очереди загруженных, но еще не разобранных страниц в конвейере
+PIPELINE_QUEUE_SIZE = 8
+# Файл с результатами по страницам для инкрементального пересчета и папка кэша ответов для main()
+PAGES_STATE_PATH = 'beasts.pages.json'
+CACHE_DIR = '.beasts_cache'
+# Сколько секунд ответ без ETag и Last-Modified (ответы API) берется из кэша main() без запроса
+CACHE_MAX_AGE = 3600
+# Параметр maxlag API: сервер просит подождать, если отставание реплик больше указанного (секунды)
+API_MAXLAG = 5
+
+# Начала шардов для параллельного обхода: страница категории открывается с указанной позиции (pagefrom)
+SHARD_KEYS = tuple('АБВГДЕЖЗИЙКЛМНОПРСТУФХЦЧШЩЭЮЯ') + tuple('ABCDEFGHIJKLMNOPQRSTUVWXYZ')
+SHARD_CONCURRENCY = 8
+# Буквы с диакритикой, которые сортировка категорий Википедии выносит в отдельные заголовки;
+# остальные (Ё, É, ...) попадают под букву без диакритики
+COLLATION_SEPARATE_LETTERS = frozenset('Й')
 
 
 def process_category_group(category_group: Tag) -> dict:
@@ -62,6 +118,71 @@ def get_animals_from_page(soup: BeautifulSoup) -> dict:
     return animals_by_letter
 
 
+def get_entries_from_page(soup: BeautifulSoup) -> list:
+    """ Возвращает записи страницы (буква, название) в порядке следования, без подкатегорий """
+
+    entries = []
+    for category_group in soup.find_all('div', {'class': 'mw-category-group'}):
+        if category_group.find_parent('div', {'id': 'mw-subcategories'}):
+            continue
+
+        for h3_element in category_group.find_all('h3'):
+            letter = h3_element.text.strip()[0].upper() if h3_element.text.strip() else None
+            ul_element = h3_element.find_next('ul')
+            if not letter or not ul_element:
+                continue
+            entries.extend((letter, li_element.get_text(strip=True)) for li_element in ul_element.find_all('li'))
+
+    return entries
+
+
+def parse_page(content: bytes, parse_mode: str = 'full') -> BeautifulSoup:
+    """ Разбор HTML страницы. В режиме fast строится дерево только для блока #mw-pages
+        (список записей и ссылки на соседние страницы), остальная страница пропускается
+    """
+
+    if parse_mode == 'fast':
+        # шапка, меню и подкатегории идут раньше блока #mw-pages, а подвал - после printfooter,
+        # их не нужно даже токенизировать
+        position = content.find(b'id="mw-pages"')
+        if position != -1:
+            end = content.find(b'<div class="printfooter"', position)
+            content = content[max(content.rfind(b'<div', 0, position), 0):end if end != -1 else None]
+        return BeautifulSoup(content, FAST_HTML_PARSER, parse_only=MW_PAGES_STRAINER)
+    return BeautifulSoup(content, 'html.parser')
+
+
+def get_entries_fast(soup: BeautifulSoup) -> list:
+    """ Записи (буква, название) страницы, разобранной в режиме fast: один проход по h3 и li
+        в порядке документа, без поиска родителей и следующих элементов.
+        Подкатегорий в блоке #mw-pages нет, поэтому фильтровать их не нужно
+    """
+
+    entries = []
+    letter = None
+    for element in soup.find_all(('h3', 'li')):
+        if element.name == 'h3':
+            text = element.get_text(strip=True)
+            letter = text[0].upper() if text else None
+        elif letter:
+            entries.append((letter, element.get_text(strip=True)))
+    return entries
+
+
+def get_animals_from_page_fast(soup: BeautifulSoup) -> dict:
+    """ Количество животных по буквам для страницы, разобранной в режиме fast """
+
+    animals_by_letter = {}
+    letter = None
+    for element in soup.find_all(('h3', 'li')):
+        if element.name == 'h3':
+            text = element.get_text(strip=True)
+            letter = text[0].upper() if text else None
+        elif letter:
+            animals_by_letter[letter] = animals_by_letter.get(letter, 0) + 1
+    return animals_by_letter
+
+
 def get_next_page_url(soup: BeautifulSoup) -> str or None:
     """ Парсинг URL следующей страницы из объекта """
 
@@ -70,12 +191,11 @@ def get_next_page_url(soup: BeautifulSoup) -> str or None:
         return next_page_link.get('href')
 
 
-def write_results_to_csv(animals_by_letter: dict) -> None:
+def write_results_to_csv(animals_by_letter: dict, filename: str = RESULTS_FILENAME) -> None:
     """ Записывает данные из словаря в файл CSV.
         Если файла нет, то создаст его, если есть, то перезапишет
     """
 
-    filename = 'beasts.csv'
     with open(filename, 'w', newline='', encoding='utf-8') as csvfile:
         writer = csv.writer(csvfile)
         for letter, count in sorted(animals_by_letter.items()):
@@ -83,45 +203,770 @@ def write_results_to_csv(animals_by_letter: dict) -> None:
     print(f'Данные записаны в файл {filename}')
 
 
-def parse_all_animals() -> dict:
+class RateLimiter:
+    """ Потокобезопасное ведро токенов с адаптивным темпом: каждый успешный ответ немного увеличивает темп,
+        ответ "слишком много запросов" уменьшает его вдвое и приостанавливает запросы на Retry-After
+    """
+
+    def __init__(self, rate: float = REQUEST_RATE, burst: int = REQUEST_BURST,
+                 min_rate: float = MIN_REQUEST_RATE, max_rate: float = MAX_REQUEST_RATE):
+        self.rate = rate
+        self.burst = burst
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self._tokens = float(burst)
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = threading.Lock()
+
+    def acquire(self) -> None:
+        """ Ждет, пока можно сделать очередной запрос """
+
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if now >= self._paused_until and self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = max(self._paused_until - now, (1 - self._tokens) / self.rate)
+            time.sleep(wait)
+
+    def on_success(self) -> None:
+        with self._lock:
+            self.rate = min(self.max_rate, self.rate + 0.1)
+
+    def on_throttle(self, retry_after: float) -> None:
+        with self._lock:
+            self.rate = max(self.min_rate, self.rate / 2)
+            self._tokens = 0.0
+            self._paused_until = max(self._paused_until, time.monotonic() + retry_after)
+
+
+def parse_retry_after(value: str or None) -> float or None:
+    """ Значение заголовка Retry-After в секундах (число секунд или HTTP дата) """
+
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+class ResponseCache:
+    """ Кэш ответов на диске по URL. Для ответов с ETag/Last-Modified (HTML страницы) Fetcher отправляет их
+        в If-None-Match/If-Modified-Since, и на ответ 304 тело берется из кэша без повторной загрузки.
+        Ответы API таких заголовков не содержат, их проверить нечем: с max_age они хранятся как есть
+        и отдаются без запроса, пока им не больше max_age секунд, без max_age не кэшируются
+    """
+
+    def __init__(self, directory: str = CACHE_DIR, max_age: float = None):
+        self.directory = directory
+        self.max_age = max_age
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, url: str) -> str:
+        return os.path.join(self.directory, hashlib.sha256(url.encode('utf-8')).hexdigest())
+
+    def _read_meta(self, url: str) -> dict or None:
+        try:
+            with open(self._path(url) + '.json', encoding='utf-8') as meta_file:
+                return json.load(meta_file)
+        except (OSError, ValueError):
+            return None
+
+    def validators(self, url: str) -> dict:
+        """ Заголовки условного запроса для url (пустой словарь, если ответа нет в кэше) """
+
+        meta = self._read_meta(url) or {}
+        headers = {}
+        if meta.get('etag'):
+            headers['If-None-Match'] = meta['etag']
+        if meta.get('last_modified'):
+            headers['If-Modified-Since'] = meta['last_modified']
+        return headers
+
+    def fresh(self, url: str) -> requests.Response or None:
+        """ Сохраненный ответ без ETag и Last-Modified, если ему еще нет max_age секунд, иначе None """
+
+        meta = self._read_meta(url)
+        if self.max_age is None or meta is None or meta.get('etag') or meta.get('last_modified'):
+            return None
+        if time.time() - meta.get('stored_at', 0) >= self.max_age:
+            return None
+        try:
+            return self.load(url)
+        except OSError:
+            return None
+
+    def load(self, url: str) -> requests.Response:
+        """ Сохраненный ответ как requests.Response со статусом 200 """
+
+        path = self._path(url)
+        with open(path + '.json', encoding='utf-8') as meta_file:
+            meta = json.load(meta_file)
+        with open(path + '.body', 'rb') as body_file:
+            body = body_file.read()
+
+        response = requests.Response()
+        response.status_code = 200
+        response.url = url
+        response.headers.update(meta['headers'])
+        response._content = body
+        return response
+
+    def store(self, url: str, response: requests.Response) -> None:
+        """ Сохраняет ответ с ETag или Last-Modified, а с max_age - и ответ без них.
+            Ошибки API (приходят с кодом 200) не сохраняются
+        """
+
+        etag = response.headers.get('ETag')
+        last_modified = response.headers.get('Last-Modified')
+        if not etag and not last_modified:
+            if self.max_age is None:
+                return
+            if 'MediaWiki-API-Error' in response.headers or response.content.lstrip().startswith(b'{"error"'):
+                return
+        meta = {'url': url, 'etag': etag, 'last_modified': last_modified, 'stored_at': time.time(),
+                'headers': {'Content-Type': response.headers.get('Content-Type', '')}}
+        # тело пишется раньше метаданных, а оба файла заменяются атомарно,
+        # поэтому оборванная запись не оставит метаданные без тела
+        path = self._path(url)
+        write_atomic(path + '.body', response.content)
+        write_atomic(path + '.json', json.dumps(meta, ensure_ascii=False).encode('utf-8'))
+
+
+def write_atomic(path: str, data: bytes) -> None:
+    """ Записывает файл через временный и os.replace, чтобы не оставить его наполовину записанным """
+
+    temp_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+    with open(temp_path, 'wb') as temp_file:
+        temp_file.write(data)
+    os.replace(temp_path, path)
+
+
+class Fetcher:
+    """ Загрузка страниц через общий requests.Session (keep-alive и пул соединений) с ограничением темпа
+        и повторами. Ответы 429/503 и ошибка maxlag API учитывают Retry-After, сетевые ошибки и 5xx
+        повторяются с экспоненциальной задержкой. Если повторы закончились, бросается исключение,
+        чтобы обход не завершался молча с неполным результатом. С cache (ResponseCache) запросы страниц
+        с ETag/Last-Modified становятся условными, и неизменившиеся страницы не загружаются повторно,
+        а ответы без них берутся из кэша без запроса, пока не истек max_age кэша
+    """
+
+    def __init__(self, limiter: RateLimiter = None, max_retries: int = MAX_RETRIES,
+                 backoff: float = RETRY_BACKOFF, max_backoff: float = MAX_RETRY_BACKOFF, pool_size: int = 16,
+                 cache: ResponseCache = None):
+        self.limiter = limiter or RateLimiter()
+        self.cache = cache
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.session = requests.Session()
+        self.session.headers['User-Agent'] = USER_AGENT
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+
+    def _backoff_delay(self, attempt: int) -> float:
+        return min(self.max_backoff, self.backoff * 2 ** attempt) * random.uniform(0.5, 1.0)
+
+    def get(self, url: str, params: dict = None) -> requests.Response:
+        """ GET с повторами; для ответов API дополнительно проверяется ошибка maxlag """
+
+        headers = {}
+        if self.cache is not None:
+            url = requests.Request('GET', url, params=params).prepare().url
+            params = None
+            cached = self.cache.fresh(url)
+            if cached is not None:
+                return cached
+            headers = self.cache.validators(url)
+
+        for attempt in range(self.max_retries + 1):
+            self.limiter.acquire()
+            try:
+                response = self.session.get(url, params=params, headers=headers, timeout=30)
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+                error = e
+                time.sleep(self._backoff_delay(attempt))
+                continue
+
+            retry_after = parse_retry_after(response.headers.get('Retry-After'))
+            if response.status_code in (429, 503) or self._is_maxlag(response):
+                error = requests.exceptions.HTTPError(f'{response.status_code} {response.reason}', response=response)
+                self.limiter.on_throttle(retry_after if retry_after is not None else self._backoff_delay(attempt))
+                continue
+            if response.status_code >= 500:
+                error = requests.exceptions.HTTPError(f'{response.status_code} {response.reason}', response=response)
+                time.sleep(self._backoff_delay(attempt))
+                continue
+
+            if response.status_code == 304 and headers:
+                self.limiter.on_success()
+                return self.cache.load(url)
+
+            response.raise_for_status()
+            self.limiter.on_success()
+            if self.cache is not None:
+                self.cache.store(url, response)
+            return response
+
+        raise requests.exceptions.RetryError(f'Не удалось загрузить {url} за {self.max_retries + 1} попыток: {error}')
+
+    @staticmethod
+    def _is_maxlag(response: requests.Response) -> bool:
+        """ Ошибка maxlag: MediaWiki помечает ее заголовком MediaWiki-API-Error. Без заголовка тело
+            декодируется, только если в нем вообще есть maxlag, чтобы обычные ответы API не разбирались дважды
+        """
+
+        if response.headers.get('MediaWiki-API-Error') == 'maxlag':
+            return True
+        if 'json' not in response.headers.get('Content-Type', '') or b'maxlag' not in response.content:
+            return False
+        try:
+            return response.json().get('error', {}).get('code') == 'maxlag'
+        except ValueError:
+            return False
+
+
+_default_fetcher = None
+
+
+def get_default_fetcher() -> Fetcher:
+    """ Общий загрузчик процесса, чтобы все запросы переиспользовали соединения """
+
+    global _default_fetcher
+    if _default_fetcher is None:
+        _default_fetcher = Fetcher()
+    return _default_fetcher
+
+
+def fetch_page(url: str, fetcher: Fetcher = None, parse_mode: str = 'full') -> BeautifulSoup:
+    """ Загружает страницу и возвращает ее разобранной (см. parse_page) """
+
+    response = (fetcher or get_default_fetcher()).get(url)
+    return parse_page(response.content, parse_mode)
+
+
+def get_category_url(category_title: str = CATEGORY_TITLE, base_url: str = BASE_URL) -> str:
+    """ URL первой страницы категории """
+
+    return f'{base_url}/wiki/{category_title}'
+
+
+def get_collation_letter(text: str) -> str:
+    """ Буква заголовка категории для текста: первая буква в верхнем регистре без диакритических знаков
+        (NFD без combining символов: Ё -> Е, É -> E), кроме букв из COLLATION_SEPARATE_LETTERS
+    """
+
+    letter = text.strip()[:1].upper()
+    if letter in COLLATION_SEPARATE_LETTERS:
+        return letter
+    return ''.join(char for char in unicodedata.normalize('NFD', letter) if not unicodedata.combining(char)) or letter
+
+
+def get_api_letter(member: dict) -> str:
+    """ Буква записи из ответа API: первая буква ключа сортировки, сведенная так же,
+        как в заголовках HTML страницы (см. get_collation_letter)
+    """
+
+    return get_collation_letter(member.get('sortkeyprefix') or member['title'])
+
+
+def get_api_params(category_title: str = CATEGORY_TITLE, cursor: str = None) -> dict:
+    """ Параметры запроса list=categorymembers: до 500 записей, продолжение с cmcontinue = cursor """
+
+    params = {
+        'action': 'query',
+        'list': 'categorymembers',
+        'cmtitle': category_title,
+        'cmtype': 'page',
+        'cmprop': 'title|sortkeyprefix',
+        'cmlimit': 'max',
+        'format': 'json',
+        'formatversion': '2',
+        'maxlag': API_MAXLAG,
+    }
+    if cursor:
+        params['cmcontinue'] = cursor
+    return params
+
+
+def fetch_source_page(source: str, cursor: str = None, category_title: str = CATEGORY_TITLE,
+                      base_url: str = BASE_URL, fetcher: Fetcher = None) -> bytes:
+    """ Сырое содержимое страницы источника, начинающейся с курсора (None - первая страница) """
+
+    fetcher = fetcher or get_default_fetcher()
+    if source == 'html':
+        return fetcher.get(base_url + cursor if cursor else get_category_url(category_title, base_url)).content
+    return fetcher.get(f'{base_url}/w/api.php', params=get_api_params(category_title, cursor)).content
+
+
+def parse_source_page(source: str, content: bytes) -> tuple:
+    """ Разбор страницы источника: (записи (буква, название), курсор следующей страницы или None) """
+
+    if source == 'html':
+        soup = parse_page(content, 'fast')
+        return get_entries_fast(soup), get_next_page_url(soup)
+
+    data = json.loads(content)
+    if 'error' in data:
+        # кроме maxlag (его повторяет Fetcher) ошибки API приходят с кодом 200, и без исключения
+        # страница с ошибкой выглядела бы как пустая последняя страница категории
+        error = data['error']
+        raise RuntimeError(f'Ошибка API {error.get("code")}: {error.get("info", "")}')
+    members = data.get('query', {}).get('categorymembers', [])
+    return ([(get_api_letter(member), member['title']) for member in members],
+            data.get('continue', {}).get('cmcontinue'))
+
+
+def iter_source_pages(source: str, category_title: str = CATEGORY_TITLE, base_url: str = BASE_URL,
+                      fetcher: Fetcher = None, cursor: str = None):
+    """ Выдает (записи страницы, курсор следующей страницы) для всех страниц источника, начиная с cursor """
+
+    while True:
+        entries, next_cursor = parse_source_page(source, fetch_source_page(source, cursor, category_title,
+                                                                           base_url, fetcher))
+        yield entries, next_cursor
+
+        if not next_cursor:
+            break
+        cursor = next_cursor
+
+
+def iter_html_pages(category_title: str = CATEGORY_TITLE, base_url: str = BASE_URL, fetcher: Fetcher = None,
+                    cursor: str = None):
+    """ Источник записей из HTML страниц категории: для каждой страницы выдает (записи (буква, название),
+        курсор следующей страницы), переходя по ссылкам "Следующая страница" (около 200 записей на запрос).
+        Курсор - относительная ссылка на следующую страницу, None после последней; с cursor обход
+        начинается с этой страницы. Страницы разбираются в режиме fast
+    """
+
+    return iter_source_pages('html', category_title, base_url, fetcher, cursor)
+
+
+def iter_api_pages(category_title: str = CATEGORY_TITLE, base_url: str = BASE_URL, fetcher: Fetcher = None,
+                   cursor: str = None):
+    """ Источник записей из MediaWiki API (list=categorymembers): до 500 записей на запрос в JSON
+        с продолжением через cmcontinue, без разбора HTML. Курсор - значение cmcontinue
+    """
+
+    return iter_source_pages('api', category_title, base_url, fetcher, cursor)
+
+
+# Источники записей категории: функция (category_title, base_url, fetcher, cursor) ->
+# генератор пар (записи страницы, курсор следующей страницы)
+SOURCES = {
+    'html': iter_html_pages,
+    'api': iter_api_pages,
+}
+# API делает в 2.5 раза меньше запросов и не требует разбора HTML
+DEFAULT_SOURCE = 'api'
+
+
+def count_animals(pages, animals_by_letter: dict = None, on_page=None) -> dict:
+    """ Считает записи по буквам для потока страниц из любого источника, продолжая счет animals_by_letter.
+        После каждой страницы вызывается on_page(курсор следующей страницы, текущий подсчет).
+        Ошибка загрузки (после всех повторов Fetcher) выводится и пробрасывается дальше,
+        чтобы неполный результат не был записан как полный
+    """
+
+    animals_by_letter = {} if animals_by_letter is None else animals_by_letter
+    count_page = 0
+    print('Старт обработки...')
+
+    try:
+        for entries, next_cursor in pages:
+            count_page += 1
+            if count_page % 50 == 0:
+                print(f'Продолжается обработка, текущая страница: {count_page}')
+
+            for letter, _ in entries:
+                animals_by_letter[letter] = animals_by_letter.get(letter, 0) + 1
+            if on_page is not None:
+                on_page(next_cursor, animals_by_letter)
+
+    except requests.exceptions.RequestException as e:
+        print(f'Ошибка при запросе страницы {count_page + 1}: {e}')
+        raise
+    except Exception as e:
+        print(f'Непредвиденная ошибка: {e}')
+        raise
+
+    # Просто чтобы было понятно что программа работает
+    print(f'Обработано {count_page} страниц')
+    return animals_by_letter
+
+
+def load_checkpoint(path: str, source: str, category_title: str, base_url: str) -> dict or None:
+    """ Контрольная точка обхода, если она есть и относится к тому же источнику и категории """
+
+    try:
+        with open(path, encoding='utf-8') as checkpoint_file:
+            checkpoint = json.load(checkpoint_file)
+    except FileNotFoundError:
+        return None
+    except ValueError:
+        print(f'Контрольная точка {path} повреждена, обход начнется сначала')
+        return None
+
+    if (checkpoint.get('source'), checkpoint.get('category_title'), checkpoint.get('base_url')) != \
+            (source, category_title, base_url):
+        print(f'Контрольная точка {path} от другого обхода, обход начнется сначала')
+        return None
+    return checkpoint
+
+
+def save_checkpoint(path: str, checkpoint: dict) -> None:
+    write_atomic(path, json.dumps(checkpoint, ensure_ascii=False).encode('utf-8'))
+
+
+def parse_all_animals(source: str = DEFAULT_SOURCE, category_title: str = CATEGORY_TITLE,
+                      base_url: str = BASE_URL, fetcher: Fetcher = None, checkpoint_path: str = None) -> dict:
     """ Собирает словарь с количеством животных по всем буквам
-        со всех необходимых страниц
+        со всех необходимых страниц выбранного источника (SOURCES).
+        С checkpoint_path после каждой страницы сохраняются курсор и текущий подсчет,
+        повторный запуск после ошибки продолжает с сохраненного места. После успешного обхода
+        контрольная точка удаляется
+    """
+
+    if checkpoint_path is None:
+        return count_animals(SOURCES[source](category_title, base_url, fetcher))
+
+    checkpoint = load_checkpoint(checkpoint_path, source, category_title, base_url)
+    if checkpoint is None:
+        checkpoint = {'source': source, 'category_title': category_title, 'base_url': base_url,
+                      'cursor': None, 'pages': 0, 'animals_by_letter': {}}
+    elif checkpoint['cursor'] is None:
+        # обход уже дошел до последней страницы, но контрольная точка не успела удалиться
+        os.remove(checkpoint_path)
+        return checkpoint['animals_by_letter']
+    else:
+        print(f'Продолжение обхода после {checkpoint["pages"]} страниц')
+
+    def on_page(next_cursor, animals_by_letter):
+        checkpoint['cursor'] = next_cursor
+        checkpoint['pages'] += 1
+        checkpoint['animals_by_letter'] = animals_by_letter
+        save_checkpoint(checkpoint_path, checkpoint)
+
+    pages = SOURCES[source](category_title, base_url, fetcher, checkpoint['cursor'])
+    animals_by_letter = count_animals(pages, dict(checkpoint['animals_by_letter']), on_page)
+    os.remove(checkpoint_path)
+    return animals_by_letter
+
+
+def get_page_fingerprint(source: str, content: bytes) -> str:
+    """ Хэш содержимого страницы источника без разбора. Для HTML берется только список записей
+        блока #mw-pages: строка "Показано N страниц из M" и остальная страница меняются
+        при любой правке категории или сайта и не влияют на подсчет
+    """
+
+    if source == 'html':
+        position = content.find(b'id="mw-pages"')
+        if position != -1:
+            start = content.find(b'<div class="mw-category', position)
+            end = content.find(b'<div class="printfooter"', position)
+            content = content[start if start != -1 else position:end if end != -1 else None]
+    return hashlib.sha256(content).hexdigest()
+
+
+def load_pages_state(path: str, source: str, category_title: str, base_url: str) -> dict or None:
+    """ Сохраненные результаты по страницам, если они относятся к тому же источнику и категории """
+
+    try:
+        with open(path, encoding='utf-8') as state_file:
+            state = json.load(state_file)
+    except (OSError, ValueError):
+        return None
+    if (state.get('source'), state.get('category_title'), state.get('base_url')) != \
+            (source, category_title, base_url):
+        return None
+    return state
+
+
+def refresh_animals(state_path: str = PAGES_STATE_PATH, source: str = DEFAULT_SOURCE,
+                    category_title: str = CATEGORY_TITLE, base_url: str = BASE_URL, fetcher: Fetcher = None) -> dict:
+    """ Инкрементальный пересчет по сохраненным в state_path результатам страниц.
+        Категория делится на отрезки по курсорам страниц прошлого обхода, и каждый отрезок загружается
+        по своему курсору. Каждая страница запрашивается при каждом пересчете: с ResponseCache в fetcher
+        неизменившиеся HTML страницы не скачиваются (ответ 304), а страницы API, у которых нет ETag,
+        берутся из кэша только пока не истек его max_age, после этого скачиваются заново.
+        Отрезок - записи его страницы до первой записи следующего отрезка (stop_title), поэтому вставка
+        или удаление записей меняет только свой отрезок, а остальные остаются выровненными по курсорам.
+        Страница разбирается заново, только если изменился хэш ее содержимого
+        или первая запись следующего отрезка; итог поправляется на разницу старого и нового подсчета.
+        Если записи отрезка больше не помещаются на его страницу, курсор следующей страницы
+        становится новым отрезком. Без сохраненных результатов выполняется полный обход.
+        Результаты сохраняются после каждого отрезка, поэтому прерванный обход продолжается
+        с места остановки: обработанные отрезки не разбираются заново
+    """
+
+    state = load_pages_state(state_path, source, category_title, base_url)
+    old_pages = {page['cursor']: page for page in state['pages']} if state else {}
+    cursors = [page['cursor'] for page in state['pages']] if state else [None]
+    animals_by_letter = dict(state['animals_by_letter']) if state else {}
+
+    def load(cursor: str) -> dict:
+        content = fetch_source_page(source, cursor, category_title, base_url, fetcher)
+        return {'cursor': cursor, 'content': content, 'hash': get_page_fingerprint(source, content), 'parsed': None}
+
+    def parse(page: dict) -> tuple:
+        if page['parsed'] is None:
+            page['parsed'] = parse_source_page(source, page['content'])
+        return page['parsed']
+
+    def first_title(page: dict) -> str or None:
+        old_page = old_pages.get(page['cursor'])
+        if old_page is not None and old_page['hash'] == page['hash']:
+            return old_page['first_title']
+        entries, _ = parse(page)
+        return entries[0][1] if entries else None
+
+    def adjust(counts: dict, sign: int) -> None:
+        for letter, count in counts.items():
+            animals_by_letter[letter] = animals_by_letter.get(letter, 0) + sign * count
+            if not animals_by_letter[letter]:
+                del animals_by_letter[letter]
+
+    def save_state(processed: int) -> None:
+        # еще не обработанные отрезки сохраняются со старыми результатами - они уже входят в итог
+        pages = new_pages + [old_pages[cursor] for cursor in cursors[processed:] if cursor in old_pages]
+        write_atomic(state_path, json.dumps({'source': source, 'category_title': category_title, 'base_url': base_url,
+                                             'animals_by_letter': animals_by_letter, 'pages': pages},
+                                            ensure_ascii=False).encode('utf-8'))
+
+    print('Старт обработки...')
+    new_pages = []
+    reparsed = 0
+    index = 0
+    page = load(cursors[0])
+    while index < len(cursors):
+        following = load(cursors[index + 1]) if index + 1 < len(cursors) else None
+        stop_title = first_title(following) if following is not None else None
+
+        old_page = old_pages.pop(page['cursor'], None)
+        if old_page is not None and old_page['hash'] == page['hash'] and old_page['stop_title'] == stop_title:
+            new_pages.append(old_page)
+        else:
+            reparsed += 1
+            entries, next_cursor = parse(page)
+            counts = {}
+            for letter, title in entries:
+                if title == stop_title:
+                    break
+                counts[letter] = counts.get(letter, 0) + 1
+            else:
+                # до начала следующего отрезка не дошли - продолжение отрезка становится новым отрезком,
+                # если только следующая страница не начинается ровно с начала следующего отрезка
+                if next_cursor and (following is None or next_cursor != following['cursor']):
+                    continuation = load(next_cursor)
+                    continuation_title = first_title(continuation)
+                    if following is None or continuation_title != stop_title:
+                        cursors.insert(index + 1, next_cursor)
+                        following = continuation
+                        stop_title = continuation_title
+
+            if old_page is not None:
+                adjust(old_page['animals_by_letter'], -1)
+            adjust(counts, 1)
+            new_pages.append({'cursor': page['cursor'], 'hash': page['hash'],
+                              'first_title': entries[0][1] if entries else None,
+                              'stop_title': stop_title, 'animals_by_letter': counts})
+            save_state(index + 1)
+
+        page = following
+        index += 1
+
+    # отрезки, которых больше нет в обходе
+    for old_page in old_pages.values():
+        adjust(old_page['animals_by_letter'], -1)
+
+    save_state(len(cursors))
+    print(f'Обработано {len(new_pages)} страниц, разобрано заново: {reparsed}')
+    return animals_by_letter
+
+
+def get_shard_url(shard_key: str, category_title: str = CATEGORY_TITLE, base_url: str = BASE_URL) -> str:
+    """ URL страницы категории, начинающейся с позиции shard_key """
+
+    return f'{base_url}/w/index.php?title={quote_plus(category_title)}&pagefrom={quote_plus(shard_key)}'
+
+
+def crawl_shard(first_page: BeautifulSoup, stop_titles: set, base_url: str = BASE_URL, fetcher: Fetcher = None) -> dict:
+    """ Считает животных по буквам, начиная с уже загруженной первой страницы шарда и переходя
+        по ссылкам "Следующая страница", пока не встретится запись, с которой начинается другой шард
     """
 
     animals_by_letter = {}
-    current_url = START_URL
+    soup = first_page
+    entries = get_entries_fast(soup)
+    own_start = entries[0][1] if entries else None
+
+    while True:
+        for letter, title in entries:
+            if title in stop_titles and title != own_start:
+                return animals_by_letter
+            animals_by_letter[letter] = animals_by_letter.get(letter, 0) + 1
+
+        next_page_url = get_next_page_url(soup)
+        if not next_page_url:
+            return animals_by_letter
+
+        soup = fetch_page(base_url + next_page_url, fetcher, 'fast')
+        entries = get_entries_fast(soup)
+
+
+def parse_all_animals_sharded(shard_keys=SHARD_KEYS, concurrency: int = SHARD_CONCURRENCY,
+                              category_title: str = CATEGORY_TITLE, base_url: str = BASE_URL,
+                              fetcher: Fetcher = None) -> dict:
+    """ Параллельный обход категории шардами. Каждый шард открывает категорию со своей позиции (pagefrom),
+        плюс один шард идет с самого начала, чтобы не потерять записи до первого ключа.
+        Границы шардов определяются по первым записям их первых страниц: шард останавливается
+        на первой встреченной записи, с которой начинается другой шард. Поэтому результат совпадает
+        с последовательным обходом независимо от порядка сортировки категории и порядка shard_keys.
+        Одновременно обходится не больше concurrency шардов, все они используют общий fetcher
+        (пул соединений и ограничение темпа)
+    """
+
+    fetcher = fetcher or get_default_fetcher()
+    print('Старт обработки...')
+    shard_urls = ([get_category_url(category_title, base_url)]
+                  + [get_shard_url(shard_key, category_title, base_url) for shard_key in shard_keys])
+
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        first_pages = list(executor.map(lambda shard_url: fetch_page(shard_url, fetcher, 'fast'), shard_urls))
+
+        # шарды с одинаковой первой записью совпадают - оставляем по одному
+        shards = {}
+        for first_page in first_pages:
+            entries = get_entries_fast(first_page)
+            if entries:
+                shards.setdefault(entries[0][1], first_page)
+        stop_titles = set(shards)
+
+        animals_by_letter = {}
+        for shard_animals in executor.map(lambda first_page: crawl_shard(first_page, stop_titles, base_url, fetcher),
+                                          shards.values()):
+            for letter, count in shard_animals.items():
+                animals_by_letter[letter] = animals_by_letter.get(letter, 0) + count
+
+    print(f'Обработано шардов: {len(shards)}')
+    return animals_by_letter
+
+
+def find_next_page_url(content: bytes) -> str or None:
+    """ Ссылка на следующую страницу из сырого HTML регулярным выражением, без разбора страницы """
+
+    match = NEXT_PAGE_RE.search(content)
+    if match:
+        return html.unescape(match.group(1).decode('utf-8'))
+
+
+def count_page_content(content: bytes, parse_mode: str = 'fast') -> tuple:
+    """ Разбирает загруженную страницу в процессе-обработчике конвейера.
+        Возвращает (количество животных по буквам, ссылка на следующую страницу)
+    """
+
+    soup = parse_page(content, parse_mode)
+    if parse_mode == 'fast':
+        return get_animals_from_page_fast(soup), get_next_page_url(soup)
+    return get_animals_from_page(soup), get_next_page_url(soup)
+
+
+def fetch_pages_into(pages: queue.Queue, stop: threading.Event, first_url: str, base_url: str,
+                     fetcher: Fetcher) -> None:
+    """ Стадия загрузки конвейера: кладет в очередь (url, содержимое) страниц подряд, следующую ссылку
+        находит регулярным выражением и сразу загружает следующую страницу, не дожидаясь разбора.
+        Полная очередь блокирует загрузку. В конце кладет None, при ошибке - исключение
+    """
+
+    def put(item) -> bool:
+        while not stop.is_set():
+            try:
+                pages.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    current_url = first_url
+    try:
+        while current_url:
+            content = fetcher.get(current_url).content
+            next_page_url = find_next_page_url(content)
+            if not put((current_url, next_page_url, content)):
+                return
+            current_url = base_url + next_page_url if next_page_url else None
+        put(None)
+    except Exception as e:
+        put(e)
+
+
+def parse_all_animals_pipelined(category_title: str = CATEGORY_TITLE, base_url: str = BASE_URL,
+                                fetcher: Fetcher = None, workers: int = None,
+                                queue_size: int = PIPELINE_QUEUE_SIZE, parse_mode: str = 'fast') -> dict:
+    """ Конвейерный обход HTML страниц категории: поток загрузки заранее забирает следующие страницы
+        (ссылку на них дает регулярное выражение по сырому HTML), а разбор идет параллельно
+        в пуле из workers процессов, так что сеть и процессор заняты одновременно.
+        Ограниченная очередь и ограничение на число страниц в разборе не дают загрузке уйти далеко вперед.
+        Ссылка, найденная регулярным выражением, сверяется с результатом разбора страницы
+    """
+
+    fetcher = fetcher or get_default_fetcher()
+    pages = queue.Queue(maxsize=queue_size)
+    stop = threading.Event()
+    loader = threading.Thread(target=fetch_pages_into, daemon=True,
+                              args=(pages, stop, get_category_url(category_title, base_url), base_url, fetcher))
+
+    animals_by_letter = {}
     count_page = 0
     print('Старт обработки...')
 
-    while current_url:
+    def collect(future, url: str, next_page_url: str) -> None:
+        nonlocal count_page
+        page_animals, parsed_next_page_url = future.result()
+        if parsed_next_page_url != next_page_url:
+            raise RuntimeError(f'Ссылка на следующую страницу {url} найдена неверно: '
+                               f'{next_page_url} вместо {parsed_next_page_url}')
+        for letter, count in page_animals.items():
+            animals_by_letter[letter] = animals_by_letter.get(letter, 0) + count
         count_page += 1
         if count_page % 50 == 0:
             print(f'Продолжается обработка, текущая страница: {count_page}')
-        try:
-            response = requests.get(current_url)
-            response.raise_for_status()
-            soup = BeautifulSoup(response.content, 'html.parser')
-
-            page_animals_dict = get_animals_from_page(soup)
-            for letter, count in page_animals_dict.items():
-                animals_by_letter[letter] = animals_by_letter.get(letter, 0) + count
 
-            next_page_url = get_next_page_url(soup)
-            if next_page_url:
-                current_url = BASE_URL + next_page_url
-            else:
-                break
+    loader.start()
+    try:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            in_flight = deque()
+            while True:
+                item = pages.get()
+                if item is None:
+                    break
+                if isinstance(item, Exception):
+                    raise item
 
-            time.sleep(0.25)
+                url, next_page_url, content = item
+                in_flight.append((executor.submit(count_page_content, content, parse_mode), url, next_page_url))
+                if len(in_flight) >= queue_size:
+                    collect(*in_flight.popleft())
 
-        except requests.exceptions.RequestException as e:
-            print(f'Ошибка при запросе страницы: {e}')
-            break
-        except Exception as e:
-            print(f'Непредвиденная ошибка: {e}')
-            break
+            while in_flight:
+                collect(*in_flight.popleft())
+    except Exception as e:
+        print(f'Ошибка при обработке страницы {count_page + 1}: {e}')
+        raise
+    finally:
+        stop.set()
+        loader.join()
 
-    # Просто чтобы было понятно что программа работает
     print(f'Обработано {count_page} страниц')
     return animals_by_letter
 
@@ -130,9 +975,7 @@ def parse_count_animals_string() -> str:
     """ Парсинг строки с количеством статей для теста """
 
     try:
-        response = requests.get(START_URL)
-        response.raise_for_status()
-        soup = BeautifulSoup(response.content, 'html.parser')
+        soup = fetch_page(START_URL)
 
         h2_element = soup.find('h2', string='Страницы в категории «Животные по алфавиту»')
 
@@ -155,9 +998,152 @@ def parse_count_animals_string() -> str:
         print(f'Неожиданная ошибка: {e}')
 
 
-def main():
-    animals_by_letter = parse_all_animals()
-    write_results_to_csv(animals_by_letter)
+def parse_category_spec(spec: str, base_url: str = BASE_URL) -> tuple:
+    """ (название категории, base_url) из описания категории:
+        "Категория:Животные_по_алфавиту" - в base_url, "en:Category:Animals" - в разделе на другом языке,
+        "https://de.wikipedia.org/wiki/Kategorie:Tiere" - по полному URL
+    """
+
+    if spec.startswith(('http://', 'https://')):
+        url = urlsplit(spec)
+        return unquote(url.path.split('/wiki/', 1)[-1]), f'{url.scheme}://{url.netloc}'
+
+    match = re.match(r'([a-z][a-z-]{1,11}):(.+)', spec)
+    if match:
+        return match.group(2), f'https://{match.group(1)}.wikipedia.org'
+    return spec, base_url
+
+
+def category_exists(category_title: str, base_url: str = BASE_URL, fetcher: Fetcher = None) -> bool:
+    """ Есть ли страница категории в разделе (запрос к API, не зависит от источника записей) """
+
+    params = {'action': 'query', 'titles': category_title, 'format': 'json', 'formatversion': '2',
+              'maxlag': API_MAXLAG}
+    data = (fetcher or get_default_fetcher()).get(f'{base_url}/w/api.php', params=params).json()
+    pages = data.get('query', {}).get('pages', [])
+    return bool(pages) and not any(page.get('missing') or page.get('invalid') for page in pages)
+
+
+def count_category(source: str, category_title: str, base_url: str, fetcher: Fetcher) -> dict:
+    """ Подсчет одной категории; пустой результат проверяется на то, что категория вообще существует """
+
+    animals_by_letter = parse_all_animals(source, category_title, base_url, fetcher)
+    if not animals_by_letter and not category_exists(category_title, base_url, fetcher):
+        raise ValueError(f'Категория {category_title} не существует в {base_url}')
+    return animals_by_letter
+
+
+def count_categories(categories, source: str = DEFAULT_SOURCE, base_url: str = BASE_URL, fetcher: Fetcher = None,
+                     concurrency: int = SHARD_CONCURRENCY):
+    """ Считает животных по буквам для нескольких категорий (описания как в parse_category_spec),
+        обходя до concurrency категорий одновременно через общий fetcher (пул соединений и темп).
+        Выдает результаты по мере готовности: {'category', 'base_url', 'animals_by_letter'},
+        для категории, которую не удалось обойти или которой нет, вместо подсчета - 'error'.
+        Ошибка одной категории не останавливает остальные.
+        Источник html ищет ссылку "Следующая страница" и подходит только для русского раздела,
+        для разделов на других языках нужен источник api (по умолчанию)
+    """
+
+    fetcher = fetcher or Fetcher(pool_size=max(16, concurrency))
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        futures = {}
+        for spec in categories:
+            category_title, category_base_url = parse_category_spec(spec, base_url)
+            future = executor.submit(count_category, source, category_title, category_base_url, fetcher)
+            futures[future] = (category_title, category_base_url)
+
+        for future in as_completed(futures):
+            category_title, category_base_url = futures[future]
+            result = {'category': category_title, 'base_url': category_base_url}
+            try:
+                result['animals_by_letter'] = dict(sorted(future.result().items()))
+            except Exception as e:
+                result['error'] = f'{type(e).__name__}: {e}'
+            yield result
+
+
+def write_csv_stream(results, output) -> None:
+    """ Строки категория,буква,количество; категории с ошибкой пропускаются """
+
+    writer = csv.writer(output)
+    writer.writerow(['category', 'letter', 'count'])
+    for result in results:
+        for letter, count in result.get('animals_by_letter', {}).items():
+            writer.writerow([result['category'], letter, count])
+        output.flush()
+
+
+def write_json_stream(results, output) -> None:
+    """ JSON массив результатов, каждый результат дописывается сразу, как готов """
+
+    output.write('[')
+    for index, result in enumerate(results):
+        output.write((',\n' if index else '\n') + json.dumps(result, ensure_ascii=False))
+        output.flush()
+    output.write('\n]\n')
+
+
+def write_ndjson_stream(results, output) -> None:
+    """ Один результат в строке JSON """
+
+    for result in results:
+        output.write(json.dumps(result, ensure_ascii=False) + '\n')
+        output.flush()
+
+
+# Форматы вывода count_categories: функция (результаты, файл)
+OUTPUT_FORMATS = {
+    'csv': write_csv_stream,
+    'json': write_json_stream,
+    'ndjson': write_ndjson_stream,
+}
+
+
+def main(argv=None):
+    """ Без категорий пересчитывает RESULTS_FILENAME через refresh_animals: результаты страниц
+        в PAGES_STATE_PATH сохраняются после каждого отрезка, поэтому прерванный запуск продолжается
+        с места остановки. С категориями выводит их подсчет в выбранном формате
+    """
+
+    parser = argparse.ArgumentParser(description='Количество записей категорий Википедии по буквам. '
+                                                 f'Без категорий пересчитывает {RESULTS_FILENAME}')
+    parser.add_argument('categories', nargs='*',
+                        help='категории: "Категория:Название", "en:Category:Name" или полный URL')
+    parser.add_argument('--format', choices=sorted(OUTPUT_FORMATS), default='csv')
+    parser.add_argument('--output', default='-', help='файл результатов, "-" - стандартный вывод')
+    parser.add_argument('--source', choices=sorted(SOURCES), default=DEFAULT_SOURCE)
+    parser.add_argument('--concurrency', type=int, default=SHARD_CONCURRENCY)
+    parser.add_argument('--base-url', default=BASE_URL, help='раздел для категорий без языка и URL')
+    args = parser.parse_args(argv)
+
+    if not args.categories:
+        fetcher = Fetcher(cache=ResponseCache(CACHE_DIR, max_age=CACHE_MAX_AGE))
+        animals_by_letter = refresh_animals(PAGES_STATE_PATH, fetcher=fetcher)
+        write_results_to_csv(animals_by_letter)
+        return
+
+    failed = []
+
+    def track_errors(results):
+        for result in results:
+            if 'error' in result:
+                failed.append(result['category'])
+                print(f'Ошибка при обходе категории {result["category"]}: {result["error"]}', file=sys.stderr)
+            yield result
+
+    # сообщения о ходе обработки не должны смешиваться с результатами в стандартном выводе
+    with contextlib.ExitStack() as stack:
+        if args.output == '-':
+            output = sys.stdout
+            stack.enter_context(contextlib.redirect_stdout(sys.stderr))
+        else:
+            output = stack.enter_context(open(args.output, 'w', newline='', encoding='utf-8'))
+
+        results = count_categories(args.categories, args.source, args.base_url, concurrency=args.concurrency)
+        OUTPUT_FORMATS[args.format](track_errors(results), output)
+
+    if failed:
+        raise SystemExit(f'Не удалось посчитать категории: {", ".join(failed)}')
 
 
 if __name__ == '__main__':
@@ -1,13 +1,206 @@
+import hashlib
+import io
+import json
+import os
+import random
+import tempfile
 import unittest
 import re
 import requests
+import threading
+import time
 
 from bs4 import BeautifulSoup
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
 from unittest.mock import Mock, patch
-from urllib.parse import unquote
+from urllib.parse import parse_qs, quote_plus, unquote, urlsplit
 
-from solution import (process_category_group, get_animals_from_page,
-                      get_next_page_url, parse_all_animals, parse_count_animals_string)
+import solution
+
+from benchmark import crawl_benchmark, generate_fixture_archive, make_fixture_page
+from replay import ReplayServer, read_fixture_archive, record_fixtures
+
+from solution import (process_category_group, get_animals_from_page, get_entries_from_page, get_next_page_url,
+                      parse_all_animals, parse_all_animals_sharded, parse_count_animals_string,
+                      count_animals, get_api_letter, iter_api_pages, iter_html_pages, parse_retry_after,
+                      get_animals_from_page_fast, get_entries_fast, parse_page, find_next_page_url,
+                      parse_all_animals_pipelined, refresh_animals, count_categories, parse_category_spec,
+                      write_csv_stream, write_json_stream, write_ndjson_stream, Fetcher, RateLimiter, ResponseCache)
+
+
+# Как сортировка Википедии: буквы с диакритикой показываются под заголовком буквы без нее
+STUB_HEADINGS = {'Ё': 'Е', 'É': 'E'}
+
+
+def stub_heading(title: str) -> str:
+    """ Буква заголовка, под которым заглушка показывает запись """
+
+    return STUB_HEADINGS.get(title[0], title[0])
+
+
+def stub_sort_key(title: str) -> tuple:
+    """ Порядок сортировки заглушки: кириллица раньше латиницы (как в Википедии),
+        буквы с диакритикой - вместе с буквой своего заголовка, внутри - по строке
+    """
+
+    heading = stub_heading(title)
+    return heading.isascii(), heading + title[1:], title
+
+
+# Записи категории для локального сервера-заглушки
+STUB_TITLES = sorted([f'{letter}{suffix}' for letter in 'ЁАБВДЖЗЙ'
+                      for suffix in ('ард', 'ерт', 'окс', 'ус')[:1 + ord(letter) % 4]]
+                     + [f'{letter}ria{index}' for letter in 'ABXZÉ' for index in range(3)], key=stub_sort_key)
+STUB_PAGE_SIZE = 4
+
+
+def render_stub_page(page_from: str or None) -> str:
+    """ HTML страницы категории в разметке MediaWiki: STUB_PAGE_SIZE записей, начиная с позиции page_from """
+
+    start = 0
+    if page_from is not None:
+        start = next((index for index, title in enumerate(STUB_TITLES)
+                      if stub_sort_key(title) >= stub_sort_key(page_from)), len(STUB_TITLES))
+    titles = STUB_TITLES[start:start + STUB_PAGE_SIZE]
+
+    groups = []
+    for title in titles:
+        if not groups or groups[-1][0] != stub_heading(title):
+            groups.append((stub_heading(title), []))
+        groups[-1][1].append(f'<li><a href="/wiki/{title}" title="{title}">{title}</a></li>')
+
+    next_link = ''
+    if start + STUB_PAGE_SIZE < len(STUB_TITLES):
+        next_title = quote_plus(STUB_TITLES[start + STUB_PAGE_SIZE])
+        next_link = (f'<a href="/w/index.php?title={quote_plus(solution.CATEGORY_TITLE)}&amp;pagefrom={next_title}'
+                     f'#mw-pages" title="{solution.CATEGORY_TITLE}">Следующая страница</a>')
+
+    return ('<html><body>'
+            '<div id="mw-subcategories"><div class="mw-category-group"><h3>Ж</h3>'
+            '<ul><li><a href="/wiki/Категория:Жуки">Жуки</a></li></ul></div></div>'
+            '<div id="mw-pages"><h2>Страницы в категории «Животные по алфавиту»</h2>'
+            f'<p>Показано {len(titles)} страниц из {len(STUB_TITLES)}, находящихся в данной категории.</p>'
+            '<div class="mw-category">'
+            + ''.join(f'<div class="mw-category-group"><h3>{letter}</h3><ul>{"".join(items)}</ul></div>'
+                      for letter, items in groups)
+            + f'</div>{next_link}</div></body></html>')
+
+
+STUB_API_LIMIT = 5
+# Категория, которой нет на сервере-заглушке
+STUB_MISSING_CATEGORY = 'Категория:Несуществующая'
+
+
+def render_stub_api(cmcontinue: str or None) -> str:
+    """ Ответ list=categorymembers: STUB_API_LIMIT записей, продолжение - позиция следующей записи """
+
+    start = int(cmcontinue or 0)
+    data = {'query': {'categorymembers': [{'ns': 0, 'title': title, 'sortkeyprefix': ''}
+                                          for title in STUB_TITLES[start:start + STUB_API_LIMIT]]}}
+    if start + STUB_API_LIMIT < len(STUB_TITLES):
+        data['continue'] = {'cmcontinue': str(start + STUB_API_LIMIT), 'continue': '-||'}
+    return json.dumps(data)
+
+
+class StubCategoryHandler(BaseHTTPRequestHandler):
+    """ Отдает страницы категории из STUB_TITLES с поддержкой pagefrom и API list=categorymembers.
+        Ответы из faults (статус, заголовки, тело) отдаются по очереди перед обычными - для проверки повторов.
+        HTML страницы снабжаются ETag, на совпадающий If-None-Match отдается 304; ответы api.php, как и в MediaWiki,
+        приходят без ETag и Last-Modified. Статусы ответов пишутся в served
+    """
+
+    faults = []
+    faults_lock = threading.Lock()
+    served = []
+
+    def send_response(self, code, message=None):
+        self.served.append(code)
+        super().send_response(code, message)
+
+    def do_GET(self):
+        with self.faults_lock:
+            fault = self.faults.pop(0) if self.faults else None
+        if fault is not None:
+            status, headers, body = fault
+            self.send_response(status)
+            for name, value in headers.items():
+                self.send_header(name, value)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+            return
+
+        url = urlsplit(self.path)
+        query = parse_qs(url.query)
+        if url.path == '/w/api.php' and 'titles' in query:
+            title = query['titles'][0]
+            page = {'title': title, 'pageid': 1}
+            if title == STUB_MISSING_CATEGORY:
+                page = {'title': title, 'missing': True}
+            body = json.dumps({'query': {'pages': [page]}}).encode('utf-8')
+            content_type = 'application/json; charset=utf-8'
+        elif url.path == '/w/api.php' and query.get('cmtitle') == [STUB_MISSING_CATEGORY]:
+            body = json.dumps({'query': {'categorymembers': []}}).encode('utf-8')
+            content_type = 'application/json; charset=utf-8'
+        elif url.path == '/w/api.php':
+            body = render_stub_api(query.get('cmcontinue', [None])[0]).encode('utf-8')
+            content_type = 'application/json; charset=utf-8'
+        else:
+            body = render_stub_page(query.get('pagefrom', [None])[0]).encode('utf-8')
+            content_type = 'text/html; charset=utf-8'
+
+        etag = f'"{hashlib.sha256(body).hexdigest()[:16]}"' if url.path != '/w/api.php' else None
+        if etag is not None and self.headers.get('If-None-Match') == etag:
+            self.send_response(304)
+            self.send_header('ETag', etag)
+            self.end_headers()
+            return
+
+        self.send_response(200)
+        if etag is not None:
+            self.send_header('ETag', etag)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class StubServerTestCase(unittest.TestCase):
+    """ Запускает локальный сервер-заглушку категории на время тестов класса """
+
+    @classmethod
+    def setUpClass(cls):
+        cls.server = ThreadingHTTPServer(('127.0.0.1', 0), StubCategoryHandler)
+        cls.base_url = f'http://127.0.0.1:{cls.server.server_address[1]}'
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+        cls.fetcher_patch = patch('solution._default_fetcher', cls.make_fetcher())
+        cls.fetcher_patch.start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.fetcher_patch.stop()
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    @staticmethod
+    def make_fetcher(max_retries: int = 3) -> Fetcher:
+        """ Загрузчик без заметных пауз, чтобы тесты шли быстро """
+
+        return Fetcher(RateLimiter(rate=1000, burst=100, max_rate=1000), max_retries=max_retries,
+                       backoff=0.01, max_backoff=0.05)
+
+    def tearDown(self):
+        StubCategoryHandler.faults.clear()
+        StubCategoryHandler.served.clear()
+
+    def expected_counts(self) -> dict:
+        counts = {}
+        for title in STUB_TITLES:
+            counts[stub_heading(title)] = counts.get(stub_heading(title), 0) + 1
+        return counts
 
 
 class TestProcessCategoryGroup(unittest.TestCase):
@@ -148,3 +341,583 @@ class TestParseAllAnimals(unittest.TestCase):
         count_animals = sum(all_animals.values())
 
         self.assertEqual(int(number), count_animals)
+
+
+class TestGetEntriesFromPage(unittest.TestCase):
+    def test_entries_without_subcategories(self):
+        """ Записи страницы в порядке следования, подкатегории не учитываются """
+
+        soup = BeautifulSoup(render_stub_page(None), 'html.parser')
+
+        self.assertEqual(get_entries_from_page(soup), [(stub_heading(title), title) for title in STUB_TITLES[:STUB_PAGE_SIZE]])
+
+
+class TestParseAllAnimalsSharded(StubServerTestCase):
+    def test_matches_sequential(self):
+        """ Параллельный обход шардами совпадает с последовательным на локальной заглушке """
+
+        sequential = parse_all_animals('html', base_url=self.base_url)
+        sharded = parse_all_animals_sharded(concurrency=4, base_url=self.base_url)
+
+        self.assertEqual(sequential, self.expected_counts())
+        self.assertEqual(sharded, sequential)
+
+    def test_keys_in_any_order(self):
+        """ Порядок ключей и ключи без записей не влияют на результат """
+
+        sharded = parse_all_animals_sharded(shard_keys=('Z', 'Б', 'Я', 'A', 'Г', 'Б'), concurrency=2,
+                                            base_url=self.base_url)
+
+        self.assertEqual(sharded, self.expected_counts())
+
+
+class TestSources(StubServerTestCase):
+    def test_api_matches_html(self):
+        """ API и HTML источники дают одинаковый подсчет, в том числе для букв с диакритикой (Ё, É),
+            API - за меньшее число запросов
+        """
+
+        html_pages = list(iter_html_pages(base_url=self.base_url))
+        api_pages = list(iter_api_pages(base_url=self.base_url))
+
+        self.assertEqual(count_animals(api_pages), count_animals(html_pages))
+        self.assertEqual(count_animals(api_pages), self.expected_counts())
+        self.assertLess(len(api_pages), len(html_pages))
+
+    def test_default_source(self):
+        """ По умолчанию используется API """
+
+        self.assertEqual(solution.DEFAULT_SOURCE, 'api')
+        self.assertEqual(parse_all_animals(base_url=self.base_url), self.expected_counts())
+
+    def test_api_letter(self):
+        """ Буква берется из ключа сортировки, если он задан """
+
+        self.assertEqual(get_api_letter({'title': 'Ёж', 'sortkeyprefix': 'Еж'}), 'Е')
+        self.assertEqual(get_api_letter({'title': 'ёж', 'sortkeyprefix': ''}), 'Е')
+
+    def test_api_letter_collation(self):
+        """ Диакритика снимается, как в заголовках категории, а Й остается отдельной буквой """
+
+        self.assertEqual(get_api_letter({'title': 'Élan', 'sortkeyprefix': ''}), 'E')
+        self.assertEqual(get_api_letter({'title': 'Ёрш', 'sortkeyprefix': ''}), 'Е')
+        self.assertEqual(get_api_letter({'title': 'йети', 'sortkeyprefix': ''}), 'Й')
+
+
+class TestFetcher(StubServerTestCase):
+    def test_retry_after_429(self):
+        """ Ответы 429 повторяются, темп ограничителя снижается, результат полный """
+
+        fetcher = self.make_fetcher()
+        StubCategoryHandler.faults.extend([(429, {'Retry-After': '0'}, b'')] * 2)
+
+        self.assertEqual(parse_all_animals('api', base_url=self.base_url, fetcher=fetcher), self.expected_counts())
+        self.assertLess(fetcher.limiter.rate, 1000)
+
+    def test_maxlag(self):
+        """ Ошибка maxlag API повторяется после паузы из Retry-After """
+
+        fetcher = self.make_fetcher()
+        body = json.dumps({'error': {'code': 'maxlag', 'info': 'Waiting for a database server'}}).encode('utf-8')
+        StubCategoryHandler.faults.append((200, {'Content-Type': 'application/json', 'Retry-After': '0'}, body))
+
+        self.assertEqual(parse_all_animals('api', base_url=self.base_url, fetcher=fetcher), self.expected_counts())
+
+    def test_maxlag_header(self):
+        """ Ошибка maxlag определяется по заголовку MediaWiki-API-Error """
+
+        fetcher = self.make_fetcher()
+        body = json.dumps({'error': {'code': 'maxlag'}}).encode('utf-8')
+        StubCategoryHandler.faults.append((200, {'Content-Type': 'application/json', 'Retry-After': '0',
+                                                 'MediaWiki-API-Error': 'maxlag'}, body))
+
+        self.assertEqual(parse_all_animals('api', base_url=self.base_url, fetcher=fetcher), self.expected_counts())
+        self.assertEqual(StubCategoryHandler.served[0], 200)
+        self.assertLess(fetcher.limiter.rate, 1000)
+
+    def test_regular_api_response_not_decoded(self):
+        """ Обычный ответ API без maxlag не декодируется в Fetcher - его разбирает только parse_source_page """
+
+        with patch.object(requests.Response, 'json', side_effect=AssertionError('ответ декодирован дважды')):
+            result = parse_all_animals('api', base_url=self.base_url, fetcher=self.make_fetcher())
+
+        self.assertEqual(result, self.expected_counts())
+
+    def test_server_error_retried(self):
+        """ Разовая ошибка 5xx не прерывает обход """
+
+        fetcher = self.make_fetcher()
+        StubCategoryHandler.faults.append((502, {}, b''))
+
+        self.assertEqual(parse_all_animals('html', base_url=self.base_url, fetcher=fetcher), self.expected_counts())
+
+    def test_retries_exhausted(self):
+        """ Если повторы закончились, бросается исключение, а не возвращается неполный результат """
+
+        fetcher = self.make_fetcher(max_retries=2)
+        StubCategoryHandler.faults.extend([(200, {}, render_stub_page(None).encode('utf-8'))]
+                                          + [(500, {}, b'')] * 3)
+
+        with self.assertRaises(requests.exceptions.RetryError):
+            parse_all_animals('html', base_url=self.base_url, fetcher=fetcher)
+
+    def test_sharded_retries_exhausted(self):
+        """ Ошибка в одном из шардов пробрасывается из параллельного обхода """
+
+        fetcher = self.make_fetcher(max_retries=0)
+        StubCategoryHandler.faults.append((503, {}, b''))
+
+        with self.assertRaises(requests.exceptions.RetryError):
+            parse_all_animals_sharded(concurrency=1, base_url=self.base_url, fetcher=fetcher)
+
+
+class TestRateLimiter(unittest.TestCase):
+    def test_pacing(self):
+        """ Без запаса токенов запросы идут не чаще rate в секунду """
+
+        limiter = RateLimiter(rate=50, burst=1)
+        started = time.monotonic()
+        for _ in range(6):
+            limiter.acquire()
+        self.assertGreaterEqual(time.monotonic() - started, 0.09)
+
+    def test_throttle_and_recover(self):
+        """ Троттлинг уменьшает темп вдвое (не ниже min_rate), успешные ответы увеличивают """
+
+        limiter = RateLimiter(rate=4, min_rate=1.5, max_rate=4)
+        limiter.on_throttle(0)
+        self.assertEqual(limiter.rate, 2)
+        limiter.on_throttle(0)
+        self.assertEqual(limiter.rate, 1.5)
+        limiter.on_success()
+        self.assertAlmostEqual(limiter.rate, 1.6)
+
+    def test_parse_retry_after(self):
+        """ Retry-After в секундах и в виде HTTP даты """
+
+        self.assertEqual(parse_retry_after('7'), 7)
+        self.assertIsNone(parse_retry_after(None))
+        self.assertIsNone(parse_retry_after('скоро'))
+        self.assertEqual(parse_retry_after('Wed, 21 Oct 2015 07:28:00 GMT'), 0)
+
+
+class TestCheckpointAndCache(StubServerTestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.checkpoint_path = os.path.join(self.directory.name, 'checkpoint.json')
+
+    def tearDown(self):
+        super().tearDown()
+        self.directory.cleanup()
+
+    def test_resume_after_failure(self):
+        """ После ошибки в середине обхода повторный запуск продолжает с контрольной точки """
+
+        for source in ('html', 'api'):
+            with self.subTest(source=source):
+                pages_total = len(list(solution.SOURCES[source](base_url=self.base_url)))
+
+                fetcher = self.make_fetcher(max_retries=0)
+                # первые две страницы проходят, третья падает
+                StubCategoryHandler.faults.extend(self.record_responses(source, 2) + [(500, {}, b'')])
+                with self.assertRaises(requests.exceptions.RetryError):
+                    parse_all_animals(source, base_url=self.base_url, fetcher=fetcher,
+                                      checkpoint_path=self.checkpoint_path)
+                with open(self.checkpoint_path, encoding='utf-8') as checkpoint_file:
+                    self.assertEqual(json.load(checkpoint_file)['pages'], 2)
+
+                StubCategoryHandler.served.clear()
+                result = parse_all_animals(source, base_url=self.base_url, fetcher=fetcher,
+                                           checkpoint_path=self.checkpoint_path)
+                self.assertEqual(result, self.expected_counts())
+                self.assertEqual(len(StubCategoryHandler.served), pages_total - 2)
+                self.assertFalse(os.path.exists(self.checkpoint_path))
+
+    def test_api_error_page(self):
+        """ Ошибка API посреди обхода прерывает его, контрольная точка остается на последней целой странице """
+
+        body = json.dumps({'error': {'code': 'internal_api_error_DBQueryError', 'info': 'Database query error'}})
+        StubCategoryHandler.faults.extend(self.record_responses('api', 2)
+                                          + [(200, {'Content-Type': 'application/json'}, body.encode('utf-8'))])
+
+        with self.assertRaisesRegex(RuntimeError, 'internal_api_error_DBQueryError'):
+            parse_all_animals('api', base_url=self.base_url, fetcher=self.make_fetcher(),
+                              checkpoint_path=self.checkpoint_path)
+        with open(self.checkpoint_path, encoding='utf-8') as checkpoint_file:
+            self.assertEqual(json.load(checkpoint_file)['pages'], 2)
+
+        result = parse_all_animals('api', base_url=self.base_url, fetcher=self.make_fetcher(),
+                                   checkpoint_path=self.checkpoint_path)
+        self.assertEqual(result, self.expected_counts())
+
+    def record_responses(self, source: str, count: int) -> list:
+        """ Первые count ответов источника в формате faults """
+
+        responses = []
+        fetcher = self.make_fetcher()
+        original_get = fetcher.session.get
+
+        def recording_get(*args, **kwargs):
+            response = original_get(*args, **kwargs)
+            responses.append((response.status_code, {'Content-Type': response.headers['Content-Type']},
+                              response.content))
+            return response
+
+        fetcher.session.get = recording_get
+        pages = solution.SOURCES[source](base_url=self.base_url, fetcher=fetcher)
+        for _ in range(count):
+            next(pages)
+        return responses
+
+    def test_foreign_checkpoint_ignored(self):
+        """ Контрольная точка другого источника не используется """
+
+        with open(self.checkpoint_path, 'w', encoding='utf-8') as checkpoint_file:
+            json.dump({'source': 'html', 'category_title': solution.CATEGORY_TITLE, 'base_url': self.base_url,
+                       'cursor': 'x', 'pages': 1, 'animals_by_letter': {'А': 100}}, checkpoint_file)
+
+        result = parse_all_animals('api', base_url=self.base_url, checkpoint_path=self.checkpoint_path)
+        self.assertEqual(result, self.expected_counts())
+
+    def test_conditional_cache(self):
+        """ Повторный обход HTML с кэшем получает 304 на каждую страницу и дает тот же результат """
+
+        cache = ResponseCache(os.path.join(self.directory.name, 'cache'))
+        fetcher = Fetcher(self.make_fetcher().limiter, cache=cache)
+        first = parse_all_animals('html', base_url=self.base_url, fetcher=fetcher)
+        self.assertNotIn(304, StubCategoryHandler.served)
+
+        StubCategoryHandler.served.clear()
+        second = parse_all_animals('html', base_url=self.base_url, fetcher=fetcher)
+        self.assertEqual(first, second)
+        self.assertEqual(first, self.expected_counts())
+        self.assertEqual(set(StubCategoryHandler.served), {304})
+
+    def test_cache_without_validators(self):
+        """ Ответы API без ETag кэшируются только с max_age и отдаются без запроса, пока не устарели """
+
+        pages_total = len(list(iter_api_pages(base_url=self.base_url)))
+        for max_age, requests_expected in ((None, pages_total), (3600, 0), (0, pages_total)):
+            with self.subTest(max_age=max_age):
+                cache = ResponseCache(os.path.join(self.directory.name, f'cache{max_age}'), max_age=max_age)
+                fetcher = Fetcher(self.make_fetcher().limiter, cache=cache)
+                first = parse_all_animals('api', base_url=self.base_url, fetcher=fetcher)
+
+                StubCategoryHandler.served.clear()
+                second = parse_all_animals('api', base_url=self.base_url, fetcher=fetcher)
+                self.assertEqual(first, second)
+                self.assertEqual(first, self.expected_counts())
+                self.assertEqual(len(StubCategoryHandler.served), requests_expected)
+                self.assertNotIn(304, StubCategoryHandler.served)
+
+    def test_api_error_not_cached(self):
+        """ Ошибка API с кодом 200 не попадает в кэш и не повторяется при следующем запуске """
+
+        cache = ResponseCache(os.path.join(self.directory.name, 'cache'), max_age=3600)
+        fetcher = Fetcher(self.make_fetcher().limiter, cache=cache)
+        body = json.dumps({'error': {'code': 'internal_api_error_DBQueryError'}}).encode('utf-8')
+        StubCategoryHandler.faults.append((200, {'Content-Type': 'application/json'}, body))
+
+        with self.assertRaises(RuntimeError):
+            parse_all_animals('api', base_url=self.base_url, fetcher=fetcher)
+        self.assertEqual(parse_all_animals('api', base_url=self.base_url, fetcher=fetcher), self.expected_counts())
+
+
+class TestFastParsing(unittest.TestCase):
+    def test_matches_full_parsing(self):
+        """ Режим fast дает те же записи, подсчет и ссылку на следующую страницу, что и полный разбор,
+            с любым доступным парсером
+        """
+
+        rng = random.Random(0)
+        pages = ([render_stub_page(page_from).encode('utf-8') for page_from in (None, STUB_TITLES[5], 'Z')]
+                 + [make_fixture_page(rng) for _ in range(3)])
+        parsers = ['html.parser'] + (['lxml'] if solution.lxml is not None else [])
+        for parser in parsers:
+            with self.subTest(parser=parser), patch('solution.FAST_HTML_PARSER', parser):
+                for page in pages:
+                    full = parse_page(page)
+                    fast = parse_page(page, 'fast')
+                    self.assertEqual(get_entries_fast(fast), get_entries_from_page(full))
+                    self.assertEqual(get_animals_from_page_fast(fast), get_animals_from_page(full))
+                    self.assertEqual(get_next_page_url(fast), get_next_page_url(full))
+
+    def test_page_without_mw_pages(self):
+        """ Страница без блока #mw-pages дает пустой результат """
+
+        soup = parse_page('<html><body><ul><li>Меню</li></ul></body></html>'.encode('utf-8'), 'fast')
+        self.assertEqual(get_entries_fast(soup), [])
+        self.assertIsNone(get_next_page_url(soup))
+
+
+class TestPipeline(StubServerTestCase):
+    def test_matches_sequential(self):
+        """ Конвейер считает так же, как последовательный обход, при любом режиме разбора и размере очереди """
+
+        for parse_mode in ('full', 'fast'):
+            for queue_size in (1, 3):
+                with self.subTest(parse_mode=parse_mode, queue_size=queue_size):
+                    result = parse_all_animals_pipelined(base_url=self.base_url, workers=2,
+                                                         queue_size=queue_size, parse_mode=parse_mode)
+                    self.assertEqual(result, self.expected_counts())
+
+    def test_fetch_error(self):
+        """ Ошибка загрузки пробрасывается из конвейера, а не дает неполный результат """
+
+        StubCategoryHandler.faults.extend([(200, {}, render_stub_page(None).encode('utf-8')), (500, {}, b'')])
+
+        with self.assertRaises(requests.exceptions.RetryError):
+            parse_all_animals_pipelined(base_url=self.base_url, fetcher=self.make_fetcher(max_retries=0),
+                                        workers=1, queue_size=1)
+
+    def test_find_next_page_url(self):
+        """ Ссылка из регулярного выражения совпадает со ссылкой из разобранной страницы """
+
+        rng = random.Random(0)
+        pages = [render_stub_page(None).encode('utf-8'), render_stub_page('Z').encode('utf-8'),
+                 make_fixture_page(rng)]
+        for page in pages:
+            self.assertEqual(find_next_page_url(page), get_next_page_url(parse_page(page)))
+
+
+class TestRefreshAnimals(StubServerTestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.state_path = os.path.join(self.directory.name, 'pages.json')
+
+    def tearDown(self):
+        super().tearDown()
+        self.directory.cleanup()
+
+    def refresh(self, source: str = 'html') -> tuple:
+        """ (результат пересчета, количество разобранных страниц) """
+
+        with patch('solution.parse_source_page', wraps=solution.parse_source_page) as parse_mock:
+            result = refresh_animals(self.state_path, source, base_url=self.base_url)
+        return result, parse_mock.call_count
+
+    def test_unchanged(self):
+        """ Первый запуск - полный обход, повторный без изменений ничего не разбирает """
+
+        for source in ('html', 'api'):
+            with self.subTest(source=source):
+                result, parsed = self.refresh(source)
+                self.assertEqual(result, self.expected_counts())
+                self.assertEqual(parsed, len(list(solution.SOURCES[source](base_url=self.base_url))))
+
+                result, parsed = self.refresh(source)
+                self.assertEqual(result, self.expected_counts())
+                self.assertEqual(parsed, 0)
+
+    def test_resume_after_failure(self):
+        """ Прерванный первый обход продолжается с сохраненных отрезков, а не с первой страницы """
+
+        fetch_source_page = solution.fetch_source_page
+        calls = []
+
+        def failing_fetch(*args, **kwargs):
+            calls.append(args)
+            if len(calls) > 3:
+                raise requests.exceptions.ConnectionError('обрыв связи')
+            return fetch_source_page(*args, **kwargs)
+
+        with patch('solution.fetch_source_page', side_effect=failing_fetch):
+            with self.assertRaises(requests.exceptions.ConnectionError):
+                refresh_animals(self.state_path, 'html', base_url=self.base_url)
+        with open(self.state_path, encoding='utf-8') as state_file:
+            self.assertEqual(len(json.load(state_file)['pages']), 2)
+
+        result, parsed = self.refresh()
+        self.assertEqual(result, self.expected_counts())
+        self.assertLess(parsed, len(list(iter_html_pages(base_url=self.base_url))))
+
+    def test_changes_realigned_by_cursor(self):
+        """ Вставки и удаления пересчитывают только свои отрезки, остальные страницы не разбираются """
+
+        self.refresh()
+        pages_total = len(list(iter_html_pages(base_url=self.base_url)))
+        changes = [
+            STUB_TITLES[:2] + ['Аааа', 'Ааааб'] + STUB_TITLES[2:],
+            [title for title in STUB_TITLES if title != STUB_TITLES[9]],
+            STUB_TITLES + ['Zzzz', 'Zzzzz'],
+        ]
+        for titles in changes:
+            with self.subTest(titles=titles), patch(f'{__name__}.STUB_TITLES', sorted(titles, key=stub_sort_key)):
+                result, parsed = self.refresh()
+                self.assertEqual(result, self.expected_counts())
+                self.assertLessEqual(parsed, 4)
+                self.assertLess(parsed, pages_total)
+
+            # возврат к исходному списку
+            result, _ = self.refresh()
+            self.assertEqual(result, self.expected_counts())
+
+    def test_random_changes(self):
+        """ Результат всегда совпадает с полным подсчетом после серии случайных изменений """
+
+        rng = random.Random(0)
+        titles = list(STUB_TITLES)
+        self.refresh()
+        for _ in range(10):
+            for _ in range(rng.randint(1, 6)):
+                if titles and rng.random() < 0.4:
+                    titles.remove(rng.choice(titles))
+                else:
+                    titles.append(rng.choice('АБВЖЗAZ') + ''.join(rng.choices('абвгxyz', k=5)))
+            titles = sorted(set(titles), key=stub_sort_key)
+            with patch(f'{__name__}.STUB_TITLES', titles):
+                result, _ = self.refresh()
+                self.assertEqual(result, self.expected_counts())
+
+
+class TestReplay(StubServerTestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.archive = os.path.join(self.directory.name, 'fixtures.zip')
+
+    def tearDown(self):
+        super().tearDown()
+        self.directory.cleanup()
+
+    def test_record_and_replay(self):
+        """ Записанные страницы воспроизводятся локальным сервером, подсчет совпадает для обоих источников """
+
+        count = record_fixtures(self.archive, base_url=self.base_url)
+        self.assertEqual(len(read_fixture_archive(self.archive)[1]), count)
+
+        server = ReplayServer.from_archive(self.archive)
+        replay_url = server.start()
+        try:
+            for source in ('html', 'api'):
+                with self.subTest(source=source):
+                    result = parse_all_animals(source, base_url=replay_url, fetcher=self.make_fetcher())
+                    self.assertEqual(result, self.expected_counts())
+            self.assertEqual(server.served, count)
+        finally:
+            server.stop()
+
+    def test_replay_errors(self):
+        """ С ошибками сервера подсчет тот же благодаря повторам """
+
+        record_fixtures(self.archive, ['html'], base_url=self.base_url)
+        server = ReplayServer.from_archive(self.archive, error_rate=0.3, seed=1)
+        replay_url = server.start()
+        try:
+            result = parse_all_animals('html', base_url=replay_url, fetcher=self.make_fetcher(max_retries=10))
+            self.assertEqual(result, self.expected_counts())
+        finally:
+            server.stop()
+
+    def test_rate_limit(self):
+        """ Сверх rate_limit запросов в секунду сервер отвечает 429 """
+
+        server = ReplayServer({}, rate_limit=2)
+        try:
+            self.assertEqual([server.choose_status() for _ in range(4)], [200, 200, 429, 429])
+        finally:
+            server.server_close()
+
+    def test_crawl_benchmark(self):
+        """ Бенчмарк обхода на сгенерированном архиве: режимы считают одинаково, все страницы отданы """
+
+        generate_fixture_archive(self.archive, pages=3, entries=50, api_limit=100)
+        results = crawl_benchmark(self.archive, modes=('html', 'api'))
+        self.assertEqual(results['html']['pages'], 3)
+        self.assertEqual(results['api']['pages'], 2)
+        self.assertGreater(results['api']['pages_per_second'], 0)
+
+    def test_crawl_benchmark_failure(self):
+        """ Упавший обход отмечается ошибкой в результатах, бенчмарк не зависает """
+
+        generate_fixture_archive(self.archive, pages=2, entries=50, api_limit=100)
+        results = crawl_benchmark(self.archive, modes=('api',), error_rate=1.0, timeout=60)
+        self.assertIn('RetryError', results['api']['error'])
+
+
+class TestCountCategories(StubServerTestCase):
+    def test_several_categories(self):
+        """ Несколько категорий считаются параллельно, недоступная категория дает запись с ошибкой """
+
+        categories = ['Категория:Первая', 'Категория:Вторая', 'http://127.0.0.1:1/wiki/Категория:Недоступная']
+        results = list(count_categories(categories, base_url=self.base_url, fetcher=self.make_fetcher(max_retries=0),
+                                        concurrency=3))
+
+        by_category = {result['category']: result for result in results}
+        self.assertEqual(set(by_category), {'Категория:Первая', 'Категория:Вторая', 'Категория:Недоступная'})
+        self.assertEqual(by_category['Категория:Первая']['animals_by_letter'], self.expected_counts())
+        self.assertEqual(by_category['Категория:Вторая']['base_url'], self.base_url)
+        self.assertIn('error', by_category['Категория:Недоступная'])
+
+    def test_unexpected_error(self):
+        """ Ошибка, не связанная с сетью (ответ не в JSON), дает запись с ошибкой, остальные категории считаются """
+
+        StubCategoryHandler.faults.append((200, {'Content-Type': 'text/plain'}, b'not json'))
+        results = list(count_categories(['Категория:Первая', 'Категория:Вторая'], base_url=self.base_url,
+                                        fetcher=self.make_fetcher(), concurrency=1))
+
+        by_category = {result['category']: result for result in results}
+        self.assertIn('error', by_category['Категория:Первая'])
+        self.assertEqual(by_category['Категория:Вторая']['animals_by_letter'], self.expected_counts())
+
+    def test_missing_category(self):
+        """ Несуществующая категория - ошибка, а не пустой подсчет """
+
+        results = list(count_categories([STUB_MISSING_CATEGORY, 'Категория:Первая'], base_url=self.base_url,
+                                        fetcher=self.make_fetcher()))
+
+        by_category = {result['category']: result for result in results}
+        self.assertIn('не существует', by_category[STUB_MISSING_CATEGORY]['error'])
+        self.assertNotIn('animals_by_letter', by_category[STUB_MISSING_CATEGORY])
+        self.assertEqual(by_category['Категория:Первая']['animals_by_letter'], self.expected_counts())
+
+    def test_json_output_terminated(self):
+        """ JSON массив закрывается и при ошибках в части категорий """
+
+        StubCategoryHandler.faults.append((200, {'Content-Type': 'text/plain'}, b'not json'))
+        output = io.StringIO()
+        write_json_stream(count_categories(['Категория:Первая', STUB_MISSING_CATEGORY, 'Категория:Вторая'],
+                                           base_url=self.base_url, fetcher=self.make_fetcher(), concurrency=1),
+                          output)
+        self.assertEqual(len(json.loads(output.getvalue())), 3)
+
+    def test_output_formats(self):
+        """ Все форматы вывода содержат одни и те же данные """
+
+        results = [{'category': 'Категория:Первая', 'base_url': self.base_url, 'animals_by_letter': {'А': 2, 'Б': 1}},
+                   {'category': 'Категория:Вторая', 'base_url': self.base_url, 'error': 'нет связи'}]
+
+        output = io.StringIO()
+        write_csv_stream(iter(results), output)
+        self.assertEqual(output.getvalue().splitlines(),
+                         ['category,letter,count', 'Категория:Первая,А,2', 'Категория:Первая,Б,1'])
+
+        output = io.StringIO()
+        write_json_stream(iter(results), output)
+        self.assertEqual(json.loads(output.getvalue()), results)
+
+        output = io.StringIO()
+        write_ndjson_stream(iter(results), output)
+        self.assertEqual([json.loads(line) for line in output.getvalue().splitlines()], results)
+
+    def test_main(self):
+        """ Командная строка записывает результаты в файл в выбранном формате """
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'counts.ndjson')
+            solution.main(['Категория:Первая', 'Категория:Вторая', '--format', 'ndjson', '--output', path,
+                           '--base-url', self.base_url, '--source', 'html'])
+            with open(path, encoding='utf-8') as output_file:
+                results = [json.loads(line) for line in output_file]
+
+        self.assertEqual(len(results), 2)
+        for result in results:
+            self.assertEqual(result['animals_by_letter'], self.expected_counts())
+
+    def test_parse_category_spec(self):
+        """ Категория по названию, с языком раздела и по полному URL """
+
+        self.assertEqual(parse_category_spec('Категория:Звери'), ('Категория:Звери', solution.BASE_URL))
+        self.assertEqual(parse_category_spec('en:Category:Animals'), ('Category:Animals', 'https://en.wikipedia.org'))
+        self.assertEqual(parse_category_spec('https://de.wikipedia.org/wiki/Kategorie:Tiere'),
+                         ('Kategorie:Tiere', 'https://de.wikipedia.org'))
+
@@ -0,0 +1,226 @@
+""" Бенчмарк и дифференциальный фаззинг appearance и функций-помощников.
+    Запуск из папки solution: python benchmark.py --output bench.json
+    Результаты записываются в JSON, чтобы их можно было сравнивать между запусками
+"""
+
+import argparse
+import json
+import platform
+import random
+import time
+
+from solution import (appearance, appearance_many, calculate_total_time_in_lesson, get_person_intervals_in_lesson,
+                      group_appearance, intervals_to_columns, merge_person_intervals, np, stream_lesson_overlaps,
+                      IntervalSet, PresenceTracker)
+
+LESSON_START = 1594663200
+LESSON_END = 1594666800
+
+
+def generate_reconnects(rng: random.Random, size: int) -> list:
+    """ Много коротких сессий подряд (частые переподключения) """
+
+    intervals = []
+    step = (LESSON_END - LESSON_START) // size or 1
+    for index in range(size):
+        entry = LESSON_START + index * step + rng.randint(0, step // 2)
+        intervals.extend((entry, entry + rng.randint(1, step)))
+    return intervals
+
+
+def generate_overlaps(rng: random.Random, size: int) -> list:
+    """ Длинные сессии, сильно пересекающиеся между собой (несколько вкладок) """
+
+    intervals = []
+    for _ in range(size):
+        entry = rng.randint(LESSON_START - 600, LESSON_END)
+        intervals.extend((entry, entry + rng.randint(0, 1800)))
+    return intervals
+
+
+def generate_outside(rng: random.Random, size: int) -> list:
+    """ Половина сессий целиком вне урока """
+
+    intervals = generate_reconnects(rng, size)
+    for index in range(0, len(intervals), 4):
+        shift = rng.choice((-1, 1)) * (LESSON_END - LESSON_START + 3600)
+        intervals[index] += shift
+        intervals[index + 1] += shift
+    return intervals
+
+
+def generate_unsorted(rng: random.Random, size: int) -> list:
+    """ Сессии в произвольном порядке, как во втором тестовом случае """
+
+    intervals = generate_overlaps(rng, size)
+    pairs = [(intervals[index], intervals[index + 1]) for index in range(0, len(intervals), 2)]
+    rng.shuffle(pairs)
+    return [endpoint for pair in pairs for endpoint in pair]
+
+
+GENERATORS = {
+    'reconnects': generate_reconnects,
+    'overlaps': generate_overlaps,
+    'outside': generate_outside,
+    'unsorted': generate_unsorted,
+}
+
+
+def generate_lesson(rng: random.Random, kind: str, size: int) -> dict:
+    return {'lesson': [LESSON_START, LESSON_END],
+            'pupil': GENERATORS[kind](rng, size),
+            'tutor': GENERATORS[kind](rng, size)}
+
+
+def reference_appearance(intervals: dict) -> int:
+    """ Эталон: множество секунд урока, в которые присутствовали оба (вход <= секунда < выход) """
+
+    lesson_start, lesson_end = intervals['lesson']
+
+    def seconds(person_intervals: list) -> set:
+        present = set()
+        for index in range(0, len(person_intervals), 2):
+            present.update(range(max(person_intervals[index], lesson_start),
+                                 min(person_intervals[index + 1], lesson_end)))
+        return present
+
+    return len(seconds(intervals['pupil']) & seconds(intervals['tutor']))
+
+
+def stream_engine(intervals: dict) -> int:
+    events = []
+    for role in ('lesson', 'pupil', 'tutor'):
+        for index in range(0, len(intervals[role]), 2):
+            events.append((intervals[role][index], role, 'enter'))
+            events.append((intervals[role][index + 1], role, 'exit'))
+    events.sort(key=lambda event: event[0])
+    return dict(stream_lesson_overlaps((0, role, event, timestamp) for timestamp, role, event in events))[0]
+
+
+def tracker_engine(intervals: dict) -> int:
+    tracker = PresenceTracker(*intervals['lesson'])
+    events = []
+    for role in ('pupil', 'tutor'):
+        for index in range(0, len(intervals[role]), 2):
+            events.append((intervals[role][index], role, 'enter', index))
+            events.append((intervals[role][index + 1], role, 'exit', index))
+    for timestamp, role, event, session in sorted(events, key=lambda event: event[0]):
+        tracker.add_event(role, event, timestamp, session)
+    return tracker.overlap()
+
+
+def group_engine(intervals: dict) -> int:
+    return group_appearance({'lesson': intervals['lesson'],
+                             'pupils': {0: intervals['pupil']},
+                             'tutors': {0: intervals['tutor']}})['at_least_pupils'][1]
+
+
+def interval_set_engine(intervals: dict) -> int:
+    pupil = IntervalSet(intervals['pupil']).clip(*intervals['lesson']).merge()
+    tutor = IntervalSet(intervals['tutor']).clip(*intervals['lesson']).merge()
+    return pupil.overlap(tutor)
+
+
+def batch_engine(intervals: dict) -> int:
+    return int(appearance_many(*intervals_to_columns({0: intervals}))[1][0])
+
+
+ENGINES = {
+    'appearance': appearance,
+    'stream_lesson_overlaps': stream_engine,
+    'PresenceTracker': tracker_engine,
+    'group_appearance': group_engine,
+    'IntervalSet': interval_set_engine,
+}
+if np is not None:
+    ENGINES['appearance_many'] = batch_engine
+
+
+def fuzz(iterations: int = 1000, max_size: int = 20, seed: int = 0) -> dict:
+    """ Сравнивает все реализации с эталоном на случайных уроках.
+        Возвращает {реализация: список уроков, на которых результат разошелся с эталоном}
+    """
+
+    rng = random.Random(seed)
+    mismatches = {name: [] for name in ENGINES}
+    for _ in range(iterations):
+        intervals = generate_lesson(rng, rng.choice(list(GENERATORS)), rng.randint(1, max_size))
+        expected = reference_appearance(intervals)
+        for name, engine in ENGINES.items():
+            if engine(intervals) != expected:
+                mismatches[name].append(intervals)
+    return mismatches
+
+
+def measure(func, *args, repeats: int = 5) -> float:
+    """ Лучшее время одного вызова из repeats, в секундах """
+
+    best = float('inf')
+    for _ in range(repeats):
+        started = time.perf_counter()
+        func(*args)
+        best = min(best, time.perf_counter() - started)
+    return best
+
+
+def benchmark(sizes=(10, 100, 1000, 10000), repeats: int = 5, seed: int = 0) -> list:
+    """ Время appearance и каждой функции-помощника для каждого генератора и размера """
+
+    rng = random.Random(seed)
+    results = []
+    for kind in GENERATORS:
+        for size in sizes:
+            intervals = generate_lesson(rng, kind, size)
+            lesson_start, lesson_end = intervals['lesson']
+            pupil_in_lesson = get_person_intervals_in_lesson(intervals['pupil'], lesson_start, lesson_end)
+            tutor_in_lesson = get_person_intervals_in_lesson(intervals['tutor'], lesson_start, lesson_end)
+            pupil_merged = merge_person_intervals(pupil_in_lesson)
+            tutor_merged = merge_person_intervals(tutor_in_lesson)
+
+            timings = {
+                'appearance': measure(appearance, intervals, repeats=repeats),
+                'get_person_intervals_in_lesson': measure(get_person_intervals_in_lesson, intervals['pupil'],
+                                                          lesson_start, lesson_end, repeats=repeats),
+                'merge_person_intervals': measure(merge_person_intervals, pupil_in_lesson, repeats=repeats),
+                'calculate_total_time_in_lesson': measure(calculate_total_time_in_lesson, pupil_merged,
+                                                          tutor_merged, repeats=repeats),
+            }
+            for name, engine in ENGINES.items():
+                if name != 'appearance':
+                    timings[name] = measure(engine, intervals, repeats=repeats)
+
+            for name, seconds in timings.items():
+                results.append({'generator': kind, 'size': size, 'function': name, 'seconds': seconds})
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Бенчмарк и фаззинг appearance')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10, 100, 1000, 10000])
+    parser.add_argument('--repeats', type=int, default=5)
+    parser.add_argument('--iterations', type=int, default=1000, help='количество случайных уроков для фаззинга')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', default='bench.json')
+    args = parser.parse_args()
+
+    mismatches = fuzz(args.iterations, seed=args.seed)
+    report = {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'seed': args.seed,
+        'fuzz': {'iterations': args.iterations,
+                 'mismatches': {name: len(lessons) for name, lessons in mismatches.items()}},
+        'benchmark': benchmark(args.sizes, args.repeats, args.seed),
+    }
+
+    with open(args.output, 'w', encoding='utf-8') as output_file:
+        json.dump(report, output_file, ensure_ascii=False, indent=2)
+    print(f'Результаты записаны в файл {args.output}')
+
+    if any(mismatches.values()):
+        raise SystemExit('Найдены расхождения с эталоном: '
+                         + ', '.join(name for name, lessons in mismatches.items() if lessons))
+
+
+if __name__ == '__main__':
+    main()
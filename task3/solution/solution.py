@@ -1,3 +1,22 @@
+import csv
+import heapq
+import json
+import mmap
+import os
+import struct
+import sys
+import time
+
+from array import array
+from bisect import bisect_left, bisect_right, insort
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+
+try:
+    import numpy as np
+except ImportError:  # numpy нужен только для пакетной обработки (appearance_many)
+    np = None
+
 
 tests = [
     {'intervals': {'lesson': [1594663200, 1594666800],
@@ -44,58 +63,52 @@ def get_person_intervals_in_lesson(person_intervals: list, lesson_start: int, le
 
 def merge_person_intervals(intervals: list) -> list:
     """ Слияние интервалов ученика/учителя, чтобы избежать перекрытия и двойного подсчета секунд
-        Проходим по парам (вход, выход), если есть пересечения интервалов, то объединяем в 1
+        Пары (вход, выход) сортируются один раз, после чего за один проход каждая пара либо продлевает
+        последний объединенный интервал (если пересекается с ним), либо начинает новый.
+        Сортировка уже упорядоченных данных выполняется за линейное время
     """
 
-    intervals_pairs = [(intervals[index_elem], intervals[index_elem + 1]) for index_elem in range(0, len(intervals), 2)]
-    intervals_pairs = sorted(intervals_pairs)
-    merged_intervals = []
-
-    for current_interval in intervals_pairs:
-        merged = False
-
-        # проход по уже соединенным интервалом с проверкой, чтобы точно все интервалы объеденились при пересечении
-        for index in range(len(merged_intervals)):
-            merged_interval = merged_intervals[index]
-
-            # Проверка на пересечение интервалов
-            if not (current_interval[1] < merged_interval[0] or current_interval[0] > merged_interval[1]):
-                start = min(current_interval[0], merged_interval[0])
-                end = max(current_interval[1], merged_interval[1])
-                merged_intervals[index] = (start, end)
-                merged = True
-                break
+    intervals_pairs = sorted(zip(intervals[::2], intervals[1::2]))
+    merged_list = []
 
-        if not merged:
-            merged_intervals.append(current_interval)
+    for entry, exit_ in intervals_pairs:
+        # после сортировки пересечение возможно только с последним объединенным интервалом
+        if merged_list and entry <= merged_list[-1]:
+            if exit_ > merged_list[-1]:
+                merged_list[-1] = exit_
+        else:
+            merged_list.extend((entry, exit_))
 
-    merged_list = []
-    for interval in merged_intervals:
-        for endpoint in interval:
-            merged_list.append(endpoint)
     return merged_list
 
 
 def calculate_total_time_in_lesson(pupil_merged_intervals: list, tutor_merged_intervals: list) -> int:
     """ Вычисляет пересечение времени между учителем и учеником.
-        Данные уже чистые (включают в себя скомпилированные временные отрезки только во время урока)
+        Данные уже чистые (включают в себя скомпилированные временные отрезки только во время урока),
+        отсортированы и не пересекаются, поэтому достаточно одного прохода двумя указателями:
+        после сравнения текущих интервалов сдвигается тот, который закончился раньше
     """
 
     total_seconds = 0
-    for outer in range(0, len(pupil_merged_intervals), 2):
-        pupil_entry = pupil_merged_intervals[outer]
-        pupil_exit = pupil_merged_intervals[outer + 1]
+    pupil_index = 0
+    tutor_index = 0
+    pupil_len = len(pupil_merged_intervals)
+    tutor_len = len(tutor_merged_intervals)
+
+    while pupil_index < pupil_len and tutor_index < tutor_len:
+        pupil_exit = pupil_merged_intervals[pupil_index + 1]
+        tutor_exit = tutor_merged_intervals[tutor_index + 1]
 
-        for inner in range(0, len(tutor_merged_intervals), 2):
-            tutor_entry = tutor_merged_intervals[inner]
-            tutor_exit = tutor_merged_intervals[inner + 1]
+        entry_intersection = max(pupil_merged_intervals[pupil_index], tutor_merged_intervals[tutor_index])
+        exit_intersection = min(pupil_exit, tutor_exit)
 
-            entry_intersection = max(pupil_entry, tutor_entry)
-            exit_intersection = min(pupil_exit, tutor_exit)
+        if entry_intersection < exit_intersection:
+            total_seconds += exit_intersection - entry_intersection
 
-            if entry_intersection < exit_intersection:
-                overlap_time = exit_intersection - entry_intersection
-                total_seconds += overlap_time
+        if pupil_exit < tutor_exit:
+            pupil_index += 2
+        else:
+            tutor_index += 2
 
     return total_seconds
 
@@ -132,6 +145,863 @@ def appearance(intervals: dict[str, list[int]]) -> int:
     return total_seconds
 
 
+def intervals_to_columns(lessons: dict) -> tuple:
+    """ Переводит словарь {id урока: словарь интервалов как для appearance} в колоночный вид:
+        четыре списка одинаковой длины (id урока, роль, вход, выход), по строке на каждый интервал.
+        Роль урока - 'lesson', его строка содержит начало и конец урока
+    """
+
+    lesson_ids, roles, enters, exits = [], [], [], []
+    for lesson_id, intervals in lessons.items():
+        for role in ('lesson', 'pupil', 'tutor'):
+            role_intervals = intervals.get(role) or []
+            for index in range(0, len(role_intervals), 2):
+                lesson_ids.append(lesson_id)
+                roles.append(role)
+                enters.append(role_intervals[index])
+                exits.append(role_intervals[index + 1])
+    return lesson_ids, roles, enters, exits
+
+
+def appearance_many(lesson_ids, roles, enters, exits) -> tuple:
+    """ Пакетный аналог appearance для множества уроков сразу, без циклов Python по интервалам.
+        Принимает колонки одинаковой длины (см. intervals_to_columns) и возвращает два массива numpy:
+        уникальные id уроков (отсортированы) и время общего присутствия ученика и учителя на каждом.
+        Интервалы обрезаются по уроку по тем же правилам, что и get_person_intervals_in_lesson,
+        затем границы всех интервалов сортируются один раз, а количество присутствующих ученика и учителя
+        в каждый момент считается накопленной суммой. Время засчитывается, когда присутствуют оба
+    """
+
+    if np is None:
+        raise ImportError('Для appearance_many необходим numpy')
+
+    roles = np.asarray(roles)
+    enters = np.asarray(enters, dtype=np.int64)
+    exits = np.asarray(exits, dtype=np.int64)
+    unique_lesson_ids, lesson_codes = np.unique(np.asarray(lesson_ids), return_inverse=True)
+    lesson_codes = lesson_codes.reshape(-1)
+    lessons_count = len(unique_lesson_ids)
+
+    # границы урока для каждой строки; у уроков без строки 'lesson' интервал пустой
+    is_lesson = roles == 'lesson'
+    lesson_starts = np.zeros(lessons_count, dtype=np.int64)
+    lesson_ends = np.full(lessons_count, -1, dtype=np.int64)
+    lesson_starts[lesson_codes[is_lesson]] = enters[is_lesson]
+    lesson_ends[lesson_codes[is_lesson]] = exits[is_lesson]
+    row_starts = lesson_starts[lesson_codes]
+    row_ends = lesson_ends[lesson_codes]
+
+    # фильтрация и обрезка интервалов по времени урока (как в get_person_intervals_in_lesson)
+    is_pupil = roles == 'pupil'
+    is_tutor = roles == 'tutor'
+    entry_in_lesson = (row_starts <= enters) & (enters <= row_ends)
+    exit_in_lesson = (row_starts <= exits) & (exits <= row_ends)
+    full_lesson = (enters <= row_starts) & (exits >= row_ends)
+    clipped_enters = np.maximum(enters, row_starts)
+    clipped_exits = np.minimum(exits, row_ends)
+    keep = ((is_pupil | is_tutor) & (entry_in_lesson | exit_in_lesson | full_lesson)
+            & (clipped_enters < clipped_exits))
+
+    # события: +1 на входе, -1 на выходе, отдельно для ученика и учителя
+    kept_codes = lesson_codes[keep]
+    kept_is_pupil = is_pupil[keep]
+    event_codes = np.concatenate((kept_codes, kept_codes))
+    event_times = np.concatenate((clipped_enters[keep], clipped_exits[keep]))
+    event_deltas = np.concatenate((np.ones(len(kept_codes), dtype=np.int64),
+                                   np.full(len(kept_codes), -1, dtype=np.int64)))
+    event_is_pupil = np.concatenate((kept_is_pupil, kept_is_pupil))
+
+    order = np.lexsort((event_times, event_codes))
+    event_codes = event_codes[order]
+    event_times = event_times[order]
+    event_deltas = event_deltas[order]
+    event_is_pupil = event_is_pupil[order]
+
+    # сумма событий каждого урока равна 0, поэтому общая накопленная сумма не переносится между уроками
+    pupils_present = np.cumsum(np.where(event_is_pupil, event_deltas, 0))
+    tutors_present = np.cumsum(np.where(event_is_pupil, 0, event_deltas))
+
+    # отрезок между соседними событиями засчитывается, если после первого из них присутствуют оба
+    both_present = (pupils_present[:-1] > 0) & (tutors_present[:-1] > 0)
+    segment_seconds = np.where(both_present, event_times[1:] - event_times[:-1], 0)
+
+    totals = np.zeros(lessons_count, dtype=np.int64)
+    np.add.at(totals, event_codes[:-1], segment_seconds)
+    return unique_lesson_ids, totals
+
+
+def read_events_jsonl(lines):
+    """ Генератор событий из JSONL: по объекту на строку с ключами lesson, role, event, timestamp.
+        event - 'enter' или 'exit', role - 'lesson', 'pupil' или 'tutor'. Пустые строки пропускаются
+    """
+
+    for line in lines:
+        line = line.strip()
+        if not line:
+            continue
+        record = json.loads(line)
+        yield record['lesson'], record['role'], record['event'], int(record['timestamp'])
+
+
+def read_events_csv(lines):
+    """ Генератор событий из CSV с заголовком lesson,role,event,timestamp """
+
+    for record in csv.DictReader(lines):
+        yield record['lesson'], record['role'], record['event'], int(record['timestamp'])
+
+
+def stream_lesson_overlaps(events, closed_lessons_limit: int = 10000, unstarted_lesson_seconds: int = 86400):
+    """ Потоковый подсчет времени общего присутствия ученика и учителя по упорядоченному по времени
+        журналу событий (lesson, role, event, timestamp). Пара (id урока, секунды) выдается,
+        как только приходит событие окончания урока (role='lesson', event='exit').
+
+        Для каждого открытого урока хранится только счетчик присутствующих учеников и учителей
+        и время предыдущего события, поэтому память зависит от числа открытых уроков, а не от размера журнала.
+        Время засчитывается только между началом и концом урока - это то же обрезание интервалов,
+        что и в get_person_intervals_in_lesson.
+        События уже закрытых уроков (например, выход ученика после конца урока) отбрасываются,
+        для этого помнятся последние closed_lessons_limit закрытых уроков. Опоздавшие события уроков,
+        вытесненных из этого списка, не должны копить состояние: выход участника без открытого урока
+        отбрасывается сразу, а урок, для которого нет события начала и нет событий дольше
+        unstarted_lesson_seconds, забывается.
+        Уроки, для которых не пришло окончание, в результат не попадают
+    """
+
+    open_lessons = {}
+    # не начавшиеся уроки в порядке их последнего события: id -> время последнего события
+    unstarted_lessons = OrderedDict()
+    closed_lessons = OrderedDict()
+
+    for lesson_id, role, event, timestamp in events:
+        if lesson_id in closed_lessons:
+            continue
+
+        while unstarted_lessons:
+            stale_lesson_id, last_timestamp = next(iter(unstarted_lessons.items()))
+            if timestamp - last_timestamp <= unstarted_lesson_seconds:
+                break
+            del unstarted_lessons[stale_lesson_id]
+            del open_lessons[stale_lesson_id]
+
+        state = open_lessons.get(lesson_id)
+        if state is None:
+            if role != 'lesson' and event == 'exit':
+                # в упорядоченном журнале вход был бы раньше выхода - это событие уже закрытого урока
+                continue
+            # [начался ли урок, учеников, учителей, время предыдущего события, накопленные секунды]
+            state = open_lessons[lesson_id] = [False, 0, 0, timestamp, 0]
+
+        # отрезок от предыдущего события засчитывается, если урок идет и присутствуют оба
+        if state[0] and state[1] > 0 and state[2] > 0:
+            state[4] += timestamp - state[3]
+        state[3] = timestamp
+
+        delta = 1 if event == 'enter' else -1
+        if role == 'lesson':
+            unstarted_lessons.pop(lesson_id, None)
+            if event == 'enter':
+                state[0] = True
+                continue
+            del open_lessons[lesson_id]
+            closed_lessons[lesson_id] = None
+            if len(closed_lessons) > closed_lessons_limit:
+                closed_lessons.popitem(last=False)
+            yield lesson_id, state[4]
+            continue
+
+        if role == 'pupil':
+            state[1] += delta
+        elif role == 'tutor':
+            state[2] += delta
+        if not state[0]:
+            unstarted_lessons[lesson_id] = timestamp
+            unstarted_lessons.move_to_end(lesson_id)
+
+
+def stream_lesson_overlaps_from_file(path: str):
+    """ Читает журнал событий из файла .jsonl или .csv и выдает пары (id урока, секунды)
+        по мере закрытия уроков
+    """
+
+    reader = read_events_csv if path.endswith('.csv') else read_events_jsonl
+    with open(path, newline='', encoding='utf-8') as events_file:
+        yield from stream_lesson_overlaps(reader(events_file))
+
+
+def _person_events(person_id, role: str, merged_intervals: list):
+    """ Поток событий (время, изменение, роль, участник) по объединенным интервалам участника """
+
+    for index in range(0, len(merged_intervals), 2):
+        yield merged_intervals[index], 1, role, person_id
+        yield merged_intervals[index + 1], -1, role, person_id
+
+
+def group_appearance(intervals: dict) -> dict:
+    """ Совместное присутствие на групповом уроке за один проход.
+        На вход словарь: lesson - начало и конец урока, pupils и tutors - словари {id участника: интервалы}
+        (интервалы в том же формате, что и в appearance).
+        Возвращает словарь:
+            pupils - {id ученика: время присутствия вместе хотя бы с одним учителем}
+            tutors - {id учителя: время присутствия вместе хотя бы с одним учеником}
+            at_least_pupils - {k: время, когда присутствует хотя бы один учитель и не меньше k учеников}, k от 1 до N
+
+        Интервалы каждого участника обрезаются и объединяются, после чего уже отсортированные потоки
+        границ всех участников сливаются через кучу (heapq.merge). Во время прохода копится время,
+        когда есть хотя бы один учитель/ученик, поэтому вклад участника считается по границам его интервалов
+        без перебора присутствующих на каждом отрезке
+    """
+
+    lesson_start, lesson_end = intervals.get('lesson')
+    participants = {'pupil': intervals.get('pupils') or {}, 'tutor': intervals.get('tutors') or {}}
+
+    streams = []
+    for role, people in participants.items():
+        for person_id, person_intervals in people.items():
+            person_intervals_in_lesson = get_person_intervals_in_lesson(person_intervals, lesson_start, lesson_end)
+            merged_intervals = merge_person_intervals(person_intervals_in_lesson)
+            streams.append(_person_events(person_id, role, merged_intervals))
+
+    present = {'pupil': 0, 'tutor': 0}
+    # накопленное время, когда присутствует хотя бы один учитель / ученик
+    covered_seconds = {'pupil': 0, 'tutor': 0}
+    result_seconds = {role: {person_id: 0 for person_id in people} for role, people in participants.items()}
+    seconds_by_pupils_count = [0] * (len(participants['pupil']) + 1)
+    previous_time = lesson_start
+
+    for timestamp, delta, role, person_id in heapq.merge(*streams, key=lambda event: (event[0], event[1])):
+        segment = timestamp - previous_time
+        if segment:
+            if present['tutor']:
+                covered_seconds['tutor'] += segment
+                seconds_by_pupils_count[present['pupil']] += segment
+            if present['pupil']:
+                covered_seconds['pupil'] += segment
+            previous_time = timestamp
+
+        # вклад участника - прирост времени присутствия другой роли между его входом и выходом
+        other_role = 'tutor' if role == 'pupil' else 'pupil'
+        result_seconds[role][person_id] -= delta * covered_seconds[other_role]
+        present[role] += delta
+
+    at_least_pupils = {}
+    seconds = 0
+    for pupils_count in range(len(seconds_by_pupils_count) - 1, 0, -1):
+        seconds += seconds_by_pupils_count[pupils_count]
+        at_least_pupils[pupils_count] = seconds
+
+    return {'pupils': result_seconds['pupil'],
+            'tutors': result_seconds['tutor'],
+            'at_least_pupils': dict(sorted(at_least_pupils.items()))}
+
+
+class IntervalSet:
+    """ Компактное хранение интервалов одного участника: границы лежат подряд в array('q')
+        (вход, выход, вход, выход...), как в списках appearance, но без отдельного объекта на каждое число.
+        clip и merge меняют набор на месте и возвращают его же, поэтому их можно вызывать цепочкой
+        без промежуточных копий
+    """
+
+    __slots__ = ('_bounds',)
+
+    def __init__(self, bounds=()):
+        self._bounds = array('q', bounds)
+        if len(self._bounds) % 2:
+            raise ValueError('Количество границ интервалов должно быть четным')
+
+    @classmethod
+    def from_array(cls, bounds: array) -> 'IntervalSet':
+        """ Создает набор поверх готового array('q') без копирования """
+
+        if bounds.typecode != 'q' or len(bounds) % 2:
+            raise ValueError('Ожидается array(\'q\') с четным количеством границ')
+        interval_set = cls.__new__(cls)
+        interval_set._bounds = bounds
+        return interval_set
+
+    @property
+    def bounds(self) -> memoryview:
+        """ Границы интервалов без копирования """
+
+        return memoryview(self._bounds)
+
+    def __len__(self) -> int:
+        return len(self._bounds) // 2
+
+    def __iter__(self):
+        bounds = self._bounds
+        for index in range(0, len(bounds), 2):
+            yield bounds[index], bounds[index + 1]
+
+    def __eq__(self, other) -> bool:
+        if not isinstance(other, IntervalSet):
+            return NotImplemented
+        return self._bounds == other._bounds
+
+    def __repr__(self) -> str:
+        return f'IntervalSet({self._bounds.tolist()})'
+
+    def tolist(self) -> list:
+        """ Границы в формате списков appearance """
+
+        return self._bounds.tolist()
+
+    def clip(self, lesson_start: int, lesson_end: int) -> 'IntervalSet':
+        """ Оставляет и обрезает интервалы, попадающие на урок (правила get_person_intervals_in_lesson) """
+
+        bounds = self._bounds
+        write_index = 0
+        for index in range(0, len(bounds), 2):
+            person_entry = bounds[index]
+            person_exit = bounds[index + 1]
+
+            entry_in_lesson = lesson_start <= person_entry <= lesson_end
+            exit_in_lesson = lesson_start <= person_exit <= lesson_end
+            full_lesson = person_entry <= lesson_start and person_exit >= lesson_end
+
+            if entry_in_lesson or exit_in_lesson or full_lesson:
+                bounds[write_index] = max(person_entry, lesson_start)
+                bounds[write_index + 1] = min(person_exit, lesson_end)
+                write_index += 2
+
+        del bounds[write_index:]
+        return self
+
+    def merge(self) -> 'IntervalSet':
+        """ Объединяет пересекающиеся интервалы на месте (как merge_person_intervals).
+            Уже отсортированные данные не копируются
+        """
+
+        bounds = self._bounds
+        if any(bounds[index] < bounds[index - 2] for index in range(2, len(bounds), 2)):
+            for index, (entry, exit_) in enumerate(sorted(zip(bounds[::2], bounds[1::2]))):
+                bounds[2 * index] = entry
+                bounds[2 * index + 1] = exit_
+
+        write_index = 0
+        for index in range(0, len(bounds), 2):
+            entry = bounds[index]
+            exit_ = bounds[index + 1]
+            if write_index and entry <= bounds[write_index - 1]:
+                if exit_ > bounds[write_index - 1]:
+                    bounds[write_index - 1] = exit_
+            else:
+                bounds[write_index] = entry
+                bounds[write_index + 1] = exit_
+                write_index += 2
+
+        del bounds[write_index:]
+        return self
+
+    def intersect(self, other: 'IntervalSet') -> 'IntervalSet':
+        """ Пересечение двух объединенных наборов (новый набор) """
+
+        first, second = self._bounds, other._bounds
+        result = array('q')
+        first_index = 0
+        second_index = 0
+        while first_index < len(first) and second_index < len(second):
+            entry = max(first[first_index], second[second_index])
+            exit_ = min(first[first_index + 1], second[second_index + 1])
+            if entry < exit_:
+                result.append(entry)
+                result.append(exit_)
+            if first[first_index + 1] < second[second_index + 1]:
+                first_index += 2
+            else:
+                second_index += 2
+        return IntervalSet.from_array(result)
+
+    def measure(self) -> int:
+        """ Суммарная длина интервалов объединенного набора в секундах """
+
+        bounds = self._bounds
+        return sum(bounds[1::2]) - sum(bounds[::2])
+
+    def overlap(self, other: 'IntervalSet') -> int:
+        """ Длина пересечения двух объединенных наборов без построения самого пересечения """
+
+        return calculate_total_time_in_lesson(self._bounds, other._bounds)
+
+
+INTERVAL_STORE_MAGIC = b'TSK3'
+INTERVAL_STORE_VERSION = 1
+# магия, версия, количество уроков
+INTERVAL_STORE_HEADER = struct.Struct('<4sIq')
+
+
+def write_interval_store(path: str, lessons: dict) -> None:
+    """ Записывает уроки {целочисленный id урока: интервалы как для appearance} в бинарный файл.
+        Интервалы ученика и учителя сохраняются уже обрезанными по уроку и объединенными,
+        поэтому при чтении остается только посчитать пересечение.
+
+        Формат (все числа little-endian, как и заголовок; после заголовка - int64):
+            заголовок - INTERVAL_STORE_HEADER
+            ids - отсортированные id уроков
+            lessons - начало и конец каждого урока
+            offsets - 2 * N + 1 смещений в data: начало интервалов ученика, учителя, следующего урока
+            data - границы интервалов подряд
+    """
+
+    lesson_ids = array('q', sorted(lessons))
+    lesson_bounds = array('q')
+    offsets = array('q', [0])
+    data = array('q')
+
+    for lesson_id in lesson_ids:
+        intervals = lessons[lesson_id]
+        lesson_start, lesson_end = intervals.get('lesson')
+        lesson_bounds.extend((lesson_start, lesson_end))
+        for role in ('pupil', 'tutor'):
+            person_intervals = get_person_intervals_in_lesson(intervals.get(role) or [], lesson_start, lesson_end)
+            data.extend(merge_person_intervals(person_intervals))
+            offsets.append(len(data))
+
+    with open(path, 'wb') as store_file:
+        store_file.write(INTERVAL_STORE_HEADER.pack(INTERVAL_STORE_MAGIC, INTERVAL_STORE_VERSION, len(lesson_ids)))
+        for section in (lesson_ids, lesson_bounds, offsets, data):
+            if sys.byteorder != 'little':
+                section.byteswap()
+            section.tofile(store_file)
+
+
+class IntervalStore:
+    """ Чтение файла write_interval_store через mmap без копирования и разбора.
+        Пересечение считается прямо по memoryview секций, поэтому запрос одного урока или диапазона уроков
+        не читает остальной файл. Наружу отдаются копии (array('q')), а не представления mmap,
+        иначе close() не смог бы закрыть mmap, пока вызывающий код держит такое представление.
+        На big-endian платформах секции один раз копируются с перестановкой байт
+    """
+
+    def __init__(self, path: str):
+        with open(path, 'rb') as store_file:
+            self._mmap = mmap.mmap(store_file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, version, lessons_count = INTERVAL_STORE_HEADER.unpack_from(self._mmap)
+        if magic != INTERVAL_STORE_MAGIC or version != INTERVAL_STORE_VERSION:
+            self._mmap.close()
+            raise ValueError(f'Файл {path} не является хранилищем интервалов версии {INTERVAL_STORE_VERSION}')
+
+        self._view = memoryview(self._mmap)[INTERVAL_STORE_HEADER.size:].cast('q')
+        if sys.byteorder != 'little':
+            sections = array('q', self._view)
+            sections.byteswap()
+            self._view.release()
+            self._view = memoryview(sections)
+        self._lesson_ids = self._view[:lessons_count]
+        self._lesson_bounds = self._view[lessons_count:3 * lessons_count]
+        self._offsets = self._view[3 * lessons_count:5 * lessons_count + 1]
+        self._data = self._view[5 * lessons_count + 1:]
+
+    def __enter__(self) -> 'IntervalStore':
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def close(self) -> None:
+        """ Освобождает представления и закрывает mmap """
+
+        for view in (self._lesson_ids, self._lesson_bounds, self._offsets, self._data, self._view):
+            view.release()
+        self._mmap.close()
+
+    def __len__(self) -> int:
+        return len(self._lesson_ids)
+
+    def __contains__(self, lesson_id: int) -> bool:
+        index = bisect_left(self._lesson_ids, lesson_id)
+        return index < len(self._lesson_ids) and self._lesson_ids[index] == lesson_id
+
+    @property
+    def lesson_ids(self) -> array:
+        """ Копия отсортированных id уроков """
+
+        return array('q', self._lesson_ids)
+
+    def _index(self, lesson_id: int) -> int:
+        index = bisect_left(self._lesson_ids, lesson_id)
+        if index == len(self._lesson_ids) or self._lesson_ids[index] != lesson_id:
+            raise KeyError(lesson_id)
+        return index
+
+    def lesson(self, lesson_id: int) -> tuple:
+        """ Начало и конец урока """
+
+        index = self._index(lesson_id)
+        return self._lesson_bounds[2 * index], self._lesson_bounds[2 * index + 1]
+
+    def _views_at(self, index: int) -> tuple:
+        """ Представления интервалов ученика и учителя урока; живут только внутри вызова """
+
+        offsets = self._offsets
+        pupil_start, tutor_start, lesson_end = offsets[2 * index], offsets[2 * index + 1], offsets[2 * index + 2]
+        return self._data[pupil_start:tutor_start], self._data[tutor_start:lesson_end]
+
+    def intervals_at(self, index: int) -> tuple:
+        """ Объединенные интервалы ученика и учителя урока по его позиции в файле (копии array('q')) """
+
+        return tuple(array('q', view) for view in self._views_at(index))
+
+    def intervals(self, lesson_id: int) -> tuple:
+        """ Объединенные интервалы ученика и учителя урока (копии array('q')) """
+
+        return self.intervals_at(self._index(lesson_id))
+
+    def appearance_at(self, index: int) -> int:
+        """ Время общего присутствия на уроке по его позиции в файле, без копирования интервалов """
+
+        pupil, tutor = self._views_at(index)
+        with pupil, tutor:
+            return calculate_total_time_in_lesson(pupil, tutor)
+
+    def appearance(self, lesson_id: int) -> int:
+        """ Время общего присутствия ученика и учителя на уроке """
+
+        return self.appearance_at(self._index(lesson_id))
+
+    def appearance_range(self, first_lesson_id: int = None, last_lesson_id: int = None):
+        """ Генератор (id урока, секунды) для уроков с id от first_lesson_id до last_lesson_id включительно """
+
+        first = 0 if first_lesson_id is None else bisect_left(self._lesson_ids, first_lesson_id)
+        last = len(self._lesson_ids) if last_lesson_id is None else bisect_right(self._lesson_ids, last_lesson_id)
+        for index in range(first, last):
+            yield self._lesson_ids[index], self.appearance_at(index)
+
+
+def _appearance_chunk(path: str, first: int, last: int) -> array:
+    """ Задача для процесса: пересечения уроков с позициями [first, last) из хранилища.
+        Процесс сам открывает файл через mmap, а обратно передается только компактный array('q')
+    """
+
+    with IntervalStore(path) as store:
+        return array('q', (store.appearance_at(index) for index in range(first, last)))
+
+
+def parallel_appearance(path: str, workers: int = None, chunk_size: int = 10000) -> tuple:
+    """ Параллельный подсчет пересечений всех уроков хранилища write_interval_store на нескольких ядрах.
+        Уроки делятся на куски по chunk_size, куски обрабатываются в ProcessPoolExecutor,
+        в процессы передаются только путь к файлу и диапазон позиций.
+        Результаты собираются в порядке кусков, поэтому не зависят от порядка завершения задач.
+
+        Возвращает (id уроков, секунды, статистика), где id и секунды - array('q') в порядке файла,
+        статистика - словарь с количеством уроков, процессов, временем работы и уроками в секунду
+    """
+
+    workers = workers or os.cpu_count() or 1
+    started = time.perf_counter()
+
+    with IntervalStore(path) as store:
+        lesson_ids = store.lesson_ids
+    lessons_count = len(lesson_ids)
+    chunks = [(first, min(first + chunk_size, lessons_count)) for first in range(0, lessons_count, chunk_size)]
+
+    totals = array('q')
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        for chunk_totals in executor.map(_appearance_chunk,
+                                         [path] * len(chunks),
+                                         [first for first, _ in chunks],
+                                         [last for _, last in chunks]):
+            totals.extend(chunk_totals)
+
+    elapsed = time.perf_counter() - started
+    stats = {'lessons': lessons_count,
+             'workers': workers,
+             'chunks': len(chunks),
+             'seconds': elapsed,
+             'lessons_per_second': lessons_count / elapsed if elapsed else 0.0}
+    return lesson_ids, totals, stats
+
+
+class PresenceIndex:
+    """ Индекс присутствия на уроке: отсортированные границы интервалов всех участников и количество
+        присутствующих на каждом отрезке между соседними границами (участник находится на уроке
+        в момент t, если вход <= t < выход). Строится один раз по объединенным интервалам
+        (merge_person_intervals), после чего запрос на момент времени выполняется за O(log n),
+        а гистограммы по корзинам считаются векторно через numpy по накопленной площади присутствия
+    """
+
+    def __init__(self, merged_intervals_list, lesson_start: int = None, lesson_end: int = None):
+        self.lesson_start = lesson_start
+        self.lesson_end = lesson_end
+
+        deltas = {}
+        for merged_intervals in merged_intervals_list:
+            for index in range(0, len(merged_intervals), 2):
+                deltas[merged_intervals[index]] = deltas.get(merged_intervals[index], 0) + 1
+                deltas[merged_intervals[index + 1]] = deltas.get(merged_intervals[index + 1], 0) - 1
+
+        self.times = array('q')
+        self.counts = array('q')  # присутствующих на отрезке [times[i], times[i + 1])
+        self._areas = array('q')  # участнико-секунд до times[i]
+        present = 0
+        area = 0
+        for boundary in sorted(deltas):
+            if self.times:
+                area += present * (boundary - self.times[-1])
+            present += deltas[boundary]
+            self.times.append(boundary)
+            self.counts.append(present)
+            self._areas.append(area)
+
+    @classmethod
+    def from_lesson(cls, intervals: dict) -> 'PresenceIndex':
+        """ Индекс по словарю урока: как для appearance (pupil, tutor) или group_appearance (pupils, tutors) """
+
+        lesson_start, lesson_end = intervals.get('lesson')
+        people = [intervals.get('pupil'), intervals.get('tutor')]
+        for role in ('pupils', 'tutors'):
+            people.extend((intervals.get(role) or {}).values())
+
+        merged_intervals_list = [
+            merge_person_intervals(get_person_intervals_in_lesson(person_intervals, lesson_start, lesson_end))
+            for person_intervals in people if person_intervals
+        ]
+        return cls(merged_intervals_list, lesson_start, lesson_end)
+
+    def count_at(self, timestamp: int) -> int:
+        """ Количество присутствующих в момент timestamp """
+
+        index = bisect_right(self.times, timestamp) - 1
+        return self.counts[index] if index >= 0 else 0
+
+    def counts_at(self, timestamps):
+        """ Векторный вариант count_at для массива моментов времени """
+
+        if np is None:
+            raise ImportError('Для counts_at необходим numpy')
+
+        counts = np.concatenate(([0], np.frombuffer(self.counts, dtype=np.int64)))
+        return counts[np.searchsorted(np.frombuffer(self.times, dtype=np.int64), timestamps, side='right')]
+
+    def histogram(self, bucket_seconds: int = 60, start: int = None, end: int = None) -> tuple:
+        """ Участнико-секунды присутствия в каждой корзине длиной bucket_seconds от start до end
+            (по умолчанию - границы урока или крайние границы интервалов).
+            Возвращает массивы numpy: начала корзин и секунды присутствия; среднее количество
+            присутствующих в корзине - секунды, деленные на ее длину
+        """
+
+        if np is None:
+            raise ImportError('Для histogram необходим numpy')
+
+        if start is None:
+            start = self.lesson_start if self.lesson_start is not None else (self.times[0] if self.times else 0)
+        if end is None:
+            end = self.lesson_end if self.lesson_end is not None else (self.times[-1] if self.times else start)
+
+        edges = np.append(np.arange(start, end, bucket_seconds, dtype=np.int64), np.int64(end))
+        if not self.times:
+            return edges[:-1], np.zeros(len(edges) - 1, dtype=np.int64)
+
+        times = np.frombuffer(self.times, dtype=np.int64)
+        counts = np.frombuffer(self.counts, dtype=np.int64)
+        areas = np.frombuffer(self._areas, dtype=np.int64)
+
+        # площадь до каждой границы корзины: площадь до последней границы интервалов + остаток отрезка
+        indexes = np.searchsorted(times, edges, side='right') - 1
+        safe_indexes = np.maximum(indexes, 0)
+        edge_areas = np.where(indexes >= 0,
+                              areas[safe_indexes] + counts[safe_indexes] * (edges - times[safe_indexes]),
+                              0)
+        return edges[:-1], np.diff(edge_areas)
+
+
+class PresenceTracker:
+    """ Онлайн-подсчет времени общего присутствия ученика и учителя на идущем уроке.
+        События входа/выхода подаются по одному (enter/exit/add_event), overlap() возвращает секунды
+        общего присутствия на данный момент.
+
+        Закрытые сессии каждой роли хранятся объединенными (отсортированные непересекающиеся интервалы,
+        обрезанные по уроку), открытые - списком времен входа. Накопленное значение поддерживается
+        до водяной отметки - максимального времени уже пришедших событий. Событие по порядку обрабатывается
+        за амортизированное O(log n). Опоздавшее событие (время меньше отметки, например, обрыв связи,
+        о котором узнали позже) пересчитывает только окно от своего времени до отметки
+
+        Если у роли одновременно открыто несколько сессий (несколько вкладок), выход можно привязать
+        к сессии через session, иначе закрывается самая ранняя открытая сессия, начавшаяся не позже выхода.
+        Выход, для которого еще нет входа (события пришли не по порядку), откладывается и закрывает сессию,
+        когда придет вход той же сессии не позже выхода. session должна быть хешируемой
+    """
+
+    ROLES = ('pupil', 'tutor')
+
+    def __init__(self, lesson_start: int, lesson_end: int):
+        self.lesson_start = lesson_start
+        self.lesson_end = lesson_end
+        self._closed = {role: ([], []) for role in self.ROLES}  # (начала, концы) объединенных интервалов
+        # открытые сессии: отсортированные (время входа, номер) всех сессий роли и отдельно по сессиям
+        self._open = {role: [] for role in self.ROLES}
+        self._open_by_session = {role: {} for role in self.ROLES}
+        # выходы, пришедшие раньше своего входа: сессия -> отсортированные (время выхода, номер)
+        self._pending_exits = {role: {} for role in self.ROLES}
+        self._sessions = {}  # номер открытой сессии -> сессия
+        self._next_number = 0
+        self._watermark = lesson_start
+        self._total_seconds = 0
+
+    def enter(self, role: str, timestamp: int, session=None) -> None:
+        """ Вход ученика/учителя на урок """
+
+        self._advance(timestamp)
+        late = timestamp < self._watermark
+        old_seconds = self._overlap_between(timestamp, self._watermark) if late else 0
+
+        exit_ = self._take_pending_exit(role, timestamp, session)
+        if exit_ is None:
+            number = self._new_number()
+            self._sessions[number] = session
+            insort(self._open[role], (timestamp, number))
+            insort(self._open_by_session[role].setdefault(session, []), (timestamp, number))
+        else:
+            self._add_closed(role, timestamp, exit_)
+
+        if late:
+            self._total_seconds += self._overlap_between(timestamp, self._watermark) - old_seconds
+
+    def exit(self, role: str, timestamp: int, session=None) -> None:
+        """ Выход ученика/учителя с урока. Если подходящей открытой сессии нет, выход ждет своего входа """
+
+        self._advance(timestamp)
+        late = timestamp < self._watermark
+        old_seconds = self._overlap_between(timestamp, self._watermark) if late else 0
+
+        entry = self._take_open_session(role, timestamp, session)
+        if entry is None:
+            insort(self._pending_exits[role].setdefault(session, []), (timestamp, self._new_number()))
+            return
+
+        # если выход не опоздал, присутствие до отметки не меняется, сессия только переходит в закрытые
+        self._add_closed(role, entry, timestamp)
+        if late:
+            self._total_seconds += self._overlap_between(timestamp, self._watermark) - old_seconds
+
+    @property
+    def pending_exits(self) -> int:
+        """ Количество выходов, для которых еще не пришел вход """
+
+        return sum(len(exits) for pending in self._pending_exits.values() for exits in pending.values())
+
+    def add_event(self, role: str, event: str, timestamp: int, session=None) -> None:
+        """ Событие в формате журнала: event - 'enter' или 'exit' """
+
+        if event == 'enter':
+            self.enter(role, timestamp, session)
+        else:
+            self.exit(role, timestamp, session)
+
+    def overlap(self, now: int = None) -> int:
+        """ Секунды общего присутствия на момент now (по умолчанию - на время последнего события) """
+
+        total_seconds = self._total_seconds
+        if now is not None and now > self._watermark and self._open['pupil'] and self._open['tutor']:
+            total_seconds += max(0, min(now, self.lesson_end) - max(self._watermark, self.lesson_start))
+        return total_seconds
+
+    def _advance(self, timestamp: int) -> None:
+        """ Сдвигает водяную отметку. После отметки закрытых сессий нет,
+            поэтому оба присутствуют, только если у обоих есть открытые сессии
+        """
+
+        if timestamp > self._watermark:
+            self._total_seconds = self.overlap(timestamp)
+            self._watermark = timestamp
+
+    def _new_number(self) -> int:
+        self._next_number += 1
+        return self._next_number
+
+    def _take_open_session(self, role: str, timestamp: int, session) -> int or None:
+        """ Убирает из открытых самую раннюю сессию (с нужным session), начавшуюся не позже timestamp.
+            Возвращает время ее входа или None
+        """
+
+        entries = self._open[role] if session is None else self._open_by_session[role].get(session)
+        if not entries or entries[0][0] > timestamp:
+            return None
+
+        entry, number = entries[0]
+        by_session = self._open_by_session[role]
+        session = self._sessions.pop(number)
+        for sorted_entries in (self._open[role], by_session[session]):
+            del sorted_entries[bisect_left(sorted_entries, (entry, number))]
+        if not by_session[session]:
+            del by_session[session]
+        return entry
+
+    def _take_pending_exit(self, role: str, timestamp: int, session) -> int or None:
+        """ Убирает из отложенных самый ранний выход не раньше входа timestamp: выход той же сессии
+            или выход без сессии. Возвращает время выхода или None
+        """
+
+        pending = self._pending_exits[role]
+        candidates = []
+        for key in {session, None}:
+            exits = pending.get(key)
+            index = bisect_left(exits, (timestamp, -1)) if exits else 0
+            if exits and index < len(exits):
+                candidates.append((exits[index], index, key))
+        if not candidates:
+            return None
+
+        (exit_, _), index, key = min(candidates, key=lambda candidate: candidate[0])
+        del pending[key][index]
+        if not pending[key]:
+            del pending[key]
+        return exit_
+
+    def _add_closed(self, role: str, entry: int, exit_: int) -> None:
+        """ Добавляет закрытую сессию, объединяя ее с пересекающимися интервалами """
+
+        entry = max(entry, self.lesson_start)
+        exit_ = min(exit_, self.lesson_end)
+        if entry >= exit_:
+            return
+
+        starts, ends = self._closed[role]
+        first = bisect_left(ends, entry)
+        last = bisect_right(starts, exit_)
+        if first < last:
+            entry = min(entry, starts[first])
+            exit_ = max(exit_, ends[last - 1])
+        starts[first:last] = [entry]
+        ends[first:last] = [exit_]
+
+    def _presence(self, role: str, window_start: int, window_end: int) -> list:
+        """ Объединенные интервалы присутствия роли внутри окна в формате merge_person_intervals.
+            Открытые сессии дают один интервал от самого раннего входа до конца окна
+        """
+
+        starts, ends = self._closed[role]
+        open_sessions = self._open[role]
+        open_start = None
+        if open_sessions:
+            open_start = max(open_sessions[0][0], window_start)
+
+        presence = []
+        index = bisect_right(ends, window_start)
+        while index < len(starts) and starts[index] < window_end:
+            entry = max(starts[index], window_start)
+            exit_ = min(ends[index], window_end)
+            if open_start is not None and exit_ >= open_start:
+                open_start = min(open_start, entry)
+                break
+            presence.extend((entry, exit_))
+            index += 1
+
+        if open_start is not None and open_start < window_end:
+            presence.extend((open_start, window_end))
+        return presence
+
+    def _overlap_between(self, window_start: int, window_end: int) -> int:
+        """ Время общего присутствия внутри окна (обрезанного по уроку) при текущем состоянии """
+
+        window_start = max(window_start, self.lesson_start)
+        window_end = min(window_end, self.lesson_end)
+        if window_start >= window_end:
+            return 0
+        return calculate_total_time_in_lesson(self._presence('pupil', window_start, window_end),
+                                              self._presence('tutor', window_start, window_end))
+
+
 if __name__ == '__main__':
     for i, test in enumerate(tests):
         test_answer = appearance(test['intervals'])
@@ -1,6 +1,14 @@
+import io
+import json
+import os
+import tempfile
 import unittest
 
+from array import array
+from random import Random
+
 from solution import *
+from benchmark import fuzz
 
 
 class TestAppearance(unittest.TestCase):
@@ -116,6 +124,16 @@ class TestMergePersonIntervals(unittest.TestCase):
 
         self.assertEqual(result, true_merge_list)
 
+    def test_merge_unsorted_nested_intervals(self):
+        """ Несортированные интервалы, часть из которых вложена в другие """
+
+        test_data = [1594663500, 1594663600, 1594663200, 1594663450, 1594663250, 1594663300, 1594663550, 1594663700]
+
+        result = merge_person_intervals(test_data)
+        true_merge_list = [1594663200, 1594663450, 1594663500, 1594663700]
+
+        self.assertEqual(result, true_merge_list)
+
 
 class TestCalculateTotalTimeInLesson(unittest.TestCase):
 
@@ -145,3 +163,370 @@ class TestCalculateTotalTimeInLesson(unittest.TestCase):
 
         result = calculate_total_time_in_lesson(pupil_merged_intervals, tutor_merged_intervals)
         self.assertEqual(result, 0)
+
+    def test_many_intervals_inside_one(self):
+        """ Несколько интервалов учителя внутри одного интервала ученика и наоборот """
+
+        pupil_merged_intervals = [1594663200, 1594663300, 1594663310, 1594663320, 1594663330, 1594663340]
+        tutor_merged_intervals = [1594663210, 1594663220, 1594663230, 1594663240, 1594663295, 1594663345]
+
+        result = calculate_total_time_in_lesson(pupil_merged_intervals, tutor_merged_intervals)
+        self.assertEqual(result, 45)
+
+
+@unittest.skipIf(np is None, 'numpy не установлен')
+class TestAppearanceMany(unittest.TestCase):
+
+    def test_matches_appearance(self):
+        """ Результаты пакетной обработки совпадают с appearance для каждого урока """
+
+        lessons = {index: test_data['intervals'] for index, test_data in enumerate(tests)}
+        lessons['no_tutor'] = {'lesson': [1594663200, 1594666800],
+                               'pupil': [1594663202, 1594666800],
+                               'tutor': []}
+        lessons['not_in_lesson'] = {'lesson': [1594663200, 1594666800],
+                                    'pupil': [1594663179, 1594663199],
+                                    'tutor': [1594663200, 1594666800]}
+        lessons = {str(lesson_id): intervals for lesson_id, intervals in lessons.items()}
+
+        lesson_ids, totals = appearance_many(*intervals_to_columns(lessons))
+
+        self.assertEqual(sorted(lessons), list(lesson_ids))
+        for lesson_id, total in zip(lesson_ids, totals):
+            self.assertEqual(total, appearance(lessons[lesson_id]))
+
+    def test_empty_columns(self):
+        """ Пустые колонки - пустой результат """
+
+        lesson_ids, totals = appearance_many([], [], [], [])
+
+        self.assertEqual(len(lesson_ids), 0)
+        self.assertEqual(len(totals), 0)
+
+
+def intervals_to_events(lesson_id, intervals: dict) -> list:
+    """ Журнал событий урока, упорядоченный по времени """
+
+    events = []
+    for role in ('lesson', 'pupil', 'tutor'):
+        role_intervals = intervals.get(role) or []
+        for index in range(0, len(role_intervals), 2):
+            events.append((role_intervals[index], 1, lesson_id, role, 'enter'))
+            events.append((role_intervals[index + 1], 0, lesson_id, role, 'exit'))
+    return [(lesson_id, role, event, timestamp) for timestamp, _, lesson_id, role, event in sorted(events)]
+
+
+class TestStreamLessonOverlaps(unittest.TestCase):
+
+    def test_matches_appearance(self):
+        """ Результаты потоковой обработки перемешанных уроков совпадают с appearance """
+
+        events = []
+        for index, test_data in enumerate(tests):
+            events.extend(intervals_to_events(index, test_data['intervals']))
+        events.sort(key=lambda event: event[3])
+
+        result = dict(stream_lesson_overlaps(events))
+
+        self.assertEqual(result, {index: test_data['answer'] for index, test_data in enumerate(tests)})
+
+    def test_lesson_yielded_on_close(self):
+        """ Урок выдается сразу при закрытии, события после закрытия игнорируются """
+
+        events = [('a', 'lesson', 'enter', 100), ('a', 'pupil', 'enter', 90), ('a', 'tutor', 'enter', 110),
+                  ('a', 'lesson', 'exit', 200), ('a', 'pupil', 'exit', 210), ('a', 'tutor', 'exit', 220)]
+        events.sort(key=lambda event: event[3])
+
+        stream = stream_lesson_overlaps(iter(events))
+
+        self.assertEqual(next(stream), ('a', 90))
+        self.assertEqual(list(stream), [])
+
+    def test_late_events_after_eviction(self):
+        """ Опоздавшие события уроков, забытых в списке закрытых, не копят состояние """
+
+        events = []
+        for lesson_id in range(100):
+            start = lesson_id * 10
+            events.extend([(lesson_id, 'lesson', 'enter', start), (lesson_id, 'tutor', 'enter', start),
+                           (lesson_id, 'lesson', 'exit', start + 5)])
+        # выход учителя и повторный вход ученика уже после того, как урок вытеснен из закрытых
+        late_events = [(lesson_id, role, event, 1000 + lesson_id)
+                       for lesson_id in range(100) for role, event in (('tutor', 'exit'), ('pupil', 'enter'))]
+        events.extend(late_events)
+        events.append(('new', 'lesson', 'enter', 1000 + 100 + 60))
+        events.append(('new', 'lesson', 'exit', 1000 + 100 + 70))
+
+        stream = stream_lesson_overlaps(iter(events), closed_lessons_limit=10, unstarted_lesson_seconds=50)
+        result = [next(stream) for _ in range(101)]
+
+        self.assertEqual(result[-1], ('new', 0))
+        # генератор остановлен на последнем уроке - состояний забытых уроков не осталось
+        self.assertEqual(stream.gi_frame.f_locals['open_lessons'], {})
+        self.assertEqual(list(stream), [])
+
+    def test_read_events(self):
+        """ Чтение событий из JSONL и CSV """
+
+        jsonl = io.StringIO(json.dumps({'lesson': 'a', 'role': 'pupil', 'event': 'enter', 'timestamp': 5}) + '\n\n')
+        csv_file = io.StringIO('lesson,role,event,timestamp\na,pupil,enter,5\n')
+
+        self.assertEqual(list(read_events_jsonl(jsonl)), [('a', 'pupil', 'enter', 5)])
+        self.assertEqual(list(read_events_csv(csv_file)), [('a', 'pupil', 'enter', 5)])
+
+
+class TestGroupAppearance(unittest.TestCase):
+
+    def test_one_pupil_one_tutor(self):
+        """ Для одного ученика и одного учителя совпадает с appearance """
+
+        for test_data in tests:
+            intervals = test_data['intervals']
+            result = group_appearance({'lesson': intervals['lesson'],
+                                       'pupils': {'pupil': intervals['pupil']},
+                                       'tutors': {'tutor': intervals['tutor']}})
+
+            self.assertEqual(result['pupils'], {'pupil': test_data['answer']})
+            self.assertEqual(result['tutors'], {'tutor': test_data['answer']})
+            self.assertEqual(result['at_least_pupils'], {1: test_data['answer']})
+
+    def test_group_lesson(self):
+        """ Несколько учеников и учителей """
+
+        intervals = {'lesson': [100, 200],
+                     'pupils': {'a': [90, 150], 'b': [120, 180, 170, 210], 'c': [300, 400]},
+                     'tutors': {'x': [100, 130], 'y': [125, 160]}}
+
+        result = group_appearance(intervals)
+
+        self.assertEqual(result['pupils'], {'a': 50, 'b': 40, 'c': 0})
+        self.assertEqual(result['tutors'], {'x': 30, 'y': 35})
+        self.assertEqual(result['at_least_pupils'], {1: 60, 2: 30, 3: 0})
+
+
+class TestIntervalSet(unittest.TestCase):
+
+    def test_matches_appearance(self):
+        """ clip + merge + overlap дают тот же результат, что и appearance """
+
+        for test_data in tests:
+            lesson_start, lesson_end = test_data['intervals']['lesson']
+            pupil = IntervalSet(test_data['intervals']['pupil']).clip(lesson_start, lesson_end).merge()
+            tutor = IntervalSet(test_data['intervals']['tutor']).clip(lesson_start, lesson_end).merge()
+
+            self.assertEqual(pupil.overlap(tutor), test_data['answer'])
+            self.assertEqual(pupil.intersect(tutor).measure(), test_data['answer'])
+
+    def test_clip_and_merge_in_place(self):
+        """ clip и merge работают на месте и повторяют правила функций-помощников """
+
+        bounds = [1594663189, 1594663206, 1594663500, 1594663600, 1594663150, 1594663160, 1594663300, 1594663550]
+        interval_set = IntervalSet(bounds)
+
+        self.assertIs(interval_set.clip(1594663200, 1594666800), interval_set)
+        self.assertEqual(interval_set.tolist(), get_person_intervals_in_lesson(bounds, 1594663200, 1594666800))
+        self.assertIs(interval_set.merge(), interval_set)
+        self.assertEqual(interval_set.tolist(), [1594663200, 1594663206, 1594663300, 1594663600])
+        self.assertEqual(interval_set.measure(), 306)
+
+    def test_from_array_shares_buffer(self):
+        """ from_array не копирует данные """
+
+        bounds = array('q', [1, 5, 3, 8])
+        IntervalSet.from_array(bounds).merge()
+
+        self.assertEqual(bounds.tolist(), [1, 8])
+
+    def test_odd_bounds(self):
+        """ Нечетное количество границ """
+
+        with self.assertRaises(ValueError):
+            IntervalSet([1, 2, 3])
+
+
+class TestIntervalStore(unittest.TestCase):
+
+    def setUp(self):
+        self.lessons = {index * 10: test_data['intervals'] for index, test_data in enumerate(tests)}
+        self.lessons[5] = {'lesson': [1594663200, 1594666800], 'pupil': [], 'tutor': [1594663202, 1594666800]}
+        store_file, self.path = tempfile.mkstemp(suffix='.bin')
+        os.close(store_file)
+        write_interval_store(self.path, self.lessons)
+
+    def tearDown(self):
+        os.remove(self.path)
+
+    def test_matches_appearance(self):
+        """ Пересечение, посчитанное по файлу, совпадает с appearance """
+
+        with IntervalStore(self.path) as store:
+            self.assertEqual(len(store), 4)
+            for lesson_id, intervals in self.lessons.items():
+                self.assertEqual(store.appearance(lesson_id), appearance(intervals))
+                self.assertEqual(store.lesson(lesson_id), tuple(intervals['lesson']))
+
+    def test_range(self):
+        """ Запрос диапазона уроков """
+
+        with IntervalStore(self.path) as store:
+            result = list(store.appearance_range(5, 10))
+
+        self.assertEqual(result, [(5, 0), (10, tests[1]['answer'])])
+
+    def test_close_with_returned_intervals(self):
+        """ Интервалы и id уроков - копии: файл закрывается, пока они еще используются """
+
+        with IntervalStore(self.path) as store:
+            pupil, tutor = store.intervals(10)
+            lesson_ids = store.lesson_ids
+
+        self.assertEqual(calculate_total_time_in_lesson(pupil, tutor), tests[1]['answer'])
+        self.assertEqual(list(lesson_ids), sorted(self.lessons))
+
+    def test_missing_lesson(self):
+        """ Урока нет в файле """
+
+        with IntervalStore(self.path) as store:
+            self.assertNotIn(7, store)
+            with self.assertRaises(KeyError):
+                store.appearance(7)
+
+    def test_parallel_appearance(self):
+        """ Параллельный подсчет по кускам совпадает с appearance и сохраняет порядок уроков """
+
+        lesson_ids, totals, stats = parallel_appearance(self.path, workers=2, chunk_size=1)
+
+        self.assertEqual(list(lesson_ids), sorted(self.lessons))
+        self.assertEqual(list(totals), [appearance(self.lessons[lesson_id]) for lesson_id in lesson_ids])
+        self.assertEqual(stats['lessons'], 4)
+        self.assertEqual(stats['chunks'], 4)
+
+
+class TestPresenceIndex(unittest.TestCase):
+
+    def setUp(self):
+        self.index = PresenceIndex.from_lesson({'lesson': [100, 220],
+                                                'pupils': {'a': [90, 150], 'b': [120, 180, 170, 210]},
+                                                'tutors': {'x': [100, 130]}})
+
+    def test_count_at(self):
+        """ Количество присутствующих в момент времени """
+
+        self.assertEqual(self.index.count_at(99), 0)
+        self.assertEqual(self.index.count_at(100), 2)
+        self.assertEqual(self.index.count_at(125), 3)
+        self.assertEqual(self.index.count_at(130), 2)
+        self.assertEqual(self.index.count_at(150), 1)
+        self.assertEqual(self.index.count_at(210), 0)
+
+    @unittest.skipIf(np is None, 'numpy не установлен')
+    def test_counts_at(self):
+        """ Векторные запросы совпадают с count_at """
+
+        timestamps = list(range(90, 230, 5))
+
+        self.assertEqual(list(self.index.counts_at(timestamps)), [self.index.count_at(t) for t in timestamps])
+
+    @unittest.skipIf(np is None, 'numpy не установлен')
+    def test_histogram(self):
+        """ Участнико-секунды по корзинам, включая неполную последнюю корзину """
+
+        bucket_starts, seconds = self.index.histogram(bucket_seconds=50)
+
+        self.assertEqual(list(bucket_starts), [100, 150, 200])
+        self.assertEqual(list(seconds), [110, 50, 10])
+
+
+class TestPresenceTracker(unittest.TestCase):
+
+    def test_matches_appearance(self):
+        """ После всех событий значение совпадает с appearance """
+
+        for test_data in tests:
+            lesson_start, lesson_end = test_data['intervals']['lesson']
+            tracker = PresenceTracker(lesson_start, lesson_end)
+            for _, role, event, timestamp in intervals_to_events(None, test_data['intervals']):
+                if role != 'lesson':
+                    tracker.add_event(role, event, timestamp)
+
+            self.assertEqual(tracker.overlap(), test_data['answer'])
+
+    def test_running_overlap(self):
+        """ Значение на момент, пока оба еще на уроке """
+
+        tracker = PresenceTracker(100, 200)
+        tracker.enter('tutor', 90)
+        tracker.enter('pupil', 110)
+
+        self.assertEqual(tracker.overlap(), 0)
+        self.assertEqual(tracker.overlap(now=150), 40)
+        self.assertEqual(tracker.overlap(now=250), 90)
+
+    def test_late_exit(self):
+        """ Выход, пришедший после более поздних событий, пересчитывает уже учтенное время """
+
+        tracker = PresenceTracker(100, 200)
+        tracker.enter('tutor', 100)
+        tracker.enter('pupil', 110)
+        tracker.enter('pupil', 150, session='tab2')
+        tracker.exit('tutor', 160)
+        tracker.exit('pupil', 120)
+
+        self.assertEqual(tracker.overlap(), 20)
+
+    def test_exit_before_enter(self):
+        """ Выход, пришедший раньше своего входа, ждет вход и тогда закрывает сессию """
+
+        tracker = PresenceTracker(100, 200)
+        tracker.enter('tutor', 100)
+        tracker.exit('pupil', 150)
+
+        self.assertEqual(tracker.overlap(), 0)
+        self.assertEqual(tracker.pending_exits, 1)
+
+        tracker.enter('pupil', 110)
+        self.assertEqual(tracker.overlap(), 40)
+        self.assertEqual(tracker.pending_exits, 0)
+
+    def test_exit_before_enter_with_sessions(self):
+        """ Отложенный выход сессии закрывает только вход той же сессии """
+
+        tracker = PresenceTracker(100, 200)
+        tracker.enter('tutor', 100)
+        tracker.exit('pupil', 180, session='tab2')
+        tracker.enter('pupil', 170)
+        self.assertEqual(tracker.pending_exits, 1)
+
+        tracker.enter('pupil', 160, session='tab2')
+        self.assertEqual(tracker.pending_exits, 0)
+        self.assertEqual(tracker.overlap(), 20)
+        self.assertEqual(tracker.overlap(now=190), 30)
+
+    def test_shuffled_sessions(self):
+        """ События сессий в любом порядке дают тот же результат, что и appearance """
+
+        random = Random(0)
+        for test_data in tests:
+            events = []
+            for role in ('pupil', 'tutor'):
+                intervals = test_data['intervals'][role]
+                for session, (entry, exit_) in enumerate(zip(intervals[::2], intervals[1::2])):
+                    events.extend(((role, 'enter', entry, session), (role, 'exit', exit_, session)))
+            random.shuffle(events)
+
+            tracker = PresenceTracker(*test_data['intervals']['lesson'])
+            for role, event, timestamp, session in events:
+                tracker.add_event(role, event, timestamp, session)
+
+            self.assertEqual(tracker.overlap(), test_data['answer'])
+
+
+class TestDifferentialFuzz(unittest.TestCase):
+
+    def test_engines_match_reference(self):
+        """ Все реализации совпадают с посекундным эталоном на случайных уроках """
+
+        mismatches = fuzz(iterations=200)
+
+        for name, lessons in mismatches.items():
+            self.assertEqual(lessons, [], name)